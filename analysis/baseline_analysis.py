@@ -1,24 +1,7 @@
-import pandas as pd
+from detection_engine import flow_store, metrics
 
-# Load flow-level features (NORMAL traffic only)
-df = pd.read_csv("feature_engineering/outputs/flow_features.csv")
-
-print("========== BASIC DATASET INFO ==========")
-print("Dataset shape:", df.shape)
-
-print("\n========== COLUMN NAMES ==========")
-print(df.columns.tolist())
-
-print("\n========== DATA TYPES ==========")
-print(df.dtypes)
-
-print("\n========== MISSING VALUES ==========")
-print(df.isnull().sum())
-
-print("\n========== SAMPLE ROWS ==========")
-print(df.head())
-
-print("\n========== BASELINE STATISTICS ==========")
+INPUT_FILE = flow_store.intermediate_path("feature_engineering/outputs/flow_features.csv")
+OUTPUT_FILE = flow_store.intermediate_path("feature_engineering/outputs/flow_features_enriched.csv")
 
 numeric_cols = [
     "packet_count",
@@ -31,32 +14,81 @@ numeric_cols = [
     "dns_entropy"
 ]
 
-baseline_stats = df[numeric_cols].describe(percentiles=[0.90, 0.95, 0.99])
-print(baseline_stats)
 
-print("\n========== APPLYING ANOMALY RULES ==========")
+def print_profile(df):
+    print("========== BASIC DATASET INFO ==========")
+    print("Dataset shape:", df.shape)
+
+    print("\n========== COLUMN NAMES ==========")
+    print(df.columns.tolist())
+
+    print("\n========== DATA TYPES ==========")
+    print(df.dtypes)
+
+    print("\n========== MISSING VALUES ==========")
+    print(df.isnull().sum())
+
+    print("\n========== SAMPLE ROWS ==========")
+    print(df.head())
+
+    print("\n========== BASELINE STATISTICS ==========")
+
+    baseline_stats = df[numeric_cols].describe(percentiles=[0.90, 0.95, 0.99])
+    print(baseline_stats)
+
+
+def baseline_thresholds(df):
+    """Packet count, duration and DNS entropy thresholds of a flow table."""
+    return {
+        "packet_count": df["packet_count"].quantile(0.99),
+        "duration": df["duration"].quantile(0.99),
+        "dns_entropy": df["dns_entropy"].quantile(0.95),
+    }
+
+
+def enrich_flows(df, thresholds=None):
+    """
+    Add the baseline anomaly flags and suspicion score to a flow table.
+    Thresholds come from `df` itself unless fixed ones are given
+    (see baseline_thresholds()).
+    """
+    # Thresholds from baseline
+    if thresholds is None:
+        thresholds = baseline_thresholds(df)
+
+    df["flag_high_packet"] = df["packet_count"] > thresholds["packet_count"]
+    df["flag_long_duration"] = df["duration"] > thresholds["duration"]
+    df["flag_high_dns_entropy"] = df["dns_entropy"] > thresholds["dns_entropy"]
+    df["flag_deep_dns"] = df["dns_subdomain_depth"] >= 4
+
+    # Suspicion score
+    df["suspicion_score"] = (
+        df["flag_high_packet"].astype(int) +
+        df["flag_long_duration"].astype(int) +
+        df["flag_high_dns_entropy"].astype(int) +
+        df["flag_deep_dns"].astype(int)
+    )
+
+    metrics.inc("flows_processed_total", len(df), stage="baseline")
+    return df
+
+
+def main():
+    # Load flow-level features (NORMAL traffic only)
+    df = flow_store.read_flows(INPUT_FILE)
+
+    print_profile(df)
 
-# Thresholds from baseline
-PACKET_THRESHOLD = df["packet_count"].quantile(0.99)
-DURATION_THRESHOLD = df["duration"].quantile(0.99)
-DNS_ENTROPY_THRESHOLD = df["dns_entropy"].quantile(0.95)
+    print("\n========== APPLYING ANOMALY RULES ==========")
 
-df["flag_high_packet"] = df["packet_count"] > PACKET_THRESHOLD
-df["flag_long_duration"] = df["duration"] > DURATION_THRESHOLD
-df["flag_high_dns_entropy"] = df["dns_entropy"] > DNS_ENTROPY_THRESHOLD
-df["flag_deep_dns"] = df["dns_subdomain_depth"] >= 4
+    df = enrich_flows(df)
+    print(df["suspicion_score"].value_counts().sort_index())
 
-# Suspicion score
-df["suspicion_score"] = (
-    df["flag_high_packet"].astype(int) +
-    df["flag_long_duration"].astype(int) +
-    df["flag_high_dns_entropy"].astype(int) +
-    df["flag_deep_dns"].astype(int)
-)
+    flow_store.write_flows(df, OUTPUT_FILE)
 
-print(df["suspicion_score"].value_counts().sort_index())
+    print(f"\nEnriched dataset saved to: {OUTPUT_FILE}")
 
-output_path = "feature_engineering/outputs/flow_features_enriched.csv"
-df.to_csv(output_path, index=False)
 
-print(f"\nEnriched dataset saved to: {output_path}")
+if __name__ == "__main__":
+    with metrics.stage("baseline"):
+        main()
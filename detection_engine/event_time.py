@@ -0,0 +1,38 @@
+"""
+Event-time helpers.
+
+Flows carry first_seen / last_seen as epoch seconds from feature extraction,
+and alerts carry the flow's event_time. Every stage orders, windows and
+sessionizes on these floats; ISO strings are produced only when rendering
+output, and parsed only for alerts written before event time existed.
+"""
+
+from datetime import datetime, timezone
+
+
+def iso_to_epoch(ts):
+    """Parse an ISO-8601 timestamp; naive values are taken as UTC."""
+    parsed = datetime.fromisoformat(ts.replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def to_epoch(value):
+    """Epoch seconds from an epoch number or ISO string (None passes through)."""
+    if value is None or isinstance(value, (int, float)):
+        return value
+    return iso_to_epoch(value)
+
+
+def to_iso(epoch):
+    """Render epoch seconds as the UTC ISO form used in alert output."""
+    return datetime.fromtimestamp(epoch, tz=timezone.utc).replace(tzinfo=None).isoformat() + "Z"
+
+
+def alert_time(alert):
+    """Event time of an alert, falling back to its rendered timestamp."""
+    event_time = alert.get("event_time")
+    if event_time is not None:
+        return float(event_time)
+    return iso_to_epoch(alert["timestamp"])
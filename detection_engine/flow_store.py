@@ -0,0 +1,268 @@
+"""
+Typed, columnar storage for flow tables.
+
+Purpose:
+- Store the pipeline's intermediate flow tables (flow_features,
+  flow_features_enriched, iforest_results, flow_threat_scores,
+  flow_threat_labeled) as Parquet with an explicit schema instead of
+  untyped CSV that every stage re-parses and re-infers
+- Let each stage read only the columns it uses
+- Optionally partition a table by event hour, so a time range (or one new
+  hour of traffic) is read without touching the rest
+
+Schema: IPv4 addresses as uint32, ports as uint16, protocol and label
+columns as categoricals, behavioral features as float32. Event times and
+fused scores stay float64: epoch seconds need the precision and scores are
+compared against thresholds. Columns outside the schema are stored as they
+are. Readers get dotted-quad IP strings back, so stages see the same values
+as with CSV.
+
+Which format the stage scripts use is chosen once for every stage by
+SENTINELHUNT_INTERMEDIATE_FORMAT (csv, the default, or parquet); see
+intermediate_path(). Parquet needs the optional pyarrow package; selecting
+it without pyarrow installed fails as soon as a stage resolves its paths.
+"""
+
+import ipaddress
+import os
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+FORMAT_ENV = "SENTINELHUNT_INTERMEDIATE_FORMAT"
+FORMATS = ("csv", "parquet")
+
+PARTITION_COLUMN = "hour"
+TIME_COLUMN = "first_seen"
+
+IP_COLUMNS = ("src_ip", "dst_ip")
+
+FLOW_SCHEMA = {
+    # Identity
+    "src_port": "uint16",
+    "dst_port": "uint16",
+    "protocol": "category",
+
+    # Event time
+    "first_seen": "float64",
+    "last_seen": "float64",
+
+    # Counts
+    "packet_count": "uint32",
+    "total_bytes": "uint64",
+    "dns_query_length": "uint16",
+    "dns_subdomain_depth": "uint8",
+
+    # Behavioral features
+    "duration": "float32",
+    "avg_packet_size": "float32",
+    "min_iat": "float32",
+    "max_iat": "float32",
+    "mean_iat": "float32",
+    "std_iat": "float32",
+    "bytes_per_second": "float32",
+    "packets_per_second": "float32",
+    "avg_bytes_per_packet": "float32",
+    "dns_entropy": "float32",
+
+    # Baseline analysis
+    "flag_high_packet": "bool",
+    "flag_long_duration": "bool",
+    "flag_high_dns_entropy": "bool",
+    "flag_deep_dns": "bool",
+    "suspicion_score": "uint8",
+
+    # Scoring and labeling
+    "iforest_score": "float64",
+    "iforest_label": "int8",
+    "threat_score_band": "category",
+    "severity": "category",
+    "threat_label": "category",
+}
+
+
+# =========================
+# FORMAT SELECTION
+# =========================
+def intermediate_format(fmt=None):
+    fmt = (fmt or os.environ.get(FORMAT_ENV) or "csv").lower()
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown intermediate format {fmt!r} (choose from {', '.join(FORMATS)})")
+    if fmt == "parquet":
+        _require_pyarrow()
+    return fmt
+
+
+def intermediate_path(path, fmt=None):
+    """`path` (a .csv intermediate) with the suffix of the selected format."""
+    path = str(path)
+    if intermediate_format(fmt) == "parquet" and path.endswith(".csv"):
+        return path[:-len(".csv")] + ".parquet"
+    return path
+
+
+def is_parquet(path):
+    path = Path(path)
+    return path.suffix == ".parquet" or path.is_dir()
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        raise ImportError(f"Parquet intermediates ({FORMAT_ENV}=parquet) need pyarrow: pip3 install pyarrow") from None
+
+
+# =========================
+# TYPE CONVERSION
+# =========================
+def encode_ipv4(values):
+    """uint32 array for a column of dotted-quad strings (None if any value is not IPv4)."""
+    codes, uniques = pd.factorize(values)
+    try:
+        ints = np.array([int(ipaddress.IPv4Address(ip)) for ip in uniques], dtype=np.uint32)
+    except ValueError:
+        return None
+    if (codes < 0).any():
+        return None
+    return ints[codes]
+
+
+def decode_ipv4(values):
+    """Dotted-quad strings for a uint32 column; each distinct address is formatted once."""
+    uniques, inverse = np.unique(np.asarray(values, dtype=np.uint32), return_inverse=True)
+    strings = np.array([str(ipaddress.IPv4Address(int(ip))) for ip in uniques], dtype=object)
+    return strings[inverse]
+
+
+def apply_schema(df):
+    """Copy of `df` with FLOW_SCHEMA types and integer IPs, as stored on disk."""
+    columns = {}
+    for name in df.columns:
+        column = df[name]
+        dtype = FLOW_SCHEMA.get(name)
+        if name in IP_COLUMNS:
+            encoded = encode_ipv4(column)
+            # Non-IPv4 addresses (e.g. IPv6 from the collector) stay strings
+            columns[name] = encoded if encoded is not None else column.astype("category")
+        elif dtype is None:
+            columns[name] = column
+        elif dtype.startswith(("int", "uint", "bool")) and column.isna().any():
+            # Integers and booleans cannot hold missing values; keep the column as is
+            columns[name] = column
+        else:
+            columns[name] = column.astype(dtype)
+    return pd.DataFrame(columns, index=df.index)
+
+
+def _restore(df):
+    for name in IP_COLUMNS:
+        if name in df.columns and pd.api.types.is_integer_dtype(df[name]):
+            df[name] = decode_ipv4(df[name].to_numpy())
+    return df
+
+
+# =========================
+# READ / WRITE
+# =========================
+def write_flows(df, path, partition_by_hour=False):
+    """
+    Write a flow table; a .csv suffix writes CSV, anything else Parquet.
+    With partition_by_hour the Parquet output is a directory with one
+    hour=<epoch hour> partition per hour of first_seen. Partitions present
+    in `df` replace the stored ones; other hours are left alone.
+    """
+    path = Path(path)
+    if path.suffix == ".csv":
+        if partition_by_hour:
+            raise ValueError("Hourly partitioning needs the Parquet format")
+        df.to_csv(path, index=False)
+        return path
+
+    _require_pyarrow()
+    table = apply_schema(df).reset_index(drop=True)
+    if not partition_by_hour:
+        if path.is_dir():
+            shutil.rmtree(path)
+        table.to_parquet(path, engine="pyarrow", index=False, compression="zstd")
+        return path
+
+    if path.is_file():
+        path.unlink()
+    table[PARTITION_COLUMN] = hour_of(table[TIME_COLUMN])
+    table.to_parquet(
+        path, engine="pyarrow", index=False, compression="zstd",
+        partition_cols=[PARTITION_COLUMN], existing_data_behavior="delete_matching",
+        basename_template="part-{i}.parquet",
+    )
+    return path
+
+
+def read_flows(path, columns=None, start=None, end=None):
+    """
+    Read a flow table written by write_flows() (or any CSV), keeping only
+    `columns` when given. Partitioned tables come back in hour order; with
+    start/end (epoch seconds, end exclusive) only the hours overlapping the
+    range are opened and only rows whose first_seen falls inside it kept.
+    """
+    columns = None if columns is None else list(columns)
+    if not is_parquet(path):
+        if start is not None or end is not None:
+            raise ValueError("Time-range reads need a partitioned Parquet table")
+        return pd.read_csv(path, usecols=columns)[columns] if columns else pd.read_csv(path)
+
+    _require_pyarrow()
+    filters = _time_filters(path, start, end)
+    read_columns = columns
+    if columns is not None and filters and TIME_COLUMN not in columns:
+        read_columns = columns + [TIME_COLUMN]
+
+    df = pd.read_parquet(path, engine="pyarrow", columns=read_columns, filters=filters or None)
+    if PARTITION_COLUMN in df.columns and (columns is None or PARTITION_COLUMN not in columns):
+        df = df.drop(columns=PARTITION_COLUMN)
+    if columns is not None:
+        df = df[columns]
+    return _restore(df)
+
+
+def iter_flows(path, chunksize, columns=None):
+    """Yield a flow table in chunks of at most `chunksize` rows."""
+    columns = None if columns is None else list(columns)
+    if not is_parquet(path):
+        yield from pd.read_csv(path, chunksize=chunksize, usecols=columns)
+        return
+
+    _require_pyarrow()
+    import pyarrow.dataset as ds
+
+    dataset = ds.dataset(str(path), format="parquet", partitioning="hive")
+    names = [name for name in dataset.schema.names if name != PARTITION_COLUMN]
+    for batch in dataset.to_batches(columns=columns or names, batch_size=chunksize):
+        if batch.num_rows:
+            yield _restore(batch.to_pandas())
+
+
+def partitions(path):
+    """Epoch hours stored in a partitioned table, ascending."""
+    return sorted(int(p.name.split("=", 1)[1]) for p in Path(path).glob(f"{PARTITION_COLUMN}=*"))
+
+
+def hour_of(epoch):
+    """Epoch hour (hours since 1970-01-01 UTC) of epoch-second values."""
+    return np.floor_divide(np.asarray(epoch, dtype=np.float64), 3600).astype(np.int64)
+
+
+def _time_filters(path, start, end):
+    if start is None and end is None:
+        return []
+    if not Path(path).is_dir():
+        raise ValueError("Time-range reads need a partitioned Parquet table")
+
+    filters = []
+    if start is not None:
+        filters += [(PARTITION_COLUMN, ">=", int(hour_of(start))), (TIME_COLUMN, ">=", float(start))]
+    if end is not None:
+        filters += [(PARTITION_COLUMN, "<=", int(hour_of(end))), (TIME_COLUMN, "<", float(end))]
+    return filters
@@ -1,47 +1,147 @@
+import hashlib
 import json
-from collections import defaultdict
-from datetime import datetime
+import os
+import sqlite3
+import sys
+from detection_engine import metrics
+from detection_engine.event_time import alert_time, to_iso
 
 ALERTS_FILE = "feature_engineering/outputs/alerts.json"
+ALERTS_NDJSON_FILE = "feature_engineering/outputs/alerts.ndjson"
 OUTPUT_FILE = "feature_engineering/outputs/aggregated_alerts.json"
+STATE_FILE = "feature_engineering/outputs/aggregation_state.db"
 
+SEVERITY_ORDER = ["LOW", "MEDIUM", "HIGH", "CRITICAL"]
 
-def parse_time(ts):
-    return datetime.fromisoformat(ts.replace("Z", ""))
+# Bytes hashed at the start of an NDJSON input and just before the stored
+# offset to recognize a file that was rewritten rather than appended to
+FINGERPRINT_BYTES = 4096
 
+# Bound parameters per "key IN (...)" lookup (SQLite's default limit is 999)
+LOOKUP_CHUNK = 500
+
+
+def severity_rank(severity):
+    return SEVERITY_ORDER.index(severity) if severity in SEVERITY_ORDER else -1
+
+
+def alert_weight(alert):
+    """Number of raw alerts a record stands for (roll-ups carry their duplicates)."""
+    if alert.get("alert_type") == "rollup":
+        return alert.get("suppressed_count", 1)
+    return 1
+
+
+def alert_key(alert):
+    """
+    Content hash of an alert without its alert_id. Alert IDs restart at 1 on
+    every alert_generator run, but the same flows always produce the same
+    alert body, so a re-run is recognized as alerts already merged.
+    """
+    body = {key: value for key, value in alert.items() if key != "alert_id"}
+    return hashlib.blake2b(json.dumps(body, sort_keys=True).encode(), digest_size=16).hexdigest()
+
+
+def bucket_keys(alert):
+    src_ip = alert.get("src_ip", "unknown")
+    rules = alert.get("triggered_rules", [])
+
+    if not rules:
+        rules = ["NO_RULE"]
+
+    return [(src_ip, rule) for rule in rules]
 
-def aggregate_alerts():
-    with open(ALERTS_FILE, "r") as f:
-        alerts = json.load(f)
 
-    buckets = defaultdict(list)
+def accumulate(alerts):
+    """
+    Fold alerts into per-(src_ip, rule) running state in one pass.
+
+    Ordering uses the alert's numeric event time; count, score sum, max
+    severity and first/last seen are O(1) updates per alert.
+    """
+    buckets = {}
 
     for alert in alerts:
-        src_ip = alert.get("src_ip", "unknown")
-        rules = alert.get("triggered_rules", [])
+        epoch = alert_time(alert)
+        weight = alert_weight(alert)
+        rank = severity_rank(alert["severity"])
+        score = alert["final_threat_score"]
+
+        for key in bucket_keys(alert):
+            bucket = buckets.get(key)
+            if bucket is None:
+                buckets[key] = {
+                    "alert_count": weight,
+                    "score_sum": score * weight,
+                    "max_rank": rank,
+                    "first_ts": epoch,
+                    "last_ts": epoch,
+                }
+                continue
+
+            bucket["alert_count"] += weight
+            bucket["score_sum"] += score * weight
+            bucket["max_rank"] = max(bucket["max_rank"], rank)
+            bucket["first_ts"] = min(bucket["first_ts"], epoch)
+            bucket["last_ts"] = max(bucket["last_ts"], epoch)
+
+    return buckets
+
+
+def merge_buckets(buckets, other):
+    """
+    Fold the buckets of another accumulate() run into `buckets` in place,
+    as AggregationStore.merge() does in SQL; the result is the same as
+    accumulating both alert sets in one pass.
+    """
+    for key, bucket in other.items():
+        current = buckets.get(key)
+        if current is None:
+            buckets[key] = dict(bucket)
+            continue
+
+        current["alert_count"] += bucket["alert_count"]
+        current["score_sum"] += bucket["score_sum"]
+        current["max_rank"] = max(current["max_rank"], bucket["max_rank"])
+        current["first_ts"] = min(current["first_ts"], bucket["first_ts"])
+        current["last_ts"] = max(current["last_ts"], bucket["last_ts"])
 
-        if not rules:
-            rules = ["NO_RULE"]
+    return buckets
 
-        for rule in rules:
-            key = (src_ip, rule)
-            buckets[key].append(alert)
 
-    aggregated = []
+def to_incident(entity, rule, bucket):
+    return {
+        "entity": entity,
+        "rule": rule,
+        "alert_count": bucket["alert_count"],
+        "max_severity": SEVERITY_ORDER[bucket["max_rank"]] if bucket["max_rank"] >= 0 else "UNKNOWN",
+        "avg_score": round(bucket["score_sum"] / bucket["alert_count"], 3),
+        "first_seen": to_iso(bucket["first_ts"]),
+        "last_seen": to_iso(bucket["last_ts"]),
+        "first_seen_ts": bucket["first_ts"],
+        "last_seen_ts": bucket["last_ts"],
+    }
 
-    for (src_ip, rule), group in buckets.items():
-        severities = [a["severity"] for a in group]
-        scores = [a["final_threat_score"] for a in group]
 
-        aggregated.append({
-            "entity": src_ip,
-            "rule": rule,
-            "alert_count": len(group),
-            "max_severity": max(severities, key=lambda s: ["LOW","MEDIUM","HIGH","CRITICAL"].index(s)),
-            "avg_score": round(sum(scores) / len(scores), 3),
-            "first_seen": min(group, key=lambda a: parse_time(a["timestamp"]))["timestamp"],
-            "last_seen": max(group, key=lambda a: parse_time(a["timestamp"]))["timestamp"],
-        })
+def aggregate(alerts):
+    """One incident per (src_ip, rule) bucket of an in-memory alert list."""
+    buckets = accumulate(alerts)
+    metrics.inc("alerts_processed_total", len(alerts), stage="aggregation")
+
+    aggregated = [
+        to_incident(src_ip, rule, bucket)
+        for (src_ip, rule), bucket in buckets.items()
+    ]
+
+    metrics.set_gauge("incidents", len(aggregated), stage="aggregation")
+    return aggregated
+
+
+def aggregate_alerts():
+    with open(ALERTS_FILE, "r") as f:
+        alerts = json.load(f)
+
+    aggregated = aggregate(alerts)
 
     with open(OUTPUT_FILE, "w") as f:
         json.dump(aggregated, f, indent=2)
@@ -50,5 +150,195 @@ def aggregate_alerts():
     print(f"[+] Written to: {OUTPUT_FILE}")
 
 
+# =========================
+# INCREMENTAL AGGREGATION STORE
+# =========================
+class AggregationStore:
+    """
+    Persistent (src_ip, rule) buckets in SQLite.
+
+    New alerts are pre-aggregated in memory with accumulate() and merged with
+    one UPSERT per touched bucket, so the cost of a run tracks the number of
+    new alerts, not the history. For NDJSON inputs the byte offset already
+    consumed is stored alongside the buckets and reading resumes from it.
+    With the offset goes a fingerprint of the bytes at the start of the file
+    and just before the offset; alert_generator rewrites alerts.ndjson in
+    place on every run, so a changed fingerprint (or a shorter file) means
+    a new file that is read from the start.
+
+    Every merged alert's alert_key() is kept as well, and alerts already
+    merged are skipped: re-running detection on the same flows rewrites the
+    file with the same alerts, which must not count them twice.
+    """
+
+    def __init__(self, path=STATE_FILE):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS buckets ("
+            "entity TEXT NOT NULL, rule TEXT NOT NULL, "
+            "alert_count INTEGER NOT NULL, score_sum REAL NOT NULL, max_rank INTEGER NOT NULL, "
+            "first_ts REAL NOT NULL, last_ts REAL NOT NULL, "
+            "PRIMARY KEY (entity, rule))"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS offsets ("
+            "source TEXT PRIMARY KEY, position INTEGER NOT NULL, fingerprint TEXT)"
+        )
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(offsets)")]
+        if "fingerprint" not in columns:
+            # State written before fingerprints; those offsets keep the size check only
+            self.conn.execute("ALTER TABLE offsets ADD COLUMN fingerprint TEXT")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS merged_alerts (alert_key TEXT PRIMARY KEY) WITHOUT ROWID")
+        self.conn.commit()
+
+    def merge(self, alerts, source=None, position=None, fingerprint=None, keys=None):
+        """
+        Merge an iterable of alerts; returns the number of buckets touched.
+        When source/position are given the offset (and the fingerprint of
+        the file up to it) is saved in the same transaction, so a crash can
+        never double-count a batch; so are the alerts' `keys`, when given.
+        """
+        buckets = accumulate(alerts)
+        rows = [
+            (entity, rule, b["alert_count"], b["score_sum"], b["max_rank"], b["first_ts"], b["last_ts"])
+            for (entity, rule), b in buckets.items()
+        ]
+
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO buckets VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(entity, rule) DO UPDATE SET "
+                "alert_count = alert_count + excluded.alert_count, "
+                "score_sum = score_sum + excluded.score_sum, "
+                "max_rank = MAX(max_rank, excluded.max_rank), "
+                "first_ts = MIN(first_ts, excluded.first_ts), "
+                "last_ts = MAX(last_ts, excluded.last_ts)",
+                rows,
+            )
+            if source is not None:
+                self.conn.execute(
+                    "INSERT INTO offsets VALUES (?, ?, ?) "
+                    "ON CONFLICT(source) DO UPDATE SET "
+                    "position = excluded.position, fingerprint = excluded.fingerprint",
+                    (source, position, fingerprint),
+                )
+            if keys:
+                self.conn.executemany("INSERT INTO merged_alerts VALUES (?)", ((key,) for key in keys))
+
+        return len(rows)
+
+    def new_alerts(self, alerts):
+        """(alerts, keys) for the alerts not merged before, first occurrence only."""
+        pending = {}
+        for alert in alerts:
+            pending.setdefault(alert_key(alert), alert)
+
+        keys = list(pending)
+        for start in range(0, len(keys), LOOKUP_CHUNK):
+            chunk = keys[start:start + LOOKUP_CHUNK]
+            placeholders = ", ".join("?" * len(chunk))
+            for (key,) in self.conn.execute(
+                f"SELECT alert_key FROM merged_alerts WHERE alert_key IN ({placeholders})", chunk
+            ):
+                del pending[key]
+        return list(pending.values()), list(pending)
+
+    def ingest_ndjson(self, path=ALERTS_NDJSON_FILE, batch_size=10_000):
+        """
+        Merge alerts appended to an NDJSON file since the last call;
+        returns the number of alerts merged.
+        If the file is now shorter than the stored offset, or its bytes up
+        to the offset changed, it was rewritten and is read from the start;
+        alerts that were merged before are skipped either way.
+        """
+        source = os.path.abspath(path)
+        row = self.conn.execute(
+            "SELECT position, fingerprint FROM offsets WHERE source = ?", (source,)
+        ).fetchone()
+        position, fingerprint = row if row else (0, None)
+
+        ingested = 0
+        with open(path, "rb") as f:
+            if os.path.getsize(path) < position:
+                position = 0
+            elif position and fingerprint is not None and _fingerprint(f, position) != fingerprint:
+                position = 0
+            f.seek(position)
+            batch = []
+            while True:
+                line = f.readline()
+                # Only consume complete lines; a partial tail is picked up next time
+                if not line.endswith(b"\n"):
+                    break
+                position = f.tell()
+                if line.strip():
+                    batch.append(json.loads(line))
+                if len(batch) >= batch_size:
+                    ingested += self._merge_new(batch, source, position, _fingerprint(f, position))
+                    batch = []
+            ingested += self._merge_new(batch, source, position, _fingerprint(f, position))
+
+        return ingested
+
+    def _merge_new(self, batch, source, position, fingerprint):
+        alerts, keys = self.new_alerts(batch)
+        self.merge(alerts, source, position, fingerprint, keys)
+        return len(alerts)
+
+    def incidents(self):
+        cursor = self.conn.execute(
+            "SELECT entity, rule, alert_count, score_sum, max_rank, first_ts, last_ts "
+            "FROM buckets ORDER BY first_ts"
+        )
+        for entity, rule, count, score_sum, max_rank, first_ts, last_ts in cursor:
+            yield to_incident(entity, rule, {
+                "alert_count": count, "score_sum": score_sum, "max_rank": max_rank,
+                "first_ts": first_ts, "last_ts": last_ts,
+            })
+
+    def export(self, output_file=OUTPUT_FILE):
+        aggregated = list(self.incidents())
+        with open(output_file, "w") as f:
+            json.dump(aggregated, f, indent=2)
+        return len(aggregated)
+
+    def close(self):
+        self.conn.close()
+
+
+def _fingerprint(f, position):
+    """Hash of the first and the last FINGERPRINT_BYTES before `position`; keeps f's offset."""
+    here = f.tell()
+    digest = hashlib.sha256()
+    f.seek(0)
+    digest.update(f.read(min(position, FINGERPRINT_BYTES)))
+    start = max(position - FINGERPRINT_BYTES, 0)
+    f.seek(start)
+    digest.update(f.read(position - start))
+    f.seek(here)
+    return digest.hexdigest()
+
+
+def aggregate_incremental():
+    store = AggregationStore()
+    try:
+        ingested = store.ingest_ndjson()
+        total = store.export()
+    finally:
+        store.close()
+
+    metrics.inc("alerts_processed_total", ingested, stage="aggregation")
+    metrics.set_gauge("incidents", total, stage="aggregation")
+    print(f"[+] New alerts merged: {ingested}")
+    print(f"[+] Aggregated incidents: {total}")
+    print(f"[+] Written to: {OUTPUT_FILE}")
+
+
 if __name__ == "__main__":
-    aggregate_alerts()
+    with metrics.stage("aggregation"):
+        if "--incremental" in sys.argv:
+            aggregate_incremental()
+        else:
+            aggregate_alerts()
@@ -1,7 +1,23 @@
 import json
+import sys
+from collections import OrderedDict
+
+from detection_engine.event_time import alert_time, to_iso
+from detection_engine.intelligence.aggregator import (
+    SEVERITY_ORDER,
+    alert_weight,
+    bucket_keys,
+    severity_rank,
+)
 
 INPUT_FILE = "feature_engineering/outputs/aggregated_alerts.json"
 OUTPUT_FILE = "feature_engineering/outputs/campaigns.json"
+ALERTS_FILE = "feature_engineering/outputs/alerts.json"
+SESSIONS_FILE = "feature_engineering/outputs/campaign_sessions.json"
+
+# A gap longer than this between two alerts of the same (entity, rule)
+# starts a new session
+SESSION_GAP_SECONDS = 30 * 60
 
 
 def classify_campaign(alert_count):
@@ -13,7 +29,7 @@ def classify_campaign(alert_count):
         return "single_event"
 
 
-def detect_campaigns():
+def detect_campaigns(store=None):
     with open(INPUT_FILE, "r") as f:
         incidents = json.load(f)
 
@@ -28,9 +44,137 @@ def detect_campaigns():
     with open(OUTPUT_FILE, "w") as f:
         json.dump(campaigns, f, indent=2)
 
+    if store is not None:
+        store.write_campaigns(campaigns)
+
     print(f"[+] Campaigns classified: {len(campaigns)}")
     print(f"[+] Written to: {OUTPUT_FILE}")
 
 
+# =========================
+# GAP-BASED SESSIONIZATION
+# =========================
+class SessionTracker:
+    """
+    Splits each (entity, rule) alert stream into sessions separated by more
+    than `gap` seconds of inactivity and classifies every session on its own.
+
+    Single pass, one small state dict per open (entity, rule). Open sessions
+    are kept in last-activity order, so sessions idle for longer than `gap`
+    are closed from the front of the OrderedDict as event time advances and
+    session state stays bounded by the number of currently active entities.
+    Numbering sessions per (entity, rule) (session_index) needs one counter
+    for every (entity, rule) ever seen, which is not evicted: a long-running
+    tracker grows by one integer per distinct key, not per alert.
+    Alerts are expected in time order; small reorderings are absorbed into
+    the open session.
+    """
+
+    def __init__(self, gap=SESSION_GAP_SECONDS):
+        self.gap = gap
+        self._open = OrderedDict()
+        self._session_counts = {}
+
+    def observe(self, alert, epoch=None):
+        """Feed one alert; returns the sessions it caused to close."""
+        if epoch is None:
+            epoch = alert_time(alert)
+
+        closed = self._expire(epoch)
+
+        for key in bucket_keys(alert):
+            session = self._open.get(key)
+            if session is not None and epoch - session["last_ts"] > self.gap:
+                closed.append(self._close(key))
+                session = None
+
+            if session is None:
+                index = self._session_counts.get(key, 0) + 1
+                self._session_counts[key] = index
+                session = self._open[key] = {
+                    "session_index": index,
+                    "alert_count": 0,
+                    "max_rank": -1,
+                    "first_ts": epoch,
+                    "last_ts": epoch,
+                }
+
+            session["alert_count"] += alert_weight(alert)
+            session["max_rank"] = max(session["max_rank"], severity_rank(alert["severity"]))
+            session["first_ts"] = min(session["first_ts"], epoch)
+            session["last_ts"] = max(session["last_ts"], epoch)
+            self._open.move_to_end(key)
+
+        return closed
+
+    def flush(self):
+        """Close every open session (end of input)."""
+        return [self._close(key) for key in list(self._open)]
+
+    def open_sessions(self):
+        return len(self._open)
+
+    def _expire(self, now):
+        closed = []
+        while self._open:
+            key, session = next(iter(self._open.items()))
+            if now - session["last_ts"] <= self.gap:
+                break
+            closed.append(self._close(key))
+        return closed
+
+    def _close(self, key):
+        session = self._open.pop(key)
+        entity, rule = key
+        return {
+            "entity": entity,
+            "rule": rule,
+            "session_index": session["session_index"],
+            "alert_count": session["alert_count"],
+            "max_severity": SEVERITY_ORDER[session["max_rank"]] if session["max_rank"] >= 0 else "UNKNOWN",
+            "first_seen": to_iso(session["first_ts"]),
+            "last_seen": to_iso(session["last_ts"]),
+            "first_seen_ts": session["first_ts"],
+            "last_seen_ts": session["last_ts"],
+            "duration_seconds": round(session["last_ts"] - session["first_ts"], 3),
+            "campaign_type": classify_campaign(session["alert_count"]),
+        }
+
+
+def sessionize(alerts, gap=SESSION_GAP_SECONDS):
+    """Yield closed sessions for a time-ordered iterable of alerts."""
+    tracker = SessionTracker(gap)
+    for alert in alerts:
+        yield from tracker.observe(alert)
+    yield from tracker.flush()
+
+
+def detect_campaign_sessions():
+    with open(ALERTS_FILE, "r") as f:
+        alerts = json.load(f)
+
+    # Batch input is not guaranteed to be ordered
+    stamped = sorted(((alert_time(a), a) for a in alerts), key=lambda pair: pair[0])
+
+    tracker = SessionTracker()
+    sessions = []
+    for epoch, alert in stamped:
+        sessions.extend(tracker.observe(alert, epoch))
+    sessions.extend(tracker.flush())
+
+    with open(SESSIONS_FILE, "w") as f:
+        json.dump(sessions, f, indent=2)
+
+    print(f"[+] Campaign sessions classified: {len(sessions)}")
+    print(f"[+] Written to: {SESSIONS_FILE}")
+
+
 if __name__ == "__main__":
-    detect_campaigns()
+    if "--sessions" in sys.argv:
+        detect_campaign_sessions()
+    elif "--store" in sys.argv:
+        from detection_engine.query_store import QueryStore
+        with QueryStore() as store:
+            detect_campaigns(store)
+    else:
+        detect_campaigns()
@@ -0,0 +1,225 @@
+"""
+Cross-entity campaign clustering over shared infrastructure.
+
+Alerts are linked when their sources talk to the same destination IP, the
+same DNS base domain or the same uncommon destination port. Entities and
+infrastructure tokens are nodes of an incremental union-find (union by size,
+path halving), so each alert costs near-constant time and clusters are
+updated as alerts arrive instead of being recomputed.
+
+Infrastructure that most hosts share would merge everyone into a single
+cluster. DNS flows are linked through the queried domain rather than the
+resolver's address, and a token seen from more than `max_fan_in` distinct
+sources is treated as a hub and stops linking. add_many() finds hubs in a
+pre-pass so a batch is clustered as if they had been known up front;
+add() discovers them as it goes, and entities merged through a token
+before it crossed the cap stay merged.
+"""
+
+import json
+
+from detection_engine.intelligence.aggregator import alert_weight
+
+ALERTS_FILE = "feature_engineering/outputs/alerts.json"
+OUTPUT_FILE = "feature_engineering/outputs/clusters.json"
+
+# Ports shared by most traffic carry no campaign signal
+COMMON_PORTS = {20, 21, 22, 25, 53, 80, 110, 123, 143, 443, 465, 587, 993, 995, 3389, 8080}
+
+# Client-side ephemeral ports (Linux default range starts here) are random
+EPHEMERAL_PORT_START = 32768
+
+# Destination IPs that every host talks to (resolvers, gateways, proxies)
+IGNORED_DESTINATIONS = set()
+
+# Resolver traffic is linked through the queried domain, not the resolver
+DNS_PORT = 53
+
+# A token shared by more source hosts than this is common infrastructure
+DEFAULT_MAX_FAN_IN = 50
+
+# Second-level labels that form part of the public suffix (e.g. co.uk)
+SECOND_LEVEL_SUFFIXES = {"co", "com", "net", "org", "gov", "ac", "edu"}
+
+
+def base_domain(name):
+    labels = [label for label in name.lower().rstrip(".").split(".") if label]
+    if len(labels) < 2:
+        return None
+    if len(labels) >= 3 and labels[-2] in SECOND_LEVEL_SUFFIXES and len(labels[-1]) == 2:
+        return ".".join(labels[-3:])
+    return ".".join(labels[-2:])
+
+
+def infrastructure_tokens(alert, ignored_destinations=IGNORED_DESTINATIONS):
+    """Shared-infrastructure keys an alert can be linked through."""
+    tokens = []
+
+    dst_ip = alert.get("dst_ip")
+    dst_port = alert.get("dst_port", -1)
+    if dst_ip and dst_ip != "unknown" and dst_ip not in ignored_destinations and dst_port != DNS_PORT:
+        tokens.append(f"ip:{dst_ip}")
+
+    query = alert.get("dns_query")
+    if query:
+        domain = base_domain(query)
+        if domain:
+            tokens.append(f"domain:{domain}")
+
+    if (
+        isinstance(dst_port, int)
+        and 0 < dst_port < EPHEMERAL_PORT_START
+        and dst_port not in COMMON_PORTS
+    ):
+        tokens.append(f"port:{dst_port}")
+
+    return tokens
+
+
+def hub_tokens(alerts, ignored_destinations=IGNORED_DESTINATIONS, max_fan_in=DEFAULT_MAX_FAN_IN):
+    """Tokens shared by more than `max_fan_in` distinct source hosts."""
+    sources = {}
+    for alert in alerts:
+        src_ip = alert.get("src_ip", "unknown")
+        for token in infrastructure_tokens(alert, ignored_destinations):
+            sources.setdefault(token, set()).add(src_ip)
+    return {token for token, seen in sources.items() if len(seen) > max_fan_in}
+
+
+class ClusterBuilder:
+    """
+    Incremental connected components of entities linked through shared
+    infrastructure. Per-cluster summaries live on the root and are merged
+    small-into-large on union, so adding an alert never rescans history.
+    Distinct sources are counted per token only up to `max_fan_in`; past
+    that the token becomes a hub and its source set is dropped.
+    """
+
+    def __init__(self, ignored_destinations=IGNORED_DESTINATIONS, max_fan_in=DEFAULT_MAX_FAN_IN):
+        self.ignored_destinations = ignored_destinations
+        self.max_fan_in = max_fan_in
+        self.hubs = set()
+        self._fan_in = {}
+        self._parent = {}
+        self._size = {}
+        self._summary = {}
+
+    def add(self, alert):
+        src_ip = alert.get("src_ip", "unknown")
+        root = self._find(f"entity:{src_ip}")
+        summary = self._summary[root]
+        summary["alert_count"] += alert_weight(alert)
+        summary["rules"].update(alert.get("triggered_rules") or ["NO_RULE"])
+
+        for token in infrastructure_tokens(alert, self.ignored_destinations):
+            if not self._is_hub(token, src_ip):
+                root = self._union(root, token)
+
+        return root
+
+    def add_many(self, alerts):
+        alerts = list(alerts)
+        if self.max_fan_in is not None:
+            self.hubs |= hub_tokens(alerts, self.ignored_destinations, self.max_fan_in)
+        for alert in alerts:
+            self.add(alert)
+
+    def cluster_of(self, src_ip):
+        node = f"entity:{src_ip}"
+        if node not in self._parent:
+            return None
+        return self._render(self._find(node))
+
+    def clusters(self, min_entities=2):
+        """Clusters spanning at least `min_entities` source hosts, largest first."""
+        roots = {self._find(node) for node in self._parent}
+        found = [
+            self._render(root) for root in roots
+            if len(self._summary[root]["entities"]) >= min_entities
+        ]
+        return sorted(found, key=lambda c: (-c["entity_count"], -c["alert_count"]))
+
+    def _is_hub(self, token, src_ip):
+        if token in self.hubs:
+            return True
+        if self.max_fan_in is None:
+            return False
+
+        sources = self._fan_in.setdefault(token, set())
+        sources.add(src_ip)
+        if len(sources) > self.max_fan_in:
+            self.hubs.add(token)
+            del self._fan_in[token]
+            return True
+        return False
+
+    # ----------------------------------------
+    # Union-find
+    # ----------------------------------------
+    def _find(self, node):
+        parent = self._parent
+        if node not in parent:
+            parent[node] = node
+            self._size[node] = 1
+            kind, _, value = node.partition(":")
+            self._summary[node] = {
+                "entities": {value} if kind == "entity" else set(),
+                "infrastructure": set() if kind == "entity" else {node},
+                "alert_count": 0,
+                "rules": set(),
+            }
+            return node
+
+        while parent[node] != node:
+            parent[node] = parent[parent[node]]
+            node = parent[node]
+        return node
+
+    def _union(self, a, b):
+        a, b = self._find(a), self._find(b)
+        if a == b:
+            return a
+        if self._size[a] < self._size[b]:
+            a, b = b, a
+
+        self._parent[b] = a
+        self._size[a] += self._size.pop(b)
+
+        into, other = self._summary[a], self._summary.pop(b)
+        for field in ("entities", "infrastructure", "rules"):
+            if len(into[field]) < len(other[field]):
+                into[field], other[field] = other[field], into[field]
+            into[field] |= other[field]
+        into["alert_count"] += other["alert_count"]
+        return a
+
+    def _render(self, root):
+        summary = self._summary[root]
+        return {
+            "cluster_id": root,
+            "entity_count": len(summary["entities"]),
+            "entities": sorted(summary["entities"]),
+            "shared_infrastructure": sorted(summary["infrastructure"]),
+            "alert_count": summary["alert_count"],
+            "rules": sorted(summary["rules"]),
+        }
+
+
+def build_clusters():
+    with open(ALERTS_FILE, "r") as f:
+        alerts = json.load(f)
+
+    builder = ClusterBuilder()
+    builder.add_many(alerts)
+    clusters = builder.clusters()
+
+    with open(OUTPUT_FILE, "w") as f:
+        json.dump(clusters, f, indent=2)
+
+    print(f"[+] Multi-entity clusters found: {len(clusters)}")
+    print(f"[+] Shared infrastructure ignored (fan-in > {builder.max_fan_in}): {len(builder.hubs)}")
+    print(f"[+] Written to: {OUTPUT_FILE}")
+
+
+if __name__ == "__main__":
+    build_clusters()
@@ -0,0 +1,178 @@
+"""
+Kill-chain correlation engine.
+
+Rules fire on one flow at a time; this stage follows each source host across
+alerts and raises a single incident when it walks through a configured
+multi-stage sequence (e.g. PORT_SCAN -> C2_BEACON -> DATA_EXFIL) within the
+sequence's time bounds.
+
+State is one small record per (entity, sequence) in progress. Entities are
+kept in last-activity order and dropped once every partial match has
+outlived its time bound; a hard cap evicts the least recently active entity.
+"""
+
+import json
+from collections import OrderedDict
+
+from detection_engine.event_time import alert_time, to_iso
+
+ALERTS_FILE = "feature_engineering/outputs/alerts.json"
+OUTPUT_FILE = "feature_engineering/outputs/incidents.json"
+
+MAX_TRACKED_ENTITIES = 100_000
+
+# stages: labels/rules that satisfy each step, in order
+# max_span: seconds allowed from the first to the last stage
+# max_step_gap: seconds allowed between consecutive stages
+KILL_CHAINS = [
+    {
+        "name": "recon_to_exfiltration",
+        "stages": [["PORT_SCAN"], ["C2_BEACON", "DNS_BEACONING"], ["DATA_EXFIL"]],
+        "max_span": 24 * 3600,
+        "max_step_gap": 12 * 3600,
+        "severity": "CRITICAL",
+    },
+    {
+        "name": "recon_to_dns_tunnel",
+        "stages": [["PORT_SCAN"], ["DNS_TUNNEL"]],
+        "max_span": 6 * 3600,
+        "max_step_gap": 6 * 3600,
+        "severity": "HIGH",
+    },
+]
+
+
+def alert_tags(alert):
+    return {alert.get("threat_label")} | set(alert.get("triggered_rules") or [])
+
+
+class CorrelationEngine:
+    def __init__(self, chains=KILL_CHAINS, max_entities=MAX_TRACKED_ENTITIES):
+        self.chains = [
+            {**chain, "stages": [set(stage) for stage in chain["stages"]]}
+            for chain in chains
+        ]
+        self.max_entities = max_entities
+        self._horizon = max((chain["max_span"] for chain in chains), default=0)
+        self._entities = OrderedDict()
+        self._incident_count = 0
+        self._stats = {"alerts": 0, "incidents": 0, "expired": 0, "evicted": 0}
+
+    def observe(self, alert, epoch=None):
+        """Feed one alert (in time order); returns completed incidents."""
+        if epoch is None:
+            epoch = alert_time(alert)
+        self._stats["alerts"] += 1
+        self._expire(epoch)
+
+        entity = alert.get("src_ip", "unknown")
+        tags = alert_tags(alert)
+        state = self._entities.get(entity)
+        incidents = []
+
+        for index, chain in enumerate(self.chains):
+            partial = state.get(index) if state else None
+
+            if partial is not None and (
+                epoch - partial["start"] > chain["max_span"]
+                or epoch - partial["last"] > chain["max_step_gap"]
+            ):
+                del state[index]
+                partial = None
+
+            if partial is None:
+                if tags & chain["stages"][0]:
+                    if state is None:
+                        state = self._track(entity)
+                    state[index] = {"start": epoch, "last": epoch, "steps": [self._step(alert, 0, epoch)]}
+                continue
+
+            step = len(partial["steps"])
+            if not tags & chain["stages"][step]:
+                continue
+
+            partial["last"] = epoch
+            partial["steps"].append(self._step(alert, step, epoch))
+
+            if len(partial["steps"]) == len(chain["stages"]):
+                incidents.append(self._incident(entity, chain, partial))
+                del state[index]
+
+        if state is not None:
+            if state:
+                self._entities.move_to_end(entity)
+            else:
+                del self._entities[entity]
+
+        return incidents
+
+    def tracked_entities(self):
+        return len(self._entities)
+
+    def stats(self):
+        return {**self._stats, "tracked_entities": len(self._entities)}
+
+    def _track(self, entity):
+        while len(self._entities) >= self.max_entities:
+            self._entities.popitem(last=False)
+            self._stats["evicted"] += 1
+        state = self._entities[entity] = {}
+        return state
+
+    def _expire(self, now):
+        while self._entities:
+            entity, state = next(iter(self._entities.items()))
+            if any(now - partial["start"] <= self._horizon for partial in state.values()):
+                break
+            del self._entities[entity]
+            self._stats["expired"] += 1
+
+    @staticmethod
+    def _step(alert, stage, epoch):
+        return {
+            "stage": stage + 1,
+            "alert_id": alert.get("alert_id"),
+            "label": alert.get("threat_label"),
+            "event_time": epoch,
+        }
+
+    def _incident(self, entity, chain, partial):
+        self._incident_count += 1
+        self._stats["incidents"] += 1
+        steps = partial["steps"]
+        path = " → ".join(step["label"] for step in steps)
+        return {
+            "incident_id": f"INCIDENT-{self._incident_count:04d}",
+            "entity": entity,
+            "sequence": chain["name"],
+            "severity": chain.get("severity", "CRITICAL"),
+            "first_seen": to_iso(partial["start"]),
+            "last_seen": to_iso(partial["last"]),
+            "first_seen_ts": partial["start"],
+            "last_seen_ts": partial["last"],
+            "duration_seconds": round(partial["last"] - partial["start"], 3),
+            "stages": steps,
+            "summary": f"{chain.get('severity', 'CRITICAL')} incident: {entity} progressed {path}",
+        }
+
+
+def correlate_alerts():
+    with open(ALERTS_FILE, "r") as f:
+        alerts = json.load(f)
+
+    stamped = sorted(((alert_time(a), a) for a in alerts), key=lambda pair: pair[0])
+
+    engine = CorrelationEngine()
+    incidents = []
+    for epoch, alert in stamped:
+        incidents.extend(engine.observe(alert, epoch))
+
+    with open(OUTPUT_FILE, "w") as f:
+        json.dump(incidents, f, indent=2)
+
+    print(f"[+] Kill-chain incidents raised: {len(incidents)}")
+    print(f"[+] Written to: {OUTPUT_FILE}")
+
+
+if __name__ == "__main__":
+    correlate_alerts()
@@ -0,0 +1,176 @@
+"""
+Time-decayed per-host risk scores.
+
+Every alert adds its weight to the source host's score, and scores decay
+exponentially with event time (configurable half-life). Because decay is
+exponential, a host's score only needs its value at the last update:
+
+    score = score * exp(-lambda * (t - last_t)) + weight
+
+which is one multiply-add per alert. Scores live in numpy arrays indexed by a
+host -> slot dict, so a top-K ranking at any instant is one vectorized decay
+plus argpartition, without scanning alert history. The table is snapshotted
+to disk periodically and can be restored from the snapshot on restart.
+"""
+
+import json
+import math
+import os
+import time
+
+import numpy as np
+
+from detection_engine.event_time import alert_time, to_iso
+from detection_engine.intelligence.aggregator import alert_weight, severity_rank
+
+ALERTS_FILE = "feature_engineering/outputs/alerts.json"
+SNAPSHOT_FILE = "feature_engineering/outputs/host_risk.npz"
+OUTPUT_FILE = "feature_engineering/outputs/host_risk.json"
+
+HALF_LIFE_SECONDS = 6 * 3600
+SNAPSHOT_INTERVAL_SECONDS = 60
+
+# Multiplier on final_threat_score by severity (LOW, MEDIUM, HIGH, CRITICAL)
+SEVERITY_WEIGHTS = [0.25, 0.5, 1.0, 2.0]
+
+
+def risk_weight(alert):
+    rank = severity_rank(alert.get("severity"))
+    multiplier = SEVERITY_WEIGHTS[rank] if rank >= 0 else 0.5
+    return alert.get("final_threat_score", 0.0) * multiplier * alert_weight(alert)
+
+
+class HostRiskTable:
+    def __init__(self, half_life=HALF_LIFE_SECONDS, snapshot_path=None,
+                 snapshot_interval=SNAPSHOT_INTERVAL_SECONDS, capacity=1024):
+        self.decay_rate = math.log(2) / half_life
+        self.snapshot_path = snapshot_path
+        self.snapshot_interval = snapshot_interval
+        self._slots = {}
+        self._hosts = []
+        self._score = np.zeros(capacity)
+        self._last = np.zeros(capacity)
+        self._alerts = np.zeros(capacity, dtype=np.int64)
+        self._last_snapshot = time.monotonic()
+
+    def __len__(self):
+        return len(self._hosts)
+
+    def update(self, entity, weight, t):
+        slot = self._slots.get(entity)
+        if slot is None:
+            slot = self._add(entity, t)
+
+        elapsed = t - self._last[slot]
+        if elapsed >= 0:
+            self._score[slot] = self._score[slot] * math.exp(-self.decay_rate * elapsed) + weight
+            self._last[slot] = t
+        else:
+            # Late alert: decay its weight to the host's current reference time
+            self._score[slot] += weight * math.exp(self.decay_rate * elapsed)
+        self._alerts[slot] += 1
+
+        if self.snapshot_path and time.monotonic() - self._last_snapshot >= self.snapshot_interval:
+            self.snapshot()
+
+    def observe(self, alert):
+        self.update(alert.get("src_ip", "unknown"), risk_weight(alert), alert_time(alert))
+
+    def score(self, entity, now):
+        slot = self._slots.get(entity)
+        if slot is None:
+            return 0.0
+        return float(self._score[slot] * math.exp(-self.decay_rate * max(now - self._last[slot], 0)))
+
+    def top(self, k=10, now=None):
+        """The k riskiest hosts with scores decayed to `now` (default: latest update)."""
+        n = len(self._hosts)
+        if n == 0 or k <= 0:
+            return []
+
+        last = self._last[:n]
+        now = float(last.max()) if now is None else now
+        decayed = self._score[:n] * np.exp(-self.decay_rate * np.maximum(now - last, 0))
+
+        k = min(k, n)
+        candidates = np.argpartition(-decayed, k - 1)[:k]
+        ranked = candidates[np.argsort(-decayed[candidates])]
+
+        return [
+            {
+                "entity": self._hosts[i],
+                "risk_score": round(float(decayed[i]), 4),
+                "alert_count": int(self._alerts[i]),
+                "last_alert": to_iso(float(last[i])),
+            }
+            for i in ranked
+        ]
+
+    # ----------------------------------------
+    # Persistence
+    # ----------------------------------------
+    def snapshot(self, path=None):
+        path = path or self.snapshot_path
+        n = len(self._hosts)
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(
+            tmp_path,
+            hosts=np.array(self._hosts, dtype=str),
+            score=self._score[:n],
+            last=self._last[:n],
+            alerts=self._alerts[:n],
+            decay_rate=self.decay_rate,
+        )
+        os.replace(tmp_path, path)
+        self._last_snapshot = time.monotonic()
+
+    @classmethod
+    def restore(cls, path, **kwargs):
+        with np.load(path) as data:
+            half_life = math.log(2) / float(data["decay_rate"])
+            table = cls(half_life=half_life, capacity=max(len(data["hosts"]), 1), **kwargs)
+            n = len(data["hosts"])
+            table._hosts = [str(host) for host in data["hosts"]]
+            table._slots = {host: i for i, host in enumerate(table._hosts)}
+            table._score[:n] = data["score"]
+            table._last[:n] = data["last"]
+            table._alerts[:n] = data["alerts"]
+        return table
+
+    def _add(self, entity, t):
+        slot = len(self._hosts)
+        if slot == len(self._score):
+            self._score = np.resize(self._score, slot * 2)
+            self._last = np.resize(self._last, slot * 2)
+            self._alerts = np.resize(self._alerts, slot * 2)
+        self._slots[entity] = slot
+        self._hosts.append(entity)
+        self._score[slot] = 0.0
+        self._last[slot] = t
+        self._alerts[slot] = 0
+        return slot
+
+
+def rank_hosts(top_k=20):
+    with open(ALERTS_FILE, "r") as f:
+        alerts = json.load(f)
+
+    # Batch ranking rebuilds from the alert file; live consumers keep one
+    # table running and restore() it from the snapshot after a restart
+    table = HostRiskTable(snapshot_path=SNAPSHOT_FILE)
+    for alert in sorted(alerts, key=alert_time):
+        table.observe(alert)
+    table.snapshot()
+
+    ranking = table.top(top_k)
+    with open(OUTPUT_FILE, "w") as f:
+        json.dump(ranking, f, indent=2)
+
+    print(f"[+] Hosts scored: {len(table)}")
+    for entry in ranking[:5]:
+        print(f"  {entry['entity']:<18} {entry['risk_score']:.3f}  ({entry['alert_count']} alerts)")
+    print(f"[+] Written to: {OUTPUT_FILE}")
+
+
+if __name__ == "__main__":
+    rank_hosts()
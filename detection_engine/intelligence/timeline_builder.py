@@ -1,76 +1,166 @@
 import json
-from datetime import datetime
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timezone
 from collections import defaultdict
 
+from detection_engine.event_time import alert_time, to_epoch
+
 ALERTS_FILE = "feature_engineering/outputs/alerts.json"
 CAMPAIGNS_FILE = "feature_engineering/outputs/campaigns.json"
 OUTPUT_FILE = "feature_engineering/outputs/timelines.json"
 
 
-def parse_time(ts):
-    return datetime.fromisoformat(ts.replace("Z", ""))
-
-
-def build_timelines():
+def build_timelines(store=None):
     with open(ALERTS_FILE, "r") as f:
         alerts = json.load(f)
 
     with open(CAMPAIGNS_FILE, "r") as f:
         campaigns = json.load(f)
 
-    alert_map = defaultdict(list)
-
-    for alert in alerts:
-        entity = alert.get("src_ip", "unknown")
-        rules = alert.get("triggered_rules", [])
-
-        if not rules:
-            rules = ["NO_RULE"]
-
-        for rule in rules:
-            alert_map[(entity, rule)].append(alert)
+    index = AlertTimeIndex()
+    index.add_many(alerts)
 
     timelines = []
 
     for campaign in campaigns:
-        key = (campaign["entity"], campaign["rule"])
-        related_alerts = sorted(
-            alert_map.get(key, []),
-            key=lambda a: parse_time(a["timestamp"])
-        )
-
-        timeline_events = []
-        last_severity = None
-
-        for alert in related_alerts:
-            time_str = parse_time(alert["timestamp"]).strftime("%H:%M:%S")
-            score = alert["final_threat_score"]
-            severity = alert["severity"]
-
-            if last_severity and severity != last_severity:
-                timeline_events.append(
-                    f"{time_str} — Severity escalated to {severity}"
-                )
-            else:
-                timeline_events.append(
-                    f"{time_str} — {campaign['rule']} detected (score: {score})"
-                )
-
-            last_severity = severity
+        related_alerts = index.query(campaign["entity"], campaign["rule"])
 
         timelines.append({
             "entity": campaign["entity"],
             "rule": campaign["rule"],
             "campaign_type": campaign["campaign_type"],
-            "timeline": timeline_events
+            "timeline": render_timeline(campaign["rule"], related_alerts)
         })
 
     with open(OUTPUT_FILE, "w") as f:
         json.dump(timelines, f, indent=2)
 
+    if store is not None:
+        store.write_timelines(timelines)
+
     print(f"[+] Timelines generated: {len(timelines)}")
     print(f"[+] Written to: {OUTPUT_FILE}")
 
 
+# =========================
+# TIME-INDEXED ALERT STORE
+# =========================
+def render_timeline(rule, alerts):
+    """Timeline event strings for time-ordered alerts of one (entity, rule)."""
+    timeline_events = []
+    last_severity = None
+
+    for alert in alerts:
+        time_str = datetime.fromtimestamp(alert_time(alert), tz=timezone.utc).strftime("%H:%M:%S")
+        severity = alert["severity"]
+
+        if last_severity and severity != last_severity:
+            timeline_events.append(f"{time_str} — Severity escalated to {severity}")
+        else:
+            timeline_events.append(
+                f"{time_str} — {rule} detected (score: {alert['final_threat_score']})"
+            )
+
+        last_severity = severity
+
+    return timeline_events
+
+
+class AlertTimeIndex:
+    """
+    Alerts grouped by (entity, rule), each group holding a sorted array of
+    epoch timestamps next to the alerts in the same order.
+
+    Appends of in-order alerts are O(1); late alerts are placed with bisect.
+    Range queries are two bisects plus a slice, so one entity's timeline for
+    a window is built without touching any other alert.
+    """
+
+    def __init__(self):
+        self._times = {}
+        self._alerts = {}
+        self._rules_by_entity = defaultdict(set)
+
+    def add(self, alert, epoch=None):
+        epoch = alert_time(alert) if epoch is None else epoch
+        entity = alert.get("src_ip", "unknown")
+
+        for rule in alert.get("triggered_rules") or ["NO_RULE"]:
+            key = (entity, rule)
+            times = self._times.get(key)
+            if times is None:
+                times = self._times[key] = array("d")
+                self._alerts[key] = []
+                self._rules_by_entity[entity].add(rule)
+
+            if not times or epoch >= times[-1]:
+                times.append(epoch)
+                self._alerts[key].append(alert)
+            else:
+                position = bisect_right(times, epoch)
+                times.insert(position, epoch)
+                self._alerts[key].insert(position, alert)
+
+    def add_many(self, alerts):
+        for alert in alerts:
+            self.add(alert)
+
+    def __len__(self):
+        return len(self._times)
+
+    def rules_for(self, entity):
+        return sorted(self._rules_by_entity.get(entity, ()))
+
+    def query(self, entity, rule, start=None, end=None):
+        """Alerts for (entity, rule) with start <= time <= end (epoch or ISO)."""
+        times = self._times.get((entity, rule))
+        if times is None:
+            return []
+
+        start, end = to_epoch(start), to_epoch(end)
+        lo = 0 if start is None else bisect_left(times, start)
+        hi = len(times) if end is None else bisect_right(times, end)
+        return self._alerts[(entity, rule)][lo:hi]
+
+    def count(self, entity, rule, start=None, end=None):
+        times = self._times.get((entity, rule))
+        if times is None:
+            return 0
+        start, end = to_epoch(start), to_epoch(end)
+        lo = 0 if start is None else bisect_left(times, start)
+        hi = len(times) if end is None else bisect_right(times, end)
+        return max(hi - lo, 0)
+
+    def timeline_for(self, entity, start=None, end=None, rule=None):
+        """On-demand timelines for one entity, optionally bounded in time."""
+        rules = [rule] if rule else self.rules_for(entity)
+        return [
+            {
+                "entity": entity,
+                "rule": r,
+                "timeline": render_timeline(r, self.query(entity, r, start, end)),
+            }
+            for r in rules
+        ]
+
+
+def load_index(path=ALERTS_FILE):
+    index = AlertTimeIndex()
+    if path.endswith(".ndjson"):
+        with open(path, "r") as f:
+            index.add_many(json.loads(line) for line in f if line.strip())
+    else:
+        with open(path, "r") as f:
+            index.add_many(json.load(f))
+    return index
+
+
 if __name__ == "__main__":
-    build_timelines()
+    if "--store" in sys.argv:
+        from detection_engine.query_store import QueryStore
+        with QueryStore() as store:
+            build_timelines(store)
+    else:
+        build_timelines()
@@ -0,0 +1,321 @@
+"""
+SentinelHunt Stage Metrics
+
+Purpose:
+- One instrumentation layer for every pipeline stage: timers, counters,
+  histograms and memory gauges, labeled per stage and per rule
+- Expose them in the Prometheus text format, as a textfile for the
+  node_exporter textfile collector or on a local HTTP endpoint
+- Cost nothing measurable when switched off
+
+Metrics are off unless SENTINELHUNT_METRICS_DIR (one <job>.prom file per
+process, written at exit) or SENTINELHUNT_METRICS_PORT (HTTP /metrics) is
+set, or configure() is called. While off, every helper returns after one
+flag check and timers are a shared no-op context manager.
+
+    from detection_engine import metrics
+
+    with metrics.stage("alerting"):
+        ...
+        metrics.inc("flows_processed_total", len(df), stage="alerting")
+        with metrics.timer("rule_eval_seconds", rule="PORT_SCAN"):
+            ...
+"""
+
+import atexit
+import bisect
+import contextlib
+import os
+import resource
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+PREFIX = "sentinelhunt_"
+DIR_ENV = "SENTINELHUNT_METRICS_DIR"
+PORT_ENV = "SENTINELHUNT_METRICS_PORT"
+
+# Seconds; wide enough for a per-rule evaluation and a whole stage
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+_NULL = contextlib.nullcontext()
+
+
+# =========================
+# REGISTRY
+# =========================
+class Registry:
+    """Counters, gauges and histograms keyed by (name, sorted labels)."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+
+    def inc(self, name, value=1, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            self._gauges[(name, _label_key(labels))] = value
+
+    def set_max(self, name, value, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._gauges[key] = max(self._gauges.get(key, value), value)
+
+    def observe(self, name, value, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * len(self.buckets), 0.0, 0]
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                histogram[0][index] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    def value(self, name, **labels):
+        """Current counter or gauge value (None if never recorded)."""
+        key = (name, _label_key(labels))
+        with self._lock:
+            return self._counters.get(key, self._gauges.get(key))
+
+    def histogram(self, name, **labels):
+        """(count, sum) of a histogram (None if never observed)."""
+        with self._lock:
+            histogram = self._histograms.get((name, _label_key(labels)))
+            return None if histogram is None else (histogram[2], histogram[1])
+
+    def clear(self):
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            gauges = sorted(self._gauges.items())
+            histograms = sorted((k, (list(v[0]), v[1], v[2])) for k, v in self._histograms.items())
+
+        lines = []
+        typed = set()
+
+        def header(name, kind):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {PREFIX}{name} {kind}")
+
+        for (name, labels), value in counters:
+            header(name, "counter")
+            lines.append(f"{PREFIX}{name}{_render_labels(labels)} {_number(value)}")
+        for (name, labels), value in gauges:
+            header(name, "gauge")
+            lines.append(f"{PREFIX}{name}{_render_labels(labels)} {_number(value)}")
+        for (name, labels), (counts, total, count) in histograms:
+            header(name, "histogram")
+            cumulative = 0
+            for bound, bucket in zip(self.buckets, counts):
+                cumulative += bucket
+                lines.append(f"{PREFIX}{name}_bucket{_render_labels(labels + (('le', _number(bound)),))} {cumulative}")
+            lines.append(f"{PREFIX}{name}_bucket{_render_labels(labels + (('le', '+Inf'),))} {count}")
+            lines.append(f"{PREFIX}{name}_sum{_render_labels(labels)} {_number(total)}")
+            lines.append(f"{PREFIX}{name}_count{_render_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+def _label_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _render_labels(labels):
+    if not labels:
+        return ""
+    escaped = (
+        f'{k}="' + v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+        for k, v in labels
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+REGISTRY = Registry()
+_state = {"enabled": False, "job": None, "directory": None, "server": None}
+
+
+# =========================
+# RECORDING
+# =========================
+def enabled():
+    return _state["enabled"]
+
+
+def inc(name, value=1, **labels):
+    if _state["enabled"]:
+        REGISTRY.inc(name, value, **labels)
+
+
+def set_gauge(name, value, **labels):
+    if _state["enabled"]:
+        REGISTRY.set(name, value, **labels)
+
+
+def observe(name, value, **labels):
+    if _state["enabled"]:
+        REGISTRY.observe(name, value, **labels)
+
+
+def timer(name, **labels):
+    """Context manager observing its wall time into histogram `name`."""
+    if not _state["enabled"]:
+        return _NULL
+    return _Timer(name, labels)
+
+
+def stage(name):
+    """
+    Context manager for a whole stage: duration histogram, run and failure
+    counters, and the process's current and peak RSS when it finishes.
+    """
+    if not _state["enabled"]:
+        return _NULL
+    return _Stage(name)
+
+
+class _Timer:
+    __slots__ = ("name", "labels", "started")
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        REGISTRY.observe(self.name, time.perf_counter() - self.started, **self.labels)
+
+
+class _Stage(_Timer):
+    __slots__ = ()
+
+    def __init__(self, name):
+        super().__init__("stage_duration_seconds", {"stage": name})
+        if _state["job"] is None:
+            _state["job"] = name
+
+    def __exit__(self, exc_type, exc, tb):
+        super().__exit__(exc_type, exc, tb)
+        stage_name = self.labels["stage"]
+        REGISTRY.inc("stage_runs_total", stage=stage_name)
+        if exc_type is not None:
+            REGISTRY.inc("stage_failures_total", stage=stage_name)
+        record_memory(stage_name)
+
+
+def record_memory(stage_name):
+    """Set the current and peak RSS gauges (bytes) for a stage."""
+    if not _state["enabled"]:
+        return
+    current, peak = memory_usage()
+    if current is not None:
+        REGISTRY.set("memory_rss_bytes", current, stage=stage_name)
+    if peak is not None:
+        REGISTRY.set_max("memory_peak_rss_bytes", peak, stage=stage_name)
+
+
+def memory_usage():
+    """(current, peak) RSS of this process in bytes; VmRSS/VmHWM where /proc exists."""
+    current = peak = None
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    current = int(line.split()[1]) * 1024
+                elif line.startswith("VmHWM:"):
+                    peak = int(line.split()[1]) * 1024
+    except OSError:
+        usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        peak = usage if sys.platform == "darwin" else usage * 1024
+    return current, peak
+
+
+# =========================
+# EXPOSITION
+# =========================
+def configure(directory=None, port=None, job=None):
+    """
+    Switch metrics on. With `directory`, <job>.prom is written there at exit
+    (and by write_textfile()); with `port`, /metrics is served on localhost.
+    """
+    _state["enabled"] = True
+    if job is not None:
+        _state["job"] = job
+    if directory is not None and _state["directory"] is None:
+        _state["directory"] = Path(directory)
+        atexit.register(write_textfile)
+    if port is not None and _state["server"] is None:
+        _state["server"] = serve(int(port))
+
+
+def disable():
+    _state["enabled"] = False
+
+
+def textfile_path():
+    if _state["directory"] is None:
+        return None
+    job = _state["job"] or Path(sys.argv[0]).stem or "sentinelhunt"
+    return _state["directory"] / f"{job}.prom"
+
+
+def write_textfile(path=None):
+    """Write the registry atomically, so a collector never reads a partial file."""
+    path = Path(path) if path is not None else textfile_path()
+    if path is None:
+        return None
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+    tmp_path.write_text(REGISTRY.render())
+    os.replace(tmp_path, path)
+    return path
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(port, host="127.0.0.1"):
+    """Serve /metrics from a daemon thread; returns the server (port 0 picks a free one)."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+
+if os.environ.get(DIR_ENV) or os.environ.get(PORT_ENV):
+    configure(directory=os.environ.get(DIR_ENV) or None, port=os.environ.get(PORT_ENV) or None)
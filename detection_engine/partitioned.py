@@ -0,0 +1,471 @@
+"""
+SentinelHunt Partitioned Batch Runner
+
+Purpose:
+- Run offline hunts over days of flows as hourly partitions instead of one
+  big batch: flows are bucketed by the hour of first_seen, and the
+  partition-local stages (baseline flags, ML scoring, score fusion,
+  severity, labeling, alerting and per-(src_ip, rule) incident state) run
+  for every hour in parallel across a process pool
+- Merge the state that spans hours in a final reduce step: incidents,
+  campaigns, gap-based campaign sessions and time-decayed host risk
+- Keep every hour's outputs on disk, so a run that adds an hour of traffic
+  processes only that partition (plus the reduce, which reads the stored
+  per-hour results)
+
+The batch pipeline derives some statistics from the whole table: baseline
+thresholds, the scaler and Isolation Forest, and the min/max ranges the
+threat score is normalized over. Here they are fitted once over every
+stored partition and saved next to them; on a fresh store the alerts match
+a batch run over the same flows in hour order, and so do the incidents, up
+to the last digit of an average score (per-hour score sums are added in a
+different order). Hours added later are scored against the saved fit, as experiments/replay.py
+does. --refit fits again over everything stored (and so re-runs every
+partition); so does a change to the baseline or training code.
+
+Captures given on the command line are parsed in parallel, one per worker.
+Alert suppression is not applied: its TTL windows would straddle partitions.
+
+Partition directory:
+
+    manifest.json            storage format, per-hour content digests and counts
+    fit.joblib               thresholds, scaler, model and score ranges
+    hour=<epoch hour>/
+        flows.csv            input flows of that hour
+        labeled.csv          scored and labeled flows
+        alerts.ndjson        alerts, numbered ALERT-<hour>-<n>
+        buckets.json         (src_ip, rule) incident state for the reduce
+
+(flow tables are .parquet with --format parquet). Flows of an hour present
+in new input are merged into the stored partition of that hour: a flow
+given again (same 5-tuple and first_seen) replaces its stored row, and
+the merged hour is processed again.
+
+Usage (from the repository root):
+    python3 -m detection_engine.partitioned --features flows.parquet --workers 8
+    python3 -m detection_engine.partitioned day1.pcap day2.pcap
+    python3 -m detection_engine.partitioned --refit
+"""
+
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import joblib
+import pandas as pd
+import sklearn
+
+from analysis import baseline_analysis
+from detection_engine import flow_store, metrics, stage_cache
+from detection_engine.event_time import alert_time
+from detection_engine.intelligence import aggregator, campaign_detector, host_risk
+from detection_engine.scoring import alert_generator, severity, threat_labeler, threat_score
+from ml import train_baseline
+
+# =========================
+# CONFIG
+# =========================
+REPO_ROOT = Path(__file__).resolve().parents[1]
+
+PARTITION_DIR = "feature_engineering/outputs/partitions"
+MANIFEST_FILE = "manifest.json"
+FIT_FILE = "fit.joblib"
+ALERTS_FILE = "alerts.ndjson"
+BUCKETS_FILE = "buckets.json"
+
+# Identifies a flow across inputs; a flow given again replaces the stored row
+FLOW_KEY = ["src_ip", "src_port", "dst_ip", "dst_port", "protocol", flow_store.TIME_COLUMN]
+
+TOP_HOSTS = 20
+
+# Code behind the fit and behind each partition's outputs, relative to the
+# repository; a change refits, or re-runs the partitions, respectively
+FIT_SOURCES = ["analysis/baseline_analysis.py", "ml/train_baseline.py"]
+PARTITION_SOURCES = FIT_SOURCES + [
+    "detection_engine/scoring",
+    "detection_engine/rules",
+    "detection_engine/event_time.py",
+    "detection_engine/intelligence/aggregator.py",
+]
+
+
+# =========================
+# PARTITION STORE
+# =========================
+def partition_dir(directory, hour):
+    return Path(directory) / f"{flow_store.PARTITION_COLUMN}={hour}"
+
+
+def _table(path, name, fmt):
+    return Path(flow_store.intermediate_path(Path(path) / f"{name}.csv", fmt))
+
+
+def _write_json(records, path):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(records, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def load_manifest(directory):
+    path = Path(directory) / MANIFEST_FILE
+    if not path.exists():
+        return {"format": None, "partitions": {}}
+    with open(path) as f:
+        return json.load(f)
+
+
+def _storage_format(manifest, fmt):
+    stored = manifest.get("format")
+    if stored and fmt and flow_store.intermediate_format(fmt) != stored:
+        raise ValueError(f"Partitions are stored as {stored}; run with --format {stored} or a new --dir")
+    return stored or flow_store.intermediate_format(fmt)
+
+
+def merge_partition(stored, new):
+    """
+    Stored flows of an hour not present in `new`, followed by `new`. With
+    nothing left of the stored flows, `new` is returned as is.
+    """
+    key = pd.MultiIndex.from_frame(new[FLOW_KEY])
+    kept = stored[~pd.MultiIndex.from_frame(stored[FLOW_KEY]).isin(key)]
+    if kept.empty:
+        return new
+    return pd.concat([kept, new], ignore_index=True)
+
+
+def bucket_flows(flows, directory, fmt, manifest):
+    """
+    Merge every hour of `flows` into its stored partition and write the
+    hours whose merged content differs; returns the hours written.
+    Unchanged hours are left alone.
+    """
+    if flow_store.TIME_COLUMN not in flows.columns or flows[flow_store.TIME_COLUMN].isna().any():
+        raise ValueError(f"Partitioning needs {flow_store.TIME_COLUMN} on every flow")
+
+    written = []
+    for hour, group in flows.groupby(flow_store.hour_of(flows[flow_store.TIME_COLUMN]), sort=True):
+        hour = int(hour)
+        path = partition_dir(directory, hour)
+        group = group.reset_index(drop=True)
+        record = manifest["partitions"].get(str(hour))
+        if record is not None:
+            group = merge_partition(flow_store.read_flows(_table(path, "flows", fmt)), group)
+        digest = stage_cache.frame_digest(group)
+        if record is not None and record["digest"] == digest:
+            continue
+
+        path.mkdir(parents=True, exist_ok=True)
+        flow_store.write_flows(group, _table(path, "flows", fmt))
+        manifest["partitions"][str(hour)] = {"digest": digest, "flows": len(group)}
+        written.append(hour)
+    return written
+
+
+# =========================
+# FIT
+# =========================
+def fit_code():
+    digest = stage_cache.source_digest([REPO_ROOT / p for p in FIT_SOURCES])
+    return stage_cache.stage_key("fit", digest, {"sklearn": sklearn.__version__}, [])
+
+
+def fit_partitions(directory, hours, fmt, manifest):
+    """Baseline thresholds, scaler and Isolation Forest fitted over the stored partitions."""
+    flows = pd.concat(
+        [flow_store.read_flows(_table(partition_dir(directory, hour), "flows", fmt), columns=train_baseline.FEATURES)
+         for hour in hours],
+        ignore_index=True,
+    )
+    model, scaler = train_baseline.fit_model(flows)
+    code = fit_code()
+    return {
+        "id": stage_cache.stage_key("fit", code, {}, [manifest["partitions"][str(hour)]["digest"] for hour in hours]),
+        "code": code,
+        "thresholds": baseline_analysis.baseline_thresholds(flows),
+        "model": model,
+        "scaler": scaler,
+        # Set from every partition's scores before any is labeled
+        "ml_range": None,
+        "rule_range": None,
+    }
+
+
+def partition_key(record, fit):
+    code = stage_cache.source_digest([REPO_ROOT / p for p in PARTITION_SOURCES])
+    return stage_cache.stage_key("partition", code, {}, [record["digest"], fit["id"]])
+
+
+# =========================
+# PARTITION STAGES (run in the worker processes)
+# =========================
+_fit = None
+
+
+def _load_fit(path):
+    global _fit
+    _fit = joblib.load(path)
+
+
+def score_partition(directory, hour, fmt):
+    """Baseline flags and Isolation Forest score of one hour; returns its score ranges."""
+    path = partition_dir(directory, hour)
+    flows = flow_store.read_flows(_table(path, "flows", fmt))
+    enriched = baseline_analysis.enrich_flows(flows, _fit["thresholds"])
+    scored = train_baseline.apply_model(enriched, _fit["model"], _fit["scaler"])
+    flow_store.write_flows(scored, _table(path, "scored", fmt))
+    return {
+        "hour": hour,
+        "ml_range": (float(scored["iforest_score"].min()), float(scored["iforest_score"].max())),
+        "rule_range": (float(scored["suspicion_score"].min()), float(scored["suspicion_score"].max())),
+    }
+
+
+def detect_partition(directory, hour, fmt, ml_range, rule_range):
+    """
+    Fused score, severity, label, alerts and incident buckets of one scored
+    hour, normalizing scores over the given (min, max) ranges.
+    """
+    path = partition_dir(directory, hour)
+    scored_path = _table(path, "scored", fmt)
+    scored = flow_store.read_flows(scored_path)
+
+    flows = scored.drop(columns=["iforest_score", "iforest_label"])
+    labeled = threat_score.score_flows(flows, scored, ml_range, rule_range)
+    labeled = threat_labeler.label_frame(severity.add_severity(labeled))
+    flow_store.write_flows(labeled, _table(path, "labeled", fmt))
+
+    # IDs carry the hour so they stay unique however partitions are re-run
+    alerts = alert_generator.alerts_from_frame(labeled)
+    for n, alert in enumerate(alerts, 1):
+        alert["alert_id"] = f"ALERT-{hour}-{n:04d}"
+    with open(path / ALERTS_FILE, "w", encoding="utf-8") as f:
+        for alert in alerts:
+            f.write(json.dumps(alert, ensure_ascii=False) + "\n")
+
+    buckets = aggregator.accumulate(alerts)
+    _write_json([[entity, rule, bucket] for (entity, rule), bucket in buckets.items()], path / BUCKETS_FILE)
+
+    scored_path.unlink()
+    return {"hour": hour, "alerts": len(alerts)}
+
+
+PARTITION_STAGES = {
+    "score": score_partition,
+    "detect": detect_partition,
+}
+
+
+def _run_task(task):
+    stage, *args = task
+    return PARTITION_STAGES[stage](*args)
+
+
+def partition_pool(directory, workers, partitions):
+    """
+    Process pool whose workers load the saved fit once, or None to run
+    in this process (one worker or one partition).
+    """
+    fit_path = str(Path(directory) / FIT_FILE)
+    if workers <= 1 or partitions <= 1:
+        _load_fit(fit_path)
+        return None
+    return ProcessPoolExecutor(max_workers=min(workers, partitions), initializer=_load_fit, initargs=(fit_path,))
+
+
+def map_partitions(pool, stage, directory, hours, fmt, *args):
+    """Run one partition stage for every hour, on the pool if there is one."""
+    tasks = [(stage, str(directory), hour, fmt, *args) for hour in hours]
+    if pool is None:
+        return [_run_task(task) for task in tasks]
+    return list(pool.map(_run_task, tasks))
+
+
+def _parse_capture(pcap):
+    # Scapy is slow to import; only needed when starting from captures
+    from feature_engineering import parse_pcap
+    return parse_pcap.build_flow_frame(parse_pcap.load_pcap(pcap))
+
+
+def load_flows(pcaps, features, workers):
+    """Flow table of the new input: parsed captures and/or a feature table (None if neither)."""
+    frames = []
+    if pcaps:
+        if workers <= 1 or len(pcaps) <= 1:
+            frames.extend(_parse_capture(pcap) for pcap in pcaps)
+        else:
+            with ProcessPoolExecutor(max_workers=min(workers, len(pcaps))) as pool:
+                frames.extend(pool.map(_parse_capture, pcaps))
+    if features is not None:
+        frames.append(features if isinstance(features, pd.DataFrame) else flow_store.read_flows(features))
+    if not frames:
+        return None
+    return pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+
+
+# =========================
+# REDUCE
+# =========================
+def reduce_partitions(directory, hours, root, top_hosts=TOP_HOSTS):
+    """
+    Merge every partition's alerts and incident buckets into the repository
+    outputs: the alert stream (NDJSON), incidents, campaigns, campaign
+    sessions and host risk.
+    """
+    root = Path(root)
+    buckets = {}
+    tracker = campaign_detector.SessionTracker()
+    risk = host_risk.HostRiskTable()
+    sessions = []
+    alerts = 0
+
+    alerts_path = root / alert_generator.NDJSON_OUTPUT_FILE
+    alerts_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(alerts_path, "w", encoding="utf-8") as out:
+        for hour in hours:
+            path = partition_dir(directory, hour)
+            with open(path / BUCKETS_FILE) as f:
+                aggregator.merge_buckets(buckets, {(entity, rule): bucket for entity, rule, bucket in json.load(f)})
+
+            # Alerts are timed by first_seen, which falls inside the hour:
+            # hour order plus a sort within each hour is event-time order
+            stamped = sorted(
+                ((alert_time(alert), alert) for alert in alert_generator.read_alerts_ndjson(path / ALERTS_FILE)),
+                key=lambda pair: pair[0],
+            )
+            for epoch, alert in stamped:
+                sessions.extend(tracker.observe(alert, epoch))
+                risk.observe(alert)
+                out.write(json.dumps(alert, ensure_ascii=False) + "\n")
+            alerts += len(stamped)
+    sessions.extend(tracker.flush())
+
+    incidents = [aggregator.to_incident(entity, rule, bucket) for (entity, rule), bucket in buckets.items()]
+    campaigns = [
+        {**incident, "campaign_type": campaign_detector.classify_campaign(incident["alert_count"])}
+        for incident in incidents
+    ]
+    ranking = risk.top(top_hosts)
+
+    _write_json(incidents, root / aggregator.OUTPUT_FILE)
+    _write_json(campaigns, root / campaign_detector.OUTPUT_FILE)
+    _write_json(sessions, root / campaign_detector.SESSIONS_FILE)
+    _write_json(ranking, root / host_risk.OUTPUT_FILE)
+
+    return {"alerts": alerts, "incidents": incidents, "sessions": sessions, "host_risk": ranking}
+
+
+# =========================
+# RUNNER
+# =========================
+def run_partitioned(pcaps=(), features=None, directory=None, root=REPO_ROOT, workers=None, fmt=None,
+                    refit=False, top_hosts=TOP_HOSTS):
+    """
+    Add new input (captures and/or a flow feature table, DataFrame or path)
+    to the partition store, process every partition that is new or stale,
+    and reduce all of them into the outputs under `root`.
+
+    Returns the reduce results plus the stored and processed hours.
+    """
+    root = Path(root)
+    directory = Path(directory) if directory is not None else root / PARTITION_DIR
+    directory.mkdir(parents=True, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    timings = {}
+
+    manifest = load_manifest(directory)
+    fmt = manifest["format"] = _storage_format(manifest, fmt)
+
+    with metrics.stage("partitioned"):
+        started = time.perf_counter()
+        flows = load_flows(pcaps, features, workers)
+        written = bucket_flows(flows, directory, fmt, manifest) if flows is not None else []
+        _write_json(manifest, directory / MANIFEST_FILE)
+        timings["bucket"] = time.perf_counter() - started
+
+        hours = sorted(int(hour) for hour in manifest["partitions"])
+        if not hours:
+            raise ValueError("No partitions stored yet; give captures or --features")
+
+        fit_path = directory / FIT_FILE
+        fit = None if refit or not fit_path.exists() else joblib.load(fit_path)
+        if fit is None or fit["code"] != fit_code():
+            started = time.perf_counter()
+            fit = fit_partitions(directory, hours, fmt, manifest)
+            joblib.dump(fit, fit_path)
+            timings["fit"] = time.perf_counter() - started
+
+        if fit["ml_range"] is None:
+            pending = hours
+        else:
+            pending = [h for h in hours if manifest["partitions"][str(h)].get("key") != partition_key(
+                manifest["partitions"][str(h)], fit)]
+
+        pool = partition_pool(directory, workers, len(pending))
+        try:
+            started = time.perf_counter()
+            scored = map_partitions(pool, "score", directory, pending, fmt)
+            timings["score"] = time.perf_counter() - started
+
+            if fit["ml_range"] is None:
+                # Normalize over every partition, as the batch pipeline does over the whole table
+                fit["ml_range"] = (min(r["ml_range"][0] for r in scored), max(r["ml_range"][1] for r in scored))
+                fit["rule_range"] = (min(r["rule_range"][0] for r in scored), max(r["rule_range"][1] for r in scored))
+                joblib.dump(fit, fit_path)
+
+            started = time.perf_counter()
+            detected = map_partitions(pool, "detect", directory, pending, fmt, fit["ml_range"], fit["rule_range"])
+            timings["detect"] = time.perf_counter() - started
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+        for result in detected:
+            record = manifest["partitions"][str(result["hour"])]
+            record["alerts"] = result["alerts"]
+            record["key"] = partition_key(record, fit)
+        _write_json(manifest, directory / MANIFEST_FILE)
+        metrics.inc("partitions_processed_total", len(pending), stage="partitioned")
+
+        started = time.perf_counter()
+        results = reduce_partitions(directory, hours, root, top_hosts)
+        timings["reduce"] = time.perf_counter() - started
+
+    print(f"[+] Partitions: {len(hours)} stored, {len(written)} new or changed, {len(pending)} processed "
+          f"({workers} workers)")
+    print("[+] Timings:")
+    for name, seconds in timings.items():
+        print(f"    {name:<8} {seconds:8.2f}s")
+    print(f"[+] Alerts: {results['alerts']}")
+    print(f"[+] Incidents: {len(results['incidents'])}")
+    print(f"[+] Campaign sessions: {len(results['sessions'])}")
+    print(f"[+] Partitions stored in: {directory}")
+
+    return {**results, "partitions": hours, "processed": pending}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run the SentinelHunt detection pipeline over hourly partitions")
+    parser.add_argument("pcaps", nargs="*", help="captures to parse and add")
+    parser.add_argument("--features", metavar="PATH", help="flow feature table (CSV or Parquet) to add")
+    parser.add_argument("--root", default=str(REPO_ROOT),
+                        help="directory holding feature_engineering/outputs (default: repository)")
+    parser.add_argument("--dir", help=f"partition directory (default: <root>/{PARTITION_DIR})")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--format", choices=flow_store.FORMATS, default=None,
+                        help=f"storage format of partition flow tables (default: ${flow_store.FORMAT_ENV} or csv)")
+    parser.add_argument("--refit", action="store_true",
+                        help="refit thresholds and model over every stored partition")
+    parser.add_argument("--top-hosts", type=int, default=TOP_HOSTS, help="hosts kept in the risk ranking")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    run_partitioned(pcaps=args.pcaps, features=args.features, directory=args.dir, root=args.root,
+                    workers=args.workers, fmt=args.format, refit=args.refit, top_hosts=args.top_hosts)
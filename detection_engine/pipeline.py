@@ -0,0 +1,331 @@
+"""
+SentinelHunt Pipeline Runner
+
+Purpose:
+- Run parsing, baseline analysis, ML scoring, threat scoring, severity,
+  labeling, alerting and aggregation in one process, handing each stage's
+  DataFrame to the next in memory instead of through CSV/JSON files
+- Write a stage's output only when asked (--materialize), to the same
+  files the stand-alone scripts read and write, so downstream tools
+  (campaign detection, explanations, the dashboard) keep working
+- Skip stages whose input, code and config are unchanged since an earlier
+  run and reuse their cached output, so editing a rule re-runs only
+  alerting and aggregation (--no-cache to disable)
+
+The stand-alone scripts run as modules from the repository root
+(python3 -m ml.train_baseline). Here every path is resolved against one
+root, the repository by default, so the runner works from any directory.
+
+Usage (from the repository root):
+    python3 -m detection_engine.pipeline capture.pcap
+    python3 -m detection_engine.pipeline --features flows.csv --materialize all
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import joblib
+import numpy as np
+import pandas as pd
+import sklearn
+
+from analysis import baseline_analysis
+from detection_engine import flow_store, metrics, stage_cache
+from detection_engine.intelligence import aggregator
+from detection_engine.scoring import alert_generator, severity, threat_labeler, threat_score
+from ml import train_baseline
+
+# =========================
+# CONFIG
+# =========================
+REPO_ROOT = Path(__file__).resolve().parents[1]
+
+STAGES = [
+    "parse",
+    "baseline",
+    "ml_train_score",
+    "threat_score",
+    "severity",
+    "labeling",
+    "alerting",
+    "aggregation",
+]
+
+# Where each stage's output is materialized, relative to the root; the same
+# files the stand-alone scripts use. severity rewrites the score file, as
+# severity.py does.
+OUTPUT_FILES = {
+    "parse": "feature_engineering/outputs/flow_features.csv",
+    "baseline": "feature_engineering/outputs/flow_features_enriched.csv",
+    "ml_train_score": "ml/models/iforest_results.csv",
+    "threat_score": "feature_engineering/outputs/flow_threat_scores.csv",
+    "severity": "feature_engineering/outputs/flow_threat_scores.csv",
+    "labeling": "feature_engineering/outputs/flow_threat_labeled.csv",
+    "alerting": "feature_engineering/outputs/alerts.json",
+    "aggregation": "feature_engineering/outputs/aggregated_alerts.json",
+}
+MODEL_FILE = "ml/models/isolation_forest.pkl"
+SCALER_FILE = "ml/models/scaler.pkl"
+
+# Final products only; intermediates stay in memory unless requested
+DEFAULT_MATERIALIZE = ("alerting", "aggregation")
+
+# Stage outputs keyed by input, code and config (see stage_cache)
+CACHE_DIR = "feature_engineering/outputs/stage_cache"
+
+
+# =========================
+# MATERIALIZATION
+# =========================
+def parse_materialize(value):
+    """Stage set from 'all', 'none' or a comma-separated list of stage names."""
+    value = value.strip().lower()
+    if value == "all":
+        return set(STAGES)
+    if value in ("", "none"):
+        return set()
+
+    stages = {name.strip() for name in value.split(",") if name.strip()}
+    unknown = stages - set(STAGES)
+    if unknown:
+        raise ValueError(f"Unknown stage(s): {', '.join(sorted(unknown))} (choose from {', '.join(STAGES)})")
+    return stages
+
+
+def _output_path(root, name, fmt=None):
+    path = Path(flow_store.intermediate_path(Path(root) / OUTPUT_FILES[name], fmt))
+    path.parent.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def _write_json(records, path):
+    with open(path, "w") as f:
+        json.dump(records, f, indent=2)
+
+
+# =========================
+# STAGES
+# =========================
+# Stages each stage reads from, in argument order
+STAGE_INPUTS = {
+    "parse": [],
+    "baseline": ["parse"],
+    "ml_train_score": ["baseline"],
+    "threat_score": ["baseline", "ml_train_score"],
+    "severity": ["threat_score"],
+    "labeling": ["severity"],
+    "alerting": ["labeling"],
+    "aggregation": ["alerting"],
+}
+
+# Code each stage runs, relative to the repository; part of its cache key
+STAGE_SOURCES = {
+    "parse": ["feature_engineering/parse_pcap.py"],
+    "baseline": ["analysis/baseline_analysis.py"],
+    "ml_train_score": ["ml/train_baseline.py"],
+    "threat_score": ["detection_engine/scoring/threat_score.py"],
+    "severity": ["detection_engine/scoring/severity.py"],
+    "labeling": ["detection_engine/scoring/threat_labeler.py"],
+    "alerting": ["detection_engine/scoring/alert_generator.py", "detection_engine/rules",
+                 "detection_engine/event_time.py"],
+    "aggregation": ["detection_engine/intelligence/aggregator.py", "detection_engine/event_time.py"],
+}
+
+
+def stage_functions(pcap, features, suppressor):
+    """Stage name -> callable taking the outputs of STAGE_INPUTS[name]."""
+    def parse():
+        if pcap is None:
+            flows = features if isinstance(features, pd.DataFrame) else flow_store.read_flows(features)
+            print(f"[+] Loaded flow features: {len(flows)}")
+            return flows
+        # Scapy is slow to import; only needed when starting from a capture
+        from feature_engineering import parse_pcap
+        return parse_pcap.build_flow_frame(parse_pcap.load_pcap(pcap))
+
+    # Each stage adds columns to a shallow copy, so the frames returned per
+    # stage stay as that stage produced them (copy-on-write)
+    return {
+        "parse": parse,
+        "baseline": lambda flows: baseline_analysis.enrich_flows(flows.copy(deep=False)),
+        "ml_train_score": train_baseline.train_and_score,
+        "threat_score": lambda enriched, ml: threat_score.score_flows(enriched.copy(deep=False), ml[0]),
+        "severity": lambda scores: severity.add_severity(scores.copy(deep=False)),
+        "labeling": lambda scores: threat_labeler.label_frame(scores.copy(deep=False)),
+        "alerting": lambda labeled: alert_generator.alerts_from_frame(labeled, alert_generator.CHUNK_SIZE, suppressor),
+        "aggregation": aggregator.aggregate,
+    }
+
+
+def write_output(name, output, root, fmt=None):
+    """Materialize one stage's output where the stand-alone scripts keep it."""
+    path = _output_path(root, name, fmt)
+    if name == "ml_train_score":
+        scored, model, scaler = output
+        flow_store.write_flows(scored, path)
+        joblib.dump(model, Path(root) / MODEL_FILE)
+        joblib.dump(scaler, Path(root) / SCALER_FILE)
+    elif name == "alerting":
+        alert_generator.write_alerts_json(output, path)
+    elif name == "aggregation":
+        _write_json(output, path)
+    else:
+        flow_store.write_flows(output, path)
+    return path
+
+
+def stage_keys(pcap, features, suppress):
+    """Chained cache key of every stage for this input, code and config."""
+    environment = {
+        "python": sys.version.split()[0],
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "sklearn": sklearn.__version__,
+    }
+    config = {name: {} for name in STAGES}
+    config["alerting"] = {"suppress": bool(suppress)}
+
+    if pcap is not None:
+        root_input = ["pcap", stage_cache.file_digest(pcap)]
+    elif isinstance(features, pd.DataFrame):
+        root_input = ["features", stage_cache.frame_digest(features)]
+    else:
+        root_input = ["features", stage_cache.file_digest(features)]
+
+    keys = {}
+    for name in STAGES:
+        if name == "parse":
+            # Loading a feature table runs none of the parsing code
+            code = stage_cache.source_digest([REPO_ROOT / p for p in STAGE_SOURCES[name]]) if pcap else None
+            inputs = [root_input]
+        else:
+            code = stage_cache.source_digest([REPO_ROOT / p for p in STAGE_SOURCES[name]])
+            inputs = [keys[dep] for dep in STAGE_INPUTS[name]]
+        keys[name] = stage_cache.stage_key(name, code, {**environment, **config[name]}, inputs)
+    return keys
+
+
+# =========================
+# PIPELINE
+# =========================
+def run_pipeline(pcap=None, features=None, root=REPO_ROOT, materialize=DEFAULT_MATERIALIZE, suppress=False,
+                 cache=None, fmt=None):
+    """
+    Run every stage in memory, starting from a PCAP or from a flow feature
+    table (DataFrame, or CSV / Parquet path) that replaces parsing.
+
+    Returns {stage: output}: DataFrames up to labeling ((results, model,
+    scaler) for ml_train_score), the alert records and the incident list.
+    Outputs of the stages named in `materialize` are written under `root`,
+    flow tables as CSV or Parquet by `fmt` (see flow_store).
+
+    With a StageCache, a stage whose key is cached is not run; its output is
+    loaded only if a later stage that has to run, or materialization, needs
+    it. Stages that were neither run nor loaded are absent from the result.
+    """
+    if (pcap is None) == (features is None):
+        raise ValueError("Give either a PCAP or a flow feature table")
+
+    materialize = set(materialize)
+    unknown = materialize - set(STAGES)
+    if unknown:
+        raise ValueError(f"Unknown stage(s): {', '.join(sorted(unknown))}")
+
+    suppressor = alert_generator.AlertSuppressor() if suppress else None
+    functions = stage_functions(pcap, features, suppressor)
+    keys = stage_keys(pcap, features, suppress) if cache is not None else {}
+    results = {}
+    timings = {}
+    cached = []
+
+    def produce(name):
+        if name in results:
+            return results[name]
+
+        if cache is not None:
+            output = cache.get(keys[name], stage=name)
+            if output is not None:
+                cached.append(name)
+                results[name] = output
+                return output
+
+        args = [produce(dep) for dep in STAGE_INPUTS[name]]
+        started = time.perf_counter()
+        with metrics.stage(name):
+            output = functions[name](*args)
+        timings[name] = time.perf_counter() - started
+
+        if cache is not None:
+            cache.put(keys[name], output)
+        results[name] = output
+        return output
+
+    with metrics.stage("pipeline"):
+        for name in STAGES:
+            if name in materialize or name == STAGES[-1]:
+                output = produce(name)
+            if name in materialize:
+                print(f"[+] {name}: wrote {write_output(name, output, root, fmt)}")
+
+    print("\n[+] Stage timings:")
+    for name in STAGES:
+        if name in timings:
+            print(f"    {name:<15} {timings[name]:8.2f}s")
+        elif name in cached:
+            print(f"    {name:<15}   cached")
+        else:
+            print(f"    {name:<15}  skipped")
+    if "alerting" in results:
+        print(f"[+] Alerts: {len(results['alerting'])}")
+    print(f"[+] Incidents: {len(results['aggregation'])}")
+    if suppressor is not None and "alerting" in timings:
+        alert_generator.print_suppression_stats(suppressor)
+    if cache is not None:
+        print(f"[+] Stage cache: {cache.hits} hits, {cache.misses} misses "
+              f"({cache.size() / 1024 ** 2:.1f} MB in {cache.directory})")
+
+    return results
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run the SentinelHunt detection pipeline in one process")
+    parser.add_argument("pcap", nargs="?", help="capture to parse")
+    parser.add_argument("--features", metavar="PATH",
+                        help="start from extracted flow features (CSV or Parquet) instead of a PCAP")
+    parser.add_argument("--root", default=str(REPO_ROOT),
+                        help="directory holding feature_engineering/outputs and ml/models (default: repository)")
+    parser.add_argument("--materialize", default=",".join(DEFAULT_MATERIALIZE),
+                        help=f"stages whose output is written: comma-separated names, 'all' or 'none' "
+                             f"(stages: {', '.join(STAGES)})")
+    parser.add_argument("--format", choices=flow_store.FORMATS, default=None,
+                        help=f"format of materialized flow tables (default: ${flow_store.FORMAT_ENV} or csv)")
+    parser.add_argument("--suppress", action="store_true", help="collapse duplicate alerts")
+    parser.add_argument("--no-cache", action="store_true", help="run every stage, ignoring the stage cache")
+    parser.add_argument("--cache-dir", help=f"stage cache directory (default: <root>/{CACHE_DIR})")
+    parser.add_argument("--cache-max-gb", type=float, default=stage_cache.MAX_CACHE_BYTES / 1024 ** 3,
+                        help="evict least recently used entries above this size")
+    parser.add_argument("--cache-max-age-days", type=float, default=stage_cache.MAX_CACHE_AGE_DAYS,
+                        help="evict entries unused for longer than this")
+    args = parser.parse_args()
+
+    if (args.pcap is None) == (args.features is None):
+        parser.error("give either a PCAP or --features")
+    try:
+        args.materialize = parse_materialize(args.materialize)
+    except ValueError as e:
+        parser.error(str(e))
+    return args
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    cache = None
+    if not args.no_cache:
+        cache = stage_cache.StageCache(args.cache_dir or Path(args.root) / CACHE_DIR,
+                                       max_bytes=int(args.cache_max_gb * 1024 ** 3),
+                                       max_age_days=args.cache_max_age_days)
+    run_pipeline(pcap=args.pcap, features=args.features, root=args.root,
+                 materialize=args.materialize, suppress=args.suppress, cache=cache, fmt=args.format)
@@ -0,0 +1,341 @@
+"""
+SentinelHunt Query Store
+
+Purpose:
+- One local SQLite database for alerts, campaigns and timelines
+- Indexed lookups by src_ip, dst_ip, time, severity and rule
+- Keyset pagination so consumers never load a whole JSON file to answer
+  "CRITICAL alerts in the last hour"
+
+Detection stages write into the store (alert_generator --store,
+campaign_detector --store, timeline_builder --store); readers use
+QueryStore.alerts() / campaigns() / timeline(), or load_alerts() for the
+alert list of the latest run.
+
+Alert IDs restart at ALERT-0001 on every run, so alerts are keyed on
+(run_id, alert_id): each QueryStore writes under its own run ID and
+earlier runs stay queryable.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import time
+import uuid
+
+from detection_engine.event_time import alert_time, to_epoch
+from detection_engine.intelligence.aggregator import SEVERITY_ORDER, severity_rank
+from detection_engine.scoring.alert_sinks import AlertSink
+
+STORE_FILE = "feature_engineering/outputs/sentinelhunt.db"
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 10_000
+
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS runs (run_id TEXT PRIMARY KEY, started REAL NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS alerts ("
+    "run_id TEXT NOT NULL, alert_id TEXT NOT NULL, ts REAL NOT NULL, timestamp TEXT, "
+    "src_ip TEXT, dst_ip TEXT, src_port INTEGER, dst_port INTEGER, protocol TEXT, "
+    "threat_label TEXT, severity TEXT, severity_rank INTEGER, final_threat_score REAL, raw TEXT NOT NULL, "
+    "PRIMARY KEY (run_id, alert_id))",
+    "CREATE TABLE IF NOT EXISTS alert_rules (run_id TEXT NOT NULL, alert_id TEXT NOT NULL, rule TEXT NOT NULL, "
+    "PRIMARY KEY (rule, run_id, alert_id)) WITHOUT ROWID",
+    "CREATE TABLE IF NOT EXISTS campaigns ("
+    "entity TEXT NOT NULL, rule TEXT NOT NULL, campaign_type TEXT, alert_count INTEGER, "
+    "max_severity TEXT, first_seen TEXT, last_seen TEXT, raw TEXT NOT NULL, PRIMARY KEY (entity, rule))",
+    "CREATE TABLE IF NOT EXISTS timelines ("
+    "entity TEXT NOT NULL, rule TEXT NOT NULL, raw TEXT NOT NULL, PRIMARY KEY (entity, rule))",
+    "CREATE INDEX IF NOT EXISTS idx_alerts_run ON alerts (run_id, ts, alert_id)",
+    "CREATE INDEX IF NOT EXISTS idx_alerts_ts ON alerts (ts, run_id, alert_id)",
+    "CREATE INDEX IF NOT EXISTS idx_alerts_src ON alerts (src_ip, ts, run_id, alert_id)",
+    "CREATE INDEX IF NOT EXISTS idx_alerts_dst ON alerts (dst_ip, ts, run_id, alert_id)",
+    "CREATE INDEX IF NOT EXISTS idx_alerts_severity ON alerts (severity_rank, ts, run_id, alert_id)",
+    "CREATE INDEX IF NOT EXISTS idx_campaigns_type ON campaigns (campaign_type)",
+]
+
+
+def new_run_id():
+    """Time-ordered, collision-free ID for one detection run."""
+    return f"{time.strftime('%Y%m%dT%H%M%SZ', time.gmtime())}-{uuid.uuid4().hex[:8]}"
+
+
+def alert_row(alert, run_id):
+    return (
+        run_id, alert["alert_id"], alert_time(alert), alert.get("timestamp"),
+        alert.get("src_ip"), alert.get("dst_ip"), alert.get("src_port"), alert.get("dst_port"),
+        alert.get("protocol"), alert.get("threat_label"), alert.get("severity"),
+        severity_rank(alert.get("severity")), alert.get("final_threat_score"),
+        json.dumps(alert, ensure_ascii=False),
+    )
+
+
+class QueryStore:
+    """
+    Alerts written through one instance belong to one run (`run_id`,
+    generated unless given); rewriting an alert ID within a run replaces it.
+    """
+
+    def __init__(self, path=STORE_FILE, run_id=None):
+        self.path = path
+        self.run_id = run_id or new_run_id()
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        for statement in SCHEMA:
+            self.conn.execute(statement)
+        self.conn.commit()
+
+    # ----------------------------------------
+    # Writes
+    # ----------------------------------------
+    def write_alerts(self, alerts, run_id=None):
+        run_id = run_id or self.run_id
+        alerts = list(alerts)
+        rule_rows = [
+            (run_id, alert["alert_id"], rule)
+            for alert in alerts
+            for rule in alert.get("triggered_rules") or ["NO_RULE"]
+        ]
+        with self.conn:
+            self.conn.execute("INSERT OR IGNORE INTO runs VALUES (?, ?)", (run_id, time.time()))
+            # A replaced alert drops its old rules
+            self.conn.executemany(
+                "DELETE FROM alert_rules WHERE run_id = ? AND alert_id = ?",
+                [(run_id, a["alert_id"]) for a in alerts],
+            )
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO alerts VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [alert_row(a, run_id) for a in alerts],
+            )
+            self.conn.executemany("INSERT OR IGNORE INTO alert_rules VALUES (?, ?, ?)", rule_rows)
+        return len(alerts)
+
+    def write_campaigns(self, campaigns):
+        rows = [
+            (c["entity"], c["rule"], c.get("campaign_type"), c.get("alert_count"),
+             c.get("max_severity"), c.get("first_seen"), c.get("last_seen"),
+             json.dumps(c, ensure_ascii=False))
+            for c in campaigns
+        ]
+        with self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO campaigns VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        return len(rows)
+
+    def write_timelines(self, timelines):
+        rows = [(t["entity"], t["rule"], json.dumps(t, ensure_ascii=False)) for t in timelines]
+        with self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO timelines VALUES (?, ?, ?)", rows)
+        return len(rows)
+
+    # ----------------------------------------
+    # Queries
+    # ----------------------------------------
+    def latest_run(self):
+        row = self.conn.execute("SELECT run_id FROM runs ORDER BY started DESC, rowid DESC LIMIT 1").fetchone()
+        return row[0] if row else None
+
+    def runs(self):
+        return [run_id for (run_id,) in self.conn.execute("SELECT run_id FROM runs ORDER BY started, rowid")]
+
+    def alerts(self, severity=None, min_severity=None, src_ip=None, dst_ip=None, rule=None,
+               since=None, until=None, run_id=None, limit=DEFAULT_PAGE_SIZE, cursor=None, newest_first=True):
+        """
+        Filtered page of alerts ordered by time, across all runs unless
+        `run_id` is given.
+
+        `since`/`until` accept epoch seconds or ISO strings. Pass the returned
+        `next_cursor` back as `cursor` to fetch the following page; keyset
+        pagination keeps deep pages as cheap as the first.
+        """
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        clauses, params = [], []
+
+        if run_id is not None:
+            clauses.append("a.run_id = ?")
+            params.append(run_id)
+        if severity is not None:
+            clauses.append("a.severity_rank = ?")
+            params.append(severity_rank(severity))
+        if min_severity is not None:
+            clauses.append("a.severity_rank >= ?")
+            params.append(severity_rank(min_severity))
+        if src_ip is not None:
+            clauses.append("a.src_ip = ?")
+            params.append(src_ip)
+        if dst_ip is not None:
+            clauses.append("a.dst_ip = ?")
+            params.append(dst_ip)
+        if since is not None:
+            clauses.append("a.ts >= ?")
+            params.append(to_epoch(since))
+        if until is not None:
+            clauses.append("a.ts <= ?")
+            params.append(to_epoch(until))
+        if cursor is not None:
+            op = "<" if newest_first else ">"
+            clauses.append(f"(a.ts, a.run_id, a.alert_id) {op} (?, ?, ?)")
+            params.extend(cursor)
+
+        source = "alerts a"
+        if rule is not None:
+            source = "alert_rules r JOIN alerts a ON a.run_id = r.run_id AND a.alert_id = r.alert_id"
+            clauses.append("r.rule = ?")
+            params.append(rule)
+
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        order = "DESC" if newest_first else "ASC"
+        rows = self.conn.execute(
+            f"SELECT a.ts, a.run_id, a.alert_id, a.raw FROM {source} {where} "
+            f"ORDER BY a.ts {order}, a.run_id {order}, a.alert_id {order} LIMIT ?",
+            params + [limit + 1],
+        ).fetchall()
+
+        items = [json.loads(raw) for *_, raw in rows[:limit]]
+        next_cursor = tuple(rows[limit - 1][:3]) if len(rows) > limit else None
+        return {"items": items, "next_cursor": next_cursor}
+
+    def iter_alerts(self, **filters):
+        """Iterate every matching alert, page by page."""
+        cursor = None
+        while True:
+            page = self.alerts(cursor=cursor, **filters)
+            yield from page["items"]
+            cursor = page["next_cursor"]
+            if cursor is None:
+                return
+
+    def recent_alerts(self, seconds=3600, severity=None, now=None, **filters):
+        now = time.time() if now is None else now
+        return self.alerts(severity=severity, since=now - seconds, **filters)
+
+    def severity_counts(self, since=None, run_id=None):
+        clauses, params = [], []
+        if since is not None:
+            clauses.append("ts >= ?")
+            params.append(to_epoch(since))
+        if run_id is not None:
+            clauses.append("run_id = ?")
+            params.append(run_id)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self.conn.execute(
+            f"SELECT severity, COUNT(*) FROM alerts {where} GROUP BY severity", params
+        ).fetchall()
+        return dict(rows)
+
+    def campaigns(self, campaign_type=None, entity=None, limit=DEFAULT_PAGE_SIZE, offset=0):
+        clauses, params = [], []
+        if campaign_type is not None:
+            clauses.append("campaign_type = ?")
+            params.append(campaign_type)
+        if entity is not None:
+            clauses.append("entity = ?")
+            params.append(entity)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self.conn.execute(
+            f"SELECT raw FROM campaigns {where} ORDER BY entity, rule LIMIT ? OFFSET ?",
+            params + [max(1, min(limit, MAX_PAGE_SIZE)), offset],
+        ).fetchall()
+        return [json.loads(raw) for (raw,) in rows]
+
+    def timeline(self, entity, rule=None):
+        if rule is None:
+            rows = self.conn.execute("SELECT raw FROM timelines WHERE entity = ?", (entity,)).fetchall()
+        else:
+            rows = self.conn.execute(
+                "SELECT raw FROM timelines WHERE entity = ? AND rule = ?", (entity, rule)
+            ).fetchall()
+        return [json.loads(raw) for (raw,) in rows]
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class QueryStoreSink(AlertSink):
+    """Batched alert sink that writes one run into the query store from its worker thread."""
+
+    def __init__(self, path=STORE_FILE, **kwargs):
+        self.path = path
+        self._store = None
+        super().__init__(**kwargs)
+
+    def open(self):
+        self._store = QueryStore(self.path)
+
+    def write_batch(self, batch):
+        self._store.write_alerts(batch)
+
+    def close_resources(self):
+        if self._store:
+            self._store.close()
+
+
+def load_alerts(path=STORE_FILE, run_id=None):
+    """
+    Alerts of one run (the latest by default) in time order: the store-backed
+    equivalent of reading alert_generator's alerts.json.
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No query store at {path}; run alert_generator --store first")
+
+    with QueryStore(path) as store:
+        run_id = run_id or store.latest_run()
+        if run_id is None:
+            return []
+        return list(store.iter_alerts(run_id=run_id, limit=MAX_PAGE_SIZE, newest_first=False))
+
+
+def file_run_id(path):
+    """Run ID for an imported file; re-importing the same content replaces, not duplicates."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return f"import-{digest.hexdigest()[:12]}"
+
+
+def load_outputs(path=STORE_FILE):
+    """Import the current JSON outputs into the store."""
+    from detection_engine.intelligence import campaign_detector, timeline_builder
+    from detection_engine.scoring import alert_generator
+
+    sources = [
+        (alert_generator.OUTPUT_FILE, "write_alerts"),
+        (campaign_detector.OUTPUT_FILE, "write_campaigns"),
+        (timeline_builder.OUTPUT_FILE, "write_timelines"),
+    ]
+
+    with QueryStore(path) as store:
+        for source, method in sources:
+            try:
+                with open(source, "r") as f:
+                    records = json.load(f)
+            except FileNotFoundError:
+                print(f"[!] Skipping missing {source}")
+                continue
+            if method == "write_alerts":
+                count = store.write_alerts(records, run_id=file_run_id(source))
+            else:
+                count = getattr(store, method)(records)
+            print(f"[+] Loaded {count} records from {source}")
+
+    print(f"[+] Query store: {path}")
+
+
+if __name__ == "__main__":
+    if "--load" in sys.argv:
+        load_outputs()
+    else:
+        with QueryStore() as store:
+            run_id = store.latest_run()
+            print(f"[+] Alerts by severity (run {run_id}):")
+            counts = store.severity_counts(run_id=run_id)
+            for severity in reversed(SEVERITY_ORDER):
+                print(f"  {severity:<10} {counts.get(severity, 0)}")
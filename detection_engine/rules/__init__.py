@@ -1,7 +1,15 @@
 from .port_scan import detect as port_scan_detect
+from .port_scan import detect_batch as port_scan_detect_batch
 from .dns_abuse import detect as dns_beaconing_detect
+from .dns_abuse import detect_batch as dns_beaconing_detect_batch
 
 RULES = [
     port_scan_detect,
     dns_beaconing_detect
 ]
+
+# Vectorized counterparts of RULES, same order
+BATCH_RULES = [
+    port_scan_detect_batch,
+    dns_beaconing_detect_batch
+]
@@ -3,6 +3,15 @@ DNS Abuse / DNS Beaconing Detection Rule
 Feature-aligned with SentinelHunt Phase 1 dataset
 """
 
+import pandas as pd
+
+METADATA = {
+    "rule": "DNS_BEACONING",
+    "severity_boost": 0.2,
+    "indicator": "suspicious high-entropy, repetitive DNS queries"
+}
+
+
 def detect(flow):
     protocol = flow.get("protocol", "").upper()
     dst_port = flow.get("dst_port", -1)
@@ -21,10 +30,27 @@ def detect(flow):
             and (dns_entropy > 3.5 or flag_entropy == 1)
             and (dns_depth >= 3 or flag_depth == 1)
         ):
-            return True, {
-                "rule": "DNS_BEACONING",
-                "severity_boost": 0.2,
-                "indicator": "suspicious high-entropy, repetitive DNS queries"
-            }
+            return True, dict(METADATA)
 
     return False, None
+
+
+def detect_batch(flows):
+    """
+    Vectorized variant of detect() over a DataFrame of flows.
+    Returns a boolean mask aligned with flows.index and the rule metadata.
+    """
+    def column(name, default):
+        return flows.get(name, pd.Series(default, index=flows.index))
+
+    protocol = column("protocol", "").astype(str).str.upper()
+
+    matched = (
+        (protocol == "UDP")
+        & (column("dst_port", -1) == 53)
+        & (column("packets_per_second", 0) > 5)
+        & ((column("dns_entropy", 0) > 3.5) | (column("flag_high_dns_entropy", 0) == 1))
+        & ((column("dns_subdomain_depth", 0) >= 3) | (column("flag_deep_dns", 0) == 1))
+    )
+
+    return matched.to_numpy(), dict(METADATA)
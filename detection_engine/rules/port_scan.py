@@ -2,6 +2,15 @@
 Port Scan Detection Rule
 """
 
+import pandas as pd
+
+METADATA = {
+    "rule": "PORT_SCAN",
+    "severity_boost": 0.25,
+    "indicator": "high destination port diversity"
+}
+
+
 def detect(flow):
     """
     Detect potential port scanning behavior.
@@ -12,10 +21,16 @@ def detect(flow):
     dst_port_count = flow.get("dst_port_count", 0)
 
     if dst_port_count >= 20:
-        return True, {
-            "rule": "PORT_SCAN",
-            "severity_boost": 0.25,
-            "indicator": "high destination port diversity"
-        }
+        return True, dict(METADATA)
 
     return False, None
+
+
+def detect_batch(flows):
+    """
+    Vectorized variant of detect() over a DataFrame of flows.
+    Returns a boolean mask aligned with flows.index and the rule metadata.
+    """
+    dst_port_count = flows.get("dst_port_count", pd.Series(0, index=flows.index))
+
+    return (dst_port_count >= 20).to_numpy(), dict(METADATA)
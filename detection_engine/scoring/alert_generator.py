@@ -1,13 +1,29 @@
+import argparse
+import heapq
 import json
+import time
+import numpy as np
 import pandas as pd
-from datetime import datetime
-from detection_engine.rules import RULES
+from collections import OrderedDict
+from detection_engine import flow_store, metrics
+from detection_engine.event_time import alert_time, to_iso
+from detection_engine.rules import RULES, BATCH_RULES
+from detection_engine.scoring import alert_sinks
 
 # =========================
 # CONFIG
 # =========================
-INPUT_FILE = "feature_engineering/outputs/flow_threat_labeled.csv"
+INPUT_FILE = flow_store.intermediate_path("feature_engineering/outputs/flow_threat_labeled.csv")
 OUTPUT_FILE = "feature_engineering/outputs/alerts.json"
+NDJSON_OUTPUT_FILE = "feature_engineering/outputs/alerts.ndjson"
+
+# Flows read per chunk by the streaming path
+CHUNK_SIZE = 100_000
+
+# Duplicate suppression (see AlertSuppressor)
+SUPPRESSION_TTL_SECONDS = 300
+SUPPRESSION_MAX_KEYS = 50_000
+SUPPRESSION_ROLLUP_EVERY = 100
 
 # =========================
 # SEVERITY MAPPING (SOC-GRADE)
@@ -76,15 +92,36 @@ def calculate_confidence(score: float, indicator_count: int) -> float:
     return round(min(base + boost, 1.0), 2)
 
 
+def flow_event_times(row, fallback):
+    """
+    (first_seen, last_seen) epoch seconds of a flow. Flows extracted before
+    event time was recorded fall back to `fallback` (generation time).
+    """
+    first_seen = row.get("first_seen")
+    if first_seen is None or pd.isna(first_seen):
+        return fallback, fallback
+
+    last_seen = row.get("last_seen")
+    if last_seen is None or pd.isna(last_seen):
+        last_seen = first_seen
+    return float(first_seen), float(last_seen)
+
+
 def apply_rules(flow_row):
     triggered_rules = []
     score_boost = 0.0
     indicators = []
 
     flow = flow_row.to_dict()
+    timed = metrics.enabled()
 
     for rule in RULES:
-        matched, metadata = rule(flow)
+        if timed:
+            started = time.perf_counter()
+            matched, metadata = rule(flow)
+            _record_rule(rule, time.perf_counter() - started, int(bool(matched)), 1)
+        else:
+            matched, metadata = rule(flow)
         if matched:
             triggered_rules.append(metadata["rule"])
             score_boost += metadata.get("severity_boost", 0.0)
@@ -93,13 +130,177 @@ def apply_rules(flow_row):
     return triggered_rules, score_boost, indicators
 
 
+def _record_rule(rule, seconds, hits, flows):
+    name = rule.__module__.rsplit(".", 1)[-1]
+    metrics.observe("rule_eval_seconds", seconds, rule=name)
+    metrics.inc("rule_evaluations_total", flows, rule=name)
+    if hits:
+        metrics.inc("rule_hits_total", hits, rule=name)
+
+
+# =========================
+# DUPLICATE SUPPRESSION
+# =========================
+class AlertSuppressor:
+    """
+    Bounded TTL cache that collapses repeated alerts.
+
+    Alerts are keyed on (src_ip, dst_ip, rule, threat_label). The first alert
+    for a key opens a window of `ttl` seconds and is emitted unchanged;
+    duplicates inside the window are only counted. A roll-up record carrying
+    `suppressed_count` is emitted every `rollup_every` duplicates, when the
+    window expires, when the key is evicted to respect `max_keys`, and on
+    flush().
+
+    Windows run on event time, and alerts may arrive out of order: a min-heap
+    of window opening times drives expiry, so a window opened by a late
+    alert still expires on time and never holds back the others. Evicting
+    for max_keys drops the longest-open window (the front of an OrderedDict
+    kept in creation order). Heap entries of windows already closed are
+    skipped when they surface, and the heap is rebuilt from the open windows
+    if it grows past twice max_keys.
+    """
+
+    def __init__(self, ttl=SUPPRESSION_TTL_SECONDS, max_keys=SUPPRESSION_MAX_KEYS,
+                 rollup_every=SUPPRESSION_ROLLUP_EVERY):
+        self.ttl = ttl
+        self.max_keys = max_keys
+        self.rollup_every = rollup_every
+        self._windows = OrderedDict()
+        self._expiry = []
+        self._opened = 0
+        self._stats = {
+            "seen": 0,
+            "emitted": 0,
+            "suppressed": 0,
+            "rollups": 0,
+            "expired": 0,
+            "evicted": 0,
+        }
+
+    @staticmethod
+    def key(alert):
+        rules = alert.get("triggered_rules") or ["NO_RULE"]
+        return (
+            alert.get("src_ip", "unknown"),
+            alert.get("dst_ip", "unknown"),
+            ",".join(sorted(rules)),
+            alert.get("threat_label", "unknown"),
+        )
+
+    def process(self, alert, now=None):
+        """
+        Return the records to emit for this alert (possibly none).
+        Windows run on the alert's event time unless `now` is given.
+        """
+        now = alert_time(alert) if now is None else now
+        emitted = self._expire(now)
+        self._stats["seen"] += 1
+
+        key = self.key(alert)
+        window = self._windows.get(key)
+
+        if window is None:
+            while len(self._windows) >= self.max_keys:
+                _, oldest = self._windows.popitem(last=False)
+                self._stats["evicted"] += 1
+                emitted.extend(self._rollup(oldest))
+
+            self._opened += 1
+            self._windows[key] = {
+                "alert": alert,
+                "opened": now,
+                "last_seen": now,
+                "suppressed": 0,
+                "rollups": 0,
+                "seq": self._opened,
+            }
+            heapq.heappush(self._expiry, (now, self._opened, key))
+            if len(self._expiry) > 2 * max(self.max_keys, 1):
+                self._expiry = [(w["opened"], w["seq"], k) for k, w in self._windows.items()]
+                heapq.heapify(self._expiry)
+            self._stats["emitted"] += 1
+            emitted.append(alert)
+            return emitted
+
+        window["suppressed"] += 1
+        window["last_seen"] = now
+        self._stats["suppressed"] += 1
+
+        if window["suppressed"] >= self.rollup_every:
+            emitted.extend(self._rollup(window))
+
+        return emitted
+
+    def flush(self):
+        """Close every open window and return the pending roll-ups."""
+        emitted = []
+        while self._windows:
+            _, window = self._windows.popitem(last=False)
+            emitted.extend(self._rollup(window))
+        self._expiry = []
+        return emitted
+
+    def stats(self):
+        stats = dict(self._stats)
+        stats["active_keys"] = len(self._windows)
+        stats["suppression_ratio"] = (
+            round(stats["suppressed"] / stats["seen"], 4) if stats["seen"] else 0.0
+        )
+        return stats
+
+    def _expire(self, now):
+        emitted = []
+        while self._expiry and now - self._expiry[0][0] >= self.ttl:
+            _, seq, key = heapq.heappop(self._expiry)
+            window = self._windows.get(key)
+            if window is None or window["seq"] != seq:
+                # Evicted, or expired and reopened since
+                continue
+            del self._windows[key]
+            self._stats["expired"] += 1
+            emitted.extend(self._rollup(window))
+        return emitted
+
+    def _rollup(self, window):
+        if window["suppressed"] == 0:
+            return []
+
+        first = window["alert"]
+        window["rollups"] += 1
+        rollup = {
+            **first,
+            "alert_id": f"{first['alert_id']}-R{window['rollups']}",
+            "alert_type": "rollup",
+            "suppressed_count": window["suppressed"],
+            "window_start": to_iso(window["opened"]),
+            "window_end": to_iso(window["last_seen"]),
+            "summary": f"{first['summary']} (+{window['suppressed']} duplicates suppressed)",
+        }
+        window["suppressed"] = 0
+        self._stats["rollups"] += 1
+        self._stats["emitted"] += 1
+        return [rollup]
+
+
+def print_suppression_stats(suppressor):
+    stats = suppressor.stats()
+    metrics.inc("alerts_suppressed_total", stats["suppressed"], stage="alerting")
+    print(
+        f"[+] Suppression: {stats['seen']} seen, {stats['emitted']} emitted, "
+        f"{stats['suppressed']} suppressed ({stats['suppression_ratio']:.1%}), "
+        f"{stats['rollups']} roll-ups, {stats['evicted']} evicted"
+    )
+
+
 # =========================
 # ALERT GENERATION
 # =========================
-def generate_alerts():
-    df = pd.read_csv(INPUT_FILE)
+def generate_alerts(suppressor=None):
+    df = flow_store.read_flows(INPUT_FILE)
 
     print("[+] Loaded labeled flows:", len(df))
+    metrics.inc("flows_processed_total", len(df), stage="alerting")
 
     alerts = []
     alert_id = 1
@@ -126,15 +327,20 @@ def generate_alerts():
 
         confidence = calculate_confidence(final_score, len(triggered_rules))
 
+        first_seen, last_seen = flow_event_times(row, time.time())
 
         alert = {
             "alert_id": f"ALERT-{alert_id:04d}",
-            "timestamp": datetime.utcnow().isoformat() + "Z",
+            "timestamp": to_iso(first_seen),
+            "event_time": first_seen,
+            "first_seen": first_seen,
+            "last_seen": last_seen,
             "src_ip": row.get("src_ip", "unknown"),
             "dst_ip": row.get("dst_ip", "unknown"),
             "src_port": int(row.get("src_port", -1)),
             "dst_port": int(row.get("dst_port", -1)),
             "protocol": row.get("protocol", "unknown"),
+            "dns_query": dns_query_of(row.get("dns_query")),
             "threat_label": row["threat_label"],
             "threat_type": determine_threat_type(row["threat_label"]),
             "severity": severity,
@@ -150,18 +356,317 @@ def generate_alerts():
             )
         }
 
-        alerts.append(alert)
+        if suppressor is None:
+            alerts.append(alert)
+        else:
+            alerts.extend(suppressor.process(alert))
         alert_id += 1
 
+    if suppressor is not None:
+        alerts.extend(suppressor.flush())
+
     # =========================
     # WRITE ALERTS
     # =========================
-    with open(OUTPUT_FILE, "w") as f:
-        json.dump(alerts, f, indent=2)
+    write_alerts_json(alerts, OUTPUT_FILE)
 
+    metrics.inc("alerts_emitted_total", len(alerts), stage="alerting")
     print(f"[+] Alerts generated: {len(alerts)}")
     print(f"[+] Alerts written to: {OUTPUT_FILE}")
+    if suppressor is not None:
+        print_suppression_stats(suppressor)
+
+
+# =========================
+# BATCH / STREAMING ALERT GENERATION
+# =========================
+# Feature indicators in the order extract_indicators() emits them
+FEATURE_INDICATORS = [
+    ("high packet count", lambda df: _column(df, "packet_count", 0) > 1000),
+    ("short-lived high-volume flow", lambda df: _column(df, "flow_duration", 0) < 1),
+    ("low inter-arrival variance", lambda df: _column(df, "avg_inter_arrival_time", 1) < 0.01),
+]
+FALLBACK_INDICATOR = "statistical anomaly in flow behavior"
+
+SEVERITY_EDGES = [low for low, _, _ in SEVERITY_BANDS] + [SEVERITY_BANDS[-1][1]]
+SEVERITY_LABELS = [severity for _, _, severity in SEVERITY_BANDS]
+
+
+def dns_query_of(value):
+    """DNS query name of a flow row, None when the flow carried none (NaN after a CSV round trip)."""
+    return value if isinstance(value, str) and value else None
+
+
+def _column(df, name, default):
+    return df.get(name, pd.Series(default, index=df.index))
+
+
+def _bit_codes(masks):
+    """Pack a list of boolean masks into one integer code per row."""
+    codes = np.zeros(len(masks[0]) if masks else 0, dtype=np.int64)
+    for bit, mask in enumerate(masks):
+        codes |= np.asarray(mask, dtype=np.int64) << bit
+    return codes
+
+
+def map_severity_batch(scores: pd.Series) -> pd.Series:
+    """Vectorized map_severity() using the same SEVERITY_BANDS."""
+    severity = pd.cut(scores, bins=SEVERITY_EDGES, labels=SEVERITY_LABELS, right=False)
+    return severity.astype(object).where(severity.notna(), "UNKNOWN")
+
+
+def build_alert_frame(df: pd.DataFrame, start_id: int = 1, now: float = None) -> pd.DataFrame:
+    """
+    Build alert records for a chunk of labeled flows with column operations.
+
+    Produces the same fields as generate_alerts(); indicators are ordered
+    feature-first then rule indicators (deduplicated) so output is stable.
+    Flows without first_seen/last_seen use `now` (default: current time).
+    """
+    df = df[df["threat_label"] != "BENIGN"]
+    if df.empty:
+        return pd.DataFrame()
+
+    now = time.time() if now is None else now
+    first_seen = _column(df, "first_seen", now).astype(float).fillna(now)
+    last_seen = _column(df, "last_seen", np.nan).astype(float).fillna(first_seen)
+    timestamp = pd.to_datetime(first_seen, unit="s", utc=True).dt.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+    labels = df["threat_label"].astype(str)
+
+    # Rules: one boolean mask per rule, boosts summed with a dot product
+    rule_masks, rule_meta = [], []
+    timed = metrics.enabled()
+    for rule in BATCH_RULES:
+        if timed:
+            started = time.perf_counter()
+            mask, metadata = rule(df)
+            _record_rule(rule, time.perf_counter() - started, int(np.count_nonzero(mask)), len(df))
+        else:
+            mask, metadata = rule(df)
+        rule_masks.append(mask)
+        rule_meta.append(metadata)
+
+    boosts = np.array([m.get("severity_boost", 0.0) for m in rule_meta])
+    rule_matrix = np.column_stack(rule_masks) if rule_masks else np.zeros((len(df), 0), dtype=bool)
+    rule_boost = rule_matrix.astype(float) @ boosts if len(boosts) else 0.0
+    rule_count = rule_matrix.sum(axis=1)
+
+    base_score = _column(df, "final_threat_score", 0.0).astype(float).to_numpy()
+    final_score = np.minimum(base_score + rule_boost, 1.0)
+    confidence = np.round(np.minimum(np.minimum(final_score, 1.0) + 0.1 * rule_count, 1.0), 2)
+
+    # Triggered rules and indicator text depend only on which flags are set,
+    # so render each distinct combination once and map it back to the rows
+    rule_codes = _bit_codes(rule_masks)
+    rules_by_code = {
+        code: [m["rule"] for bit, m in enumerate(rule_meta) if code >> bit & 1]
+        for code in np.unique(rule_codes)
+    }
+
+    feature_masks = [test(df).to_numpy() for _, test in FEATURE_INDICATORS]
+    indicator_codes = _bit_codes(feature_masks) | (rule_codes << len(feature_masks))
+    reasons_by_code = {}
+    for code in np.unique(indicator_codes):
+        found = [name for bit, (name, _) in enumerate(FEATURE_INDICATORS) if code >> bit & 1]
+        found = found or [FALLBACK_INDICATOR]
+        rule_bits = code >> len(FEATURE_INDICATORS)
+        found += [m.get("indicator") for bit, m in enumerate(rule_meta) if rule_bits >> bit & 1]
+        reasons_by_code[code] = ", ".join(dict.fromkeys(found))
+
+    threat_types = {label: determine_threat_type(label) for label in labels.unique()}
+
+    src_ip = _column(df, "src_ip", "unknown").astype(str)
+    dst_ip = _column(df, "dst_ip", "unknown").astype(str)
+    src_port = _column(df, "src_port", -1).astype(int)
+    dst_port = _column(df, "dst_port", -1).astype(int)
+    protocol = _column(df, "protocol", "unknown").astype(str)
+    dns_query = np.array([dns_query_of(q) for q in _column(df, "dns_query", None)], dtype=object)
+    severity = map_severity_batch(pd.Series(final_score, index=df.index))
+    reason = pd.Series(indicator_codes, index=df.index).map(reasons_by_code)
+
+    alerts = pd.DataFrame({
+        "alert_id": [f"ALERT-{i:04d}" for i in range(start_id, start_id + len(df))],
+        "timestamp": timestamp.to_numpy(),
+        "event_time": first_seen.to_numpy(),
+        "first_seen": first_seen.to_numpy(),
+        "last_seen": last_seen.to_numpy(),
+        "src_ip": src_ip.to_numpy(),
+        "dst_ip": dst_ip.to_numpy(),
+        "src_port": src_port.to_numpy(),
+        "dst_port": dst_port.to_numpy(),
+        "protocol": protocol.to_numpy(),
+        "dns_query": dns_query,
+        "threat_label": labels.to_numpy(),
+        "threat_type": labels.map(threat_types).to_numpy(),
+        "severity": severity.to_numpy(),
+        "final_threat_score": np.round(final_score, 3),
+        "confidence": confidence,
+        "triggered_rules": pd.Series(rule_codes).map(rules_by_code).to_numpy(),
+        "reason": (labels + " detected due to: " + reason).to_numpy(),
+        "summary": (
+            severity + " alert: " + labels
+            + " from " + src_ip + ":" + src_port.astype(str)
+            + " → " + dst_ip + ":" + dst_port.astype(str)
+            + " over " + protocol
+        ).to_numpy(),
+    })
+
+    return alerts
+
+
+def iter_alert_chunks(input_file=INPUT_FILE, chunksize=CHUNK_SIZE):
+    """Yield alert DataFrames chunk by chunk with continuous alert IDs."""
+    return alert_chunks(flow_store.iter_flows(input_file, chunksize))
+
+
+def frame_chunks(df, chunksize=CHUNK_SIZE):
+    """Split an in-memory flow table into row slices of at most chunksize."""
+    for start in range(0, len(df), chunksize):
+        yield df.iloc[start:start + chunksize]
+
+
+def alert_chunks(chunks):
+    """Yield alert DataFrames for an iterable of flow chunks with continuous alert IDs."""
+    next_id = 1
+
+    for chunk in chunks:
+        metrics.inc("flows_processed_total", len(chunk), stage="alerting")
+        with metrics.timer("chunk_seconds", stage="alerting"):
+            alerts = build_alert_frame(chunk, start_id=next_id)
+        if alerts.empty:
+            continue
+        next_id += len(alerts)
+        yield alerts
+
+
+def generate_alerts_batch(input_file=INPUT_FILE, output_file=NDJSON_OUTPUT_FILE, chunksize=CHUNK_SIZE,
+                          suppressor=None, sinks=()):
+    """
+    Streaming alert generation.
+
+    Reads labeled flows in chunks, builds alerts with vectorized column
+    operations and appends them as NDJSON (one alert per line). Each chunk is
+    flushed before the next is read, so memory stays bounded by chunksize and
+    consumers can tail the file while the run is in progress.
+
+    With a suppressor, each chunk's alerts pass through it before writing.
+    Every written alert is also emitted to each sink in `sinks`
+    (see detection_engine.scoring.alert_sinks); the caller owns and closes them.
+    """
+    total = 0
+
+    with open(output_file, "w", encoding="utf-8") as f:
+        for alerts in iter_alert_chunks(input_file, chunksize):
+            if suppressor is None and not sinks:
+                f.write(alerts.to_json(orient="records", lines=True, force_ascii=False))
+                total += len(alerts)
+            else:
+                records = _records(alerts)
+                if suppressor is not None:
+                    records = _suppress(records, suppressor)
+                total += _write_ndjson(f, records, sinks)
+            f.flush()
+
+        if suppressor is not None:
+            total += _write_ndjson(f, suppressor.flush(), sinks)
+
+    metrics.inc("alerts_emitted_total", total, stage="alerting")
+    print(f"[+] Alerts generated: {total}")
+    print(f"[+] Alerts streamed to: {output_file}")
+    if suppressor is not None:
+        print_suppression_stats(suppressor)
+    return total
+
+
+def alerts_from_frame(df, chunksize=CHUNK_SIZE, suppressor=None):
+    """
+    In-memory counterpart of generate_alerts_batch(): alert records for a
+    labeled flow table, built chunk by chunk and passed through the
+    suppressor when one is given.
+    """
+    alerts = []
+    for chunk in alert_chunks(frame_chunks(df, chunksize)):
+        records = _records(chunk)
+        alerts.extend(records if suppressor is None else _suppress(records, suppressor))
+    if suppressor is not None:
+        alerts.extend(suppressor.flush())
+
+    metrics.inc("alerts_emitted_total", len(alerts), stage="alerting")
+    return alerts
+
+
+def write_alerts_json(alerts, output_file=OUTPUT_FILE):
+    with open(output_file, "w") as f:
+        json.dump(alerts, f, indent=2)
+
+
+def _records(alerts):
+    # Round-trip through JSON so records hold plain Python types
+    return json.loads(alerts.to_json(orient="records", force_ascii=False))
+
+
+def _suppress(records, suppressor):
+    for alert in records:
+        yield from suppressor.process(alert)
+
+
+def _write_ndjson(f, records, sinks=()):
+    count = 0
+    for record in records:
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        for sink in sinks:
+            sink.emit(record)
+        count += 1
+    return count
+
+
+def read_alerts_ndjson(path=NDJSON_OUTPUT_FILE):
+    """Yield alerts from an NDJSON file one at a time."""
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate SentinelHunt alerts from labeled flows")
+    parser.add_argument("--stream", action="store_true", help="vectorized chunked NDJSON output")
+    parser.add_argument("--suppress", action="store_true", help="collapse duplicate alerts")
+    parser.add_argument("--ndjson-sink", metavar="PATH", help="rotating NDJSON sink (with --stream)")
+    parser.add_argument("--sqlite-sink", metavar="PATH", help="SQLite sink (with --stream)")
+    parser.add_argument("--webhook-sink", metavar="URL", help="HTTP webhook sink (with --stream)")
+    parser.add_argument("--store", action="store_true", help="write alerts into the query store (with --stream)")
+    return parser.parse_args()
+
+
+def build_sinks(args):
+    sinks = []
+    if args.ndjson_sink:
+        sinks.append(alert_sinks.RotatingNDJSONSink(args.ndjson_sink))
+    if args.sqlite_sink:
+        sinks.append(alert_sinks.SQLiteSink(args.sqlite_sink))
+    if args.webhook_sink:
+        # A slow webhook must never hold up detection
+        sinks.append(alert_sinks.WebhookSink(args.webhook_sink, policy="drop"))
+    if args.store:
+        from detection_engine.query_store import QueryStoreSink
+        sinks.append(QueryStoreSink())
+    return sinks
 
 
 if __name__ == "__main__":
-    generate_alerts()
+    args = parse_args()
+    suppressor = AlertSuppressor() if args.suppress else None
+
+    with metrics.stage("alerting"):
+        if args.stream:
+            sinks = build_sinks(args)
+            try:
+                generate_alerts_batch(suppressor=suppressor, sinks=sinks)
+            finally:
+                alert_sinks.close_all(sinks)
+            for sink in sinks:
+                print(f"[+] {type(sink).__name__}: {sink.stats()}")
+        else:
+            generate_alerts(suppressor=suppressor)
@@ -0,0 +1,352 @@
+"""
+Alert Sinks - Batched, Backpressure-Aware Alert Delivery
+
+Purpose:
+- Decouple alert generation from alert delivery
+- Batch writes by size and time so every sink does bulk I/O
+- Bound memory with a fixed-size queue per sink and a defined overflow policy
+
+Each sink owns a worker thread that drains its queue. emit() never waits on
+the downstream consumer longer than the configured policy allows:
+- "block": wait up to block_timeout seconds for queue space, then drop
+- "drop":  drop the alert immediately when the queue is full
+Dropped alerts are counted in stats() so loss is visible, never silent.
+"""
+
+import http.client
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from urllib.parse import urlsplit
+
+# ========================================
+# DEFAULTS
+# ========================================
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_FLUSH_INTERVAL = 1.0
+DEFAULT_MAX_QUEUE = 10_000
+DEFAULT_BLOCK_TIMEOUT = 0.5
+
+POLICIES = ("block", "drop")
+
+_STOP = object()
+
+
+# ========================================
+# BASE SINK
+# ========================================
+class AlertSink:
+    """
+    Base class for batched sinks. Subclasses implement write_batch() and may
+    override open()/close_resources(), which run on the worker thread.
+    """
+
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE, flush_interval=DEFAULT_FLUSH_INTERVAL,
+                 max_queue=DEFAULT_MAX_QUEUE, policy="block", block_timeout=DEFAULT_BLOCK_TIMEOUT):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown overflow policy: {policy} (expected one of {POLICIES})")
+
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.policy = policy
+        self.block_timeout = block_timeout
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._stats = {
+            "emitted": 0,
+            "written": 0,
+            "dropped": 0,
+            "batches": 0,
+            "errors": 0,
+        }
+        self._closed = False
+        self._worker = threading.Thread(target=self._run, name=type(self).__name__, daemon=True)
+        self._worker.start()
+
+    # ----------------------------------------
+    # Producer side
+    # ----------------------------------------
+    def emit(self, alert):
+        """Queue one alert. Returns False if it was dropped."""
+        if self._closed:
+            raise RuntimeError("emit() on a closed sink")
+
+        if not self._worker.is_alive():
+            # The worker failed (e.g. open() raised); nothing drains the queue
+            self._count("dropped")
+            return False
+
+        try:
+            if self.policy == "block":
+                self._queue.put(alert, timeout=self.block_timeout)
+            else:
+                self._queue.put_nowait(alert)
+        except queue.Full:
+            self._count("dropped")
+            return False
+
+        self._count("emitted")
+        return True
+
+    def emit_many(self, alerts):
+        for alert in alerts:
+            self.emit(alert)
+
+    def close(self):
+        """Flush everything queued, stop the worker and release resources."""
+        if self._closed:
+            return
+        self._closed = True
+        # Only a live worker makes room in a full queue
+        while self._worker.is_alive():
+            try:
+                self._queue.put(_STOP, timeout=self.block_timeout)
+                break
+            except queue.Full:
+                continue
+        self._worker.join()
+
+        # Alerts a failed worker never took off the queue are lost
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                self._count("dropped")
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats["queue_depth"] = self._queue.qsize()
+        return stats
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ----------------------------------------
+    # Worker side
+    # ----------------------------------------
+    def open(self):
+        pass
+
+    def write_batch(self, batch):
+        raise NotImplementedError
+
+    def close_resources(self):
+        pass
+
+    def _run(self):
+        try:
+            self.open()
+        except Exception as e:
+            self._count("errors")
+            print(f"[!] {type(self).__name__} failed to open: {e}")
+            self.close_resources()
+            return
+
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+
+        try:
+            while True:
+                timeout = max(deadline - time.monotonic(), 0)
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    item = None
+
+                if item is _STOP:
+                    break
+                if item is not None:
+                    batch.append(item)
+
+                if len(batch) >= self.batch_size or (batch and time.monotonic() >= deadline):
+                    self._flush(batch)
+                    batch = []
+                if time.monotonic() >= deadline:
+                    deadline = time.monotonic() + self.flush_interval
+
+            # Drain anything queued between the stop request and now
+            while True:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is not _STOP:
+                    batch.append(item)
+            self._flush(batch)
+        finally:
+            self.close_resources()
+
+    def _flush(self, batch):
+        if not batch:
+            return
+        try:
+            self.write_batch(batch)
+        except Exception as e:
+            self._count("errors")
+            print(f"[!] {type(self).__name__} failed to write {len(batch)} alerts: {e}")
+            return
+        self._count("written", len(batch))
+        self._count("batches")
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._stats[name] += amount
+
+
+# ========================================
+# ROTATING NDJSON FILES
+# ========================================
+class RotatingNDJSONSink(AlertSink):
+    """
+    Appends alerts as NDJSON and rotates when the file exceeds max_bytes:
+    alerts.ndjson -> alerts.ndjson.1 -> ... -> alerts.ndjson.<backup_count>
+    """
+
+    def __init__(self, path, max_bytes=100 * 1024 * 1024, backup_count=5, **kwargs):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self._file = None
+        super().__init__(**kwargs)
+
+    def open(self):
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    def write_batch(self, batch):
+        self._file.write("".join(json.dumps(a, ensure_ascii=False) + "\n" for a in batch))
+        self._file.flush()
+        if self._file.tell() >= self.max_bytes:
+            self._rotate()
+
+    def close_resources(self):
+        if self._file:
+            self._file.close()
+
+    def _rotate(self):
+        self._file.close()
+        for index in range(self.backup_count - 1, 0, -1):
+            source = f"{self.path}.{index}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{index + 1}")
+        if self.backup_count > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self._file = open(self.path, "a", encoding="utf-8")
+
+
+# ========================================
+# SQLITE (BULK INSERTS)
+# ========================================
+class SQLiteSink(AlertSink):
+    """
+    Inserts each batch with one executemany() inside a single transaction.
+    The full alert is kept in `raw` so no field is lost.
+    """
+
+    COLUMNS = [
+        "alert_id", "timestamp", "src_ip", "dst_ip", "src_port", "dst_port",
+        "protocol", "threat_label", "severity", "final_threat_score",
+    ]
+
+    def __init__(self, path, table="alerts", **kwargs):
+        self.path = path
+        self.table = table
+        self._conn = None
+        super().__init__(**kwargs)
+
+    def open(self):
+        # Connection is created on the worker thread, which is the only user
+        self._conn = sqlite3.connect(self.path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.table} ("
+            "alert_id TEXT, timestamp TEXT, src_ip TEXT, dst_ip TEXT, "
+            "src_port INTEGER, dst_port INTEGER, protocol TEXT, threat_label TEXT, "
+            "severity TEXT, final_threat_score REAL, triggered_rules TEXT, raw TEXT)"
+        )
+
+    def write_batch(self, batch):
+        rows = [
+            tuple(a.get(c) for c in self.COLUMNS)
+            + (json.dumps(a.get("triggered_rules", [])), json.dumps(a, ensure_ascii=False))
+            for a in batch
+        ]
+        placeholders = ", ".join("?" * (len(self.COLUMNS) + 2))
+        with self._conn:
+            self._conn.executemany(f"INSERT INTO {self.table} VALUES ({placeholders})", rows)
+
+    def close_resources(self):
+        if self._conn:
+            self._conn.close()
+
+
+# ========================================
+# HTTP WEBHOOK (KEEP-ALIVE)
+# ========================================
+class WebhookSink(AlertSink):
+    """
+    POSTs each batch as a JSON array over a persistent HTTP/1.1 connection.
+    The connection is reused across batches and re-established once on
+    failure before the batch is counted as an error.
+    """
+
+    def __init__(self, url, timeout=5.0, headers=None, **kwargs):
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https"):
+            raise ValueError(f"Unsupported webhook URL: {url}")
+
+        self.url = url
+        self.timeout = timeout
+        self.headers = {"Content-Type": "application/json", "Connection": "keep-alive", **(headers or {})}
+        self._scheme = parts.scheme
+        self._netloc = parts.netloc
+        self._path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        self._conn = None
+        super().__init__(**kwargs)
+
+    def write_batch(self, batch):
+        body = json.dumps(batch, ensure_ascii=False).encode("utf-8")
+
+        for attempt in range(2):
+            try:
+                conn = self._connection()
+                conn.request("POST", self._path, body=body, headers=self.headers)
+                response = conn.getresponse()
+                response.read()
+                if response.status >= 400:
+                    raise RuntimeError(f"webhook returned HTTP {response.status}")
+                return
+            except (http.client.HTTPException, OSError):
+                self._reset()
+                if attempt:
+                    raise
+
+    def close_resources(self):
+        self._reset()
+
+    def _connection(self):
+        if self._conn is None:
+            cls = http.client.HTTPSConnection if self._scheme == "https" else http.client.HTTPConnection
+            self._conn = cls(self._netloc, timeout=self.timeout)
+        return self._conn
+
+    def _reset(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+def close_all(sinks):
+    for sink in sinks:
+        sink.close()
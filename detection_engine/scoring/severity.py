@@ -1,20 +1,14 @@
-import pandas as pd
+from detection_engine import flow_store, metrics
 
 # =========================
 # CONFIG
 # =========================
-INPUT_FILE = "feature_engineering/outputs/flow_threat_scores.csv"
-OUTPUT_FILE = "feature_engineering/outputs/flow_threat_scores.csv"
+INPUT_FILE = flow_store.intermediate_path("feature_engineering/outputs/flow_threat_scores.csv")
+OUTPUT_FILE = flow_store.intermediate_path("feature_engineering/outputs/flow_threat_scores.csv")
 
 LOW_THRESHOLD = 0.30
 HIGH_THRESHOLD = 0.60
 
-# =========================
-# LOAD DATA
-# =========================
-df = pd.read_csv(INPUT_FILE)
-
-print("[+] Loaded flows:", len(df))
 
 # =========================
 # SEVERITY CLASSIFICATION
@@ -27,16 +21,36 @@ def classify_severity(score):
     else:
         return "LOW"
 
-df["severity"] = df["final_threat_score"].apply(classify_severity)
 
-# =========================
-# SEVERITY STATS
-# =========================
-print("\n[+] Severity distribution:")
-print(df["severity"].value_counts())
+def add_severity(df):
+    df["severity"] = df["final_threat_score"].apply(classify_severity)
+    metrics.inc("flows_processed_total", len(df), stage="severity")
+    return df
 
-# =========================
-# SAVE OUTPUT
-# =========================
-df.to_csv(OUTPUT_FILE, index=False)
-print(f"\n[+] Severity labels added and saved to {OUTPUT_FILE}")
+
+def main():
+    # =========================
+    # LOAD DATA
+    # =========================
+    df = flow_store.read_flows(INPUT_FILE)
+
+    print("[+] Loaded flows:", len(df))
+
+    df = add_severity(df)
+
+    # =========================
+    # SEVERITY STATS
+    # =========================
+    print("\n[+] Severity distribution:")
+    print(df["severity"].value_counts())
+
+    # =========================
+    # SAVE OUTPUT
+    # =========================
+    flow_store.write_flows(df, OUTPUT_FILE)
+    print(f"\n[+] Severity labels added and saved to {OUTPUT_FILE}")
+
+
+if __name__ == "__main__":
+    with metrics.stage("severity"):
+        main()
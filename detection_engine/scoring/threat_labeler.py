@@ -1,10 +1,10 @@
-import pandas as pd
+from detection_engine import flow_store, metrics
 
 # =========================
 # CONFIG
 # =========================
-INPUT_FILE = "feature_engineering/outputs/flow_threat_scores.csv"
-OUTPUT_FILE = "feature_engineering/outputs/flow_threat_labeled.csv"
+INPUT_FILE = flow_store.intermediate_path("feature_engineering/outputs/flow_threat_scores.csv")
+OUTPUT_FILE = flow_store.intermediate_path("feature_engineering/outputs/flow_threat_labeled.csv")
 
 # =========================
 # THREAT LABEL LOGIC
@@ -60,19 +60,29 @@ def assign_threat_label(row):
 # =========================
 # MAIN PIPELINE
 # =========================
+def label_frame(df):
+    df["threat_label"] = df.apply(assign_threat_label, axis=1)
+    metrics.inc("flows_processed_total", len(df), stage="labeling")
+    if metrics.enabled():
+        for label, count in df["threat_label"].value_counts().items():
+            metrics.inc("flows_labeled_total", int(count), label=label)
+    return df
+
+
 def label_threats():
-    df = pd.read_csv(INPUT_FILE)
+    df = flow_store.read_flows(INPUT_FILE)
 
     print("[+] Loaded flows:", len(df))
 
-    df["threat_label"] = df.apply(assign_threat_label, axis=1)
+    df = label_frame(df)
 
     print("\n[+] Threat label distribution:")
     print(df["threat_label"].value_counts())
 
-    df.to_csv(OUTPUT_FILE, index=False)
+    flow_store.write_flows(df, OUTPUT_FILE)
     print(f"\n[+] Threat-labeled flows saved to {OUTPUT_FILE}")
 
 
 if __name__ == "__main__":
-    label_threats()
+    with metrics.stage("labeling"):
+        label_threats()
@@ -1,70 +1,18 @@
 import pandas as pd
 from sklearn.preprocessing import MinMaxScaler
 
-# =========================
-# CONFIG
-# =========================
-FLOW_FEATURES_FILE = "feature_engineering/outputs/flow_features_enriched.csv"
-ML_RESULTS_FILE = "ml/models/iforest_results.csv"
-OUTPUT_FILE = "feature_engineering/outputs/flow_threat_scores.csv"
-
-# =========================
-# LOAD DATA
-# =========================
-flows_df = pd.read_csv(FLOW_FEATURES_FILE)
-ml_df = pd.read_csv(ML_RESULTS_FILE)
-
-print("[+] Flow records:", len(flows_df))
-print("[+] ML records:", len(ml_df))
-
-# =========================
-# BASIC SANITY CHECK
-# =========================
-if len(flows_df) != len(ml_df):
-    raise ValueError("Flow records and ML records count mismatch")
-
-# =========================
-# MERGE ML SCORES INTO FLOWS
-# =========================
-# Assumes same ordering (true in your pipeline)
-flows_df["ml_anomaly_score"] = ml_df["iforest_score"]
-
-# =========================
-# NORMALIZE ML SCORE
-# =========================
-ml_scaler = MinMaxScaler()
-flows_df["ml_score_normalized"] = ml_scaler.fit_transform(
-    flows_df[["ml_anomaly_score"]]
-)
+from detection_engine import flow_store, metrics
 
 # =========================
-# NORMALIZE RULE-BASED SCORE
-# =========================
-rule_scaler = MinMaxScaler()
-flows_df["rule_score_normalized"] = rule_scaler.fit_transform(
-    flows_df[["suspicion_score"]]
-)
-
-# =========================
-# SANITY CHECK
+# CONFIG
 # =========================
-print("\n[+] Normalized score statistics:")
-print(
-    flows_df[
-        ["ml_score_normalized", "rule_score_normalized"]
-    ].describe()
-)
+FLOW_FEATURES_FILE = flow_store.intermediate_path("feature_engineering/outputs/flow_features_enriched.csv")
+ML_RESULTS_FILE = flow_store.intermediate_path("ml/models/iforest_results.csv")
+OUTPUT_FILE = flow_store.intermediate_path("feature_engineering/outputs/flow_threat_scores.csv")
 
-# =========================
-# FINAL THREAT SCORE (WEIGHTED FUSION)
-# =========================
 RULE_WEIGHT = 0.6
 ML_WEIGHT = 0.4
 
-flows_df["final_threat_score"] = (
-    RULE_WEIGHT * flows_df["rule_score_normalized"]
-    + ML_WEIGHT * flows_df["ml_score_normalized"]
-)
 
 # =========================
 # THREAT SCORE BAND (HUMAN READABLE)
@@ -79,19 +27,103 @@ def score_band(score):
     else:
         return "LOW"
 
-flows_df["threat_score_band"] = flows_df["final_threat_score"].apply(score_band)
 
-# =========================
-# FINAL SCORE STATS
-# =========================
-print("\n[+] Final threat score statistics:")
-print(flows_df["final_threat_score"].describe())
+def _min_max(column, value_range):
+    if value_range is None:
+        return MinMaxScaler().fit_transform(column)
+    # Fitted on the end points, the scaler maps exactly as if fitted on a
+    # table with that minimum and maximum; values outside are clipped
+    low, high = value_range
+    scaler = MinMaxScaler(clip=True).fit(pd.DataFrame({column.columns[0]: [low, high]}))
+    return scaler.transform(column)
 
-print("\n[+] Threat score band distribution:")
-print(flows_df["threat_score_band"].value_counts())
 
-# =========================
-# SAVE OUTPUT
-# =========================
-flows_df.to_csv(OUTPUT_FILE, index=False)
-print(f"\n[+] Threat-score-ready flows saved to {OUTPUT_FILE}")
+def score_flows(flows_df, ml_df, ml_range=None, rule_range=None):
+    """
+    Fuse the rule-based suspicion score and the Isolation Forest score of
+    each flow into final_threat_score and its band.
+
+    Both scores are min-max normalized over this table, or against fixed
+    (min, max) ranges when given, so separately scored tables share one scale.
+    """
+    # =========================
+    # BASIC SANITY CHECK
+    # =========================
+    if len(flows_df) != len(ml_df):
+        raise ValueError("Flow records and ML records count mismatch")
+
+    # =========================
+    # MERGE ML SCORES INTO FLOWS
+    # =========================
+    # Assumes same ordering (true in your pipeline)
+    flows_df["ml_anomaly_score"] = ml_df["iforest_score"].to_numpy()
+
+    # =========================
+    # NORMALIZE ML SCORE
+    # =========================
+    flows_df["ml_score_normalized"] = _min_max(
+        flows_df[["ml_anomaly_score"]], ml_range
+    )
+
+    # =========================
+    # NORMALIZE RULE-BASED SCORE
+    # =========================
+    flows_df["rule_score_normalized"] = _min_max(
+        flows_df[["suspicion_score"]], rule_range
+    )
+
+    # =========================
+    # FINAL THREAT SCORE (WEIGHTED FUSION)
+    # =========================
+    flows_df["final_threat_score"] = (
+        RULE_WEIGHT * flows_df["rule_score_normalized"]
+        + ML_WEIGHT * flows_df["ml_score_normalized"]
+    )
+
+    flows_df["threat_score_band"] = flows_df["final_threat_score"].apply(score_band)
+
+    metrics.inc("flows_processed_total", len(flows_df), stage="threat_score")
+    return flows_df
+
+
+def main():
+    # =========================
+    # LOAD DATA
+    # =========================
+    flows_df = flow_store.read_flows(FLOW_FEATURES_FILE)
+    ml_df = flow_store.read_flows(ML_RESULTS_FILE, columns=["iforest_score"])
+
+    print("[+] Flow records:", len(flows_df))
+    print("[+] ML records:", len(ml_df))
+
+    flows_df = score_flows(flows_df, ml_df)
+
+    # =========================
+    # SANITY CHECK
+    # =========================
+    print("\n[+] Normalized score statistics:")
+    print(
+        flows_df[
+            ["ml_score_normalized", "rule_score_normalized"]
+        ].describe()
+    )
+
+    # =========================
+    # FINAL SCORE STATS
+    # =========================
+    print("\n[+] Final threat score statistics:")
+    print(flows_df["final_threat_score"].describe())
+
+    print("\n[+] Threat score band distribution:")
+    print(flows_df["threat_score_band"].value_counts())
+
+    # =========================
+    # SAVE OUTPUT
+    # =========================
+    flow_store.write_flows(flows_df, OUTPUT_FILE)
+    print(f"\n[+] Threat-score-ready flows saved to {OUTPUT_FILE}")
+
+
+if __name__ == "__main__":
+    with metrics.stage("threat_score"):
+        main()
@@ -0,0 +1,150 @@
+"""
+Content-addressed cache of pipeline stage outputs.
+
+A stage's key hashes its name, the source of the code that implements it,
+its runtime config and the keys of the stages it reads from. Keys therefore
+chain: editing a rule changes only the alerting and aggregation keys, and
+every stage upstream is served from the cache instead of re-run. The chain
+is rooted in a content hash of the capture (or flow-feature table) itself.
+
+Entries are pickles, one file per key, in a directory that only this cache
+writes to. A hit refreshes the entry's mtime; after every write, entries
+unused for longer than max_age_days are removed, then the least recently
+used ones until the directory fits in max_bytes.
+"""
+
+import hashlib
+import json
+import os
+import pickle
+import time
+from pathlib import Path
+
+import pandas as pd
+
+from detection_engine import metrics
+
+MAX_CACHE_BYTES = 10 * 1024 ** 3
+MAX_CACHE_AGE_DAYS = 14
+
+
+# =========================
+# DIGESTS
+# =========================
+def file_digest(path):
+    """SHA-256 of a file's contents (of every file below it, for a directory)."""
+    path = Path(path)
+    files = sorted(p for p in path.rglob("*") if p.is_file()) if path.is_dir() else [path]
+
+    digest = hashlib.sha256()
+    for file in files:
+        digest.update(file.relative_to(path).as_posix().encode() if path.is_dir() else b"")
+        with open(file, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def frame_digest(df):
+    """SHA-256 of a DataFrame's values, index, column names and dtypes."""
+    digest = hashlib.sha256()
+    digest.update(json.dumps([list(map(str, df.columns)), list(map(str, df.dtypes))]).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def source_digest(paths):
+    """SHA-256 of the Python sources at `paths` (files, or every .py below a directory)."""
+    files = []
+    for path in map(Path, paths):
+        files.extend(sorted(path.rglob("*.py")) if path.is_dir() else [path])
+
+    digest = hashlib.sha256()
+    for path in files:
+        digest.update(path.name.encode())
+        digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+def stage_key(stage, code, config, inputs):
+    """Cache key of one stage run: its code, config and the keys/digests of its inputs."""
+    payload = json.dumps([stage, code, config, inputs], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+# =========================
+# CACHE
+# =========================
+class StageCache:
+    """Directory of pickled stage outputs bounded by total size and entry age."""
+
+    def __init__(self, directory, max_bytes=MAX_CACHE_BYTES, max_age_days=MAX_CACHE_AGE_DAYS):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.max_age = max_age_days * 86400
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, key):
+        return self.directory / f"{key}.pkl"
+
+    def get(self, key, stage=None):
+        """Cached output for `key`, or None."""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                value = pickle.load(f)
+        except FileNotFoundError:
+            value = None
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            # Truncated or written by incompatible code; rebuild it
+            path.unlink(missing_ok=True)
+            value = None
+
+        if value is None:
+            self.misses += 1
+            metrics.inc("stage_cache_misses_total", stage=stage)
+            return None
+
+        os.utime(path)
+        self.hits += 1
+        metrics.inc("stage_cache_hits_total", stage=stage)
+        return value
+
+    def put(self, key, value):
+        path = self._path(key)
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def evict(self):
+        """Drop expired entries, then least recently used ones over max_bytes; returns the count."""
+        entries = []
+        for path in self.directory.glob("*.pkl"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+
+        cutoff = time.time() - self.max_age
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for mtime, size, path in entries:
+            if mtime >= cutoff and total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+            removed += 1
+        return removed
+
+    def size(self):
+        return sum(path.stat().st_size for path in self.directory.glob("*.pkl"))
+
+    def clear(self):
+        for path in self.directory.glob("*.pkl"):
+            path.unlink(missing_ok=True)
@@ -0,0 +1,138 @@
+# Tests for the vectorized / streaming alert path in alert_generator.
+
+import pandas as pd
+
+from detection_engine.scoring import alert_generator
+
+
+def sample_flows():
+    return pd.DataFrame([
+        {"src_ip": "10.0.0.5", "dst_ip": "10.0.0.1", "src_port": 40000, "dst_port": 53,
+         "protocol": "UDP", "packet_count": 4, "packets_per_second": 12.0, "dns_entropy": 4.1,
+         "dns_subdomain_depth": 4, "flag_high_dns_entropy": True, "flag_deep_dns": True,
+         "final_threat_score": 0.7, "threat_label": "DNS_TUNNEL"},
+        {"src_ip": "10.0.0.6", "dst_ip": "10.0.0.2", "src_port": 40001, "dst_port": 443,
+         "protocol": "TCP", "packet_count": 5000, "packets_per_second": 1.0, "dns_entropy": 0.0,
+         "dns_subdomain_depth": 0, "flag_high_dns_entropy": False, "flag_deep_dns": False,
+         "final_threat_score": 0.2, "threat_label": "PORT_SCAN", "dst_port_count": 25},
+        {"src_ip": "10.0.0.7", "dst_ip": "10.0.0.3", "src_port": 40002, "dst_port": 80,
+         "protocol": "TCP", "packet_count": 3, "packets_per_second": 1.0, "dns_entropy": 0.0,
+         "dns_subdomain_depth": 0, "flag_high_dns_entropy": False, "flag_deep_dns": False,
+         "final_threat_score": 0.1, "threat_label": "BENIGN", "dst_port_count": 1},
+    ])
+
+
+def test_batch_matches_row_path(tmp_path, monkeypatch):
+    df = sample_flows()
+    input_file = tmp_path / "flows.csv"
+    df.to_csv(input_file, index=False)
+
+    monkeypatch.setattr(alert_generator, "INPUT_FILE", str(input_file))
+    monkeypatch.setattr(alert_generator, "OUTPUT_FILE", str(tmp_path / "alerts.json"))
+    alert_generator.generate_alerts()
+    expected = pd.read_json(alert_generator.OUTPUT_FILE).to_dict("records")
+
+    output_file = tmp_path / "alerts.ndjson"
+    total = alert_generator.generate_alerts_batch(str(input_file), str(output_file), chunksize=1)
+    streamed = list(alert_generator.read_alerts_ndjson(str(output_file)))
+
+    assert total == len(expected) == len(streamed) == 2
+    for row_alert, batch_alert in zip(expected, streamed):
+        for key in ("alert_id", "severity", "final_threat_score", "confidence",
+                    "triggered_rules", "threat_type", "summary", "src_port"):
+            assert row_alert[key] == batch_alert[key]
+        # The row path orders indicators through a set, so compare as sets
+        reasons = [a["reason"].split(": ", 1)[1].split(", ") for a in (row_alert, batch_alert)]
+        assert set(reasons[0]) == set(reasons[1])
+
+
+def test_map_severity_batch_matches_scalar():
+    scores = pd.Series([-0.1, 0.0, 0.29, 0.3, 0.6, 0.79, 0.8, 1.0, 1.5])
+    expected = [alert_generator.map_severity(s) for s in scores]
+    assert list(alert_generator.map_severity_batch(scores)) == expected
+
+
+def make_alert(alert_id, src_ip="10.0.0.5"):
+    return {"alert_id": alert_id, "src_ip": src_ip, "dst_ip": "10.0.0.1",
+            "triggered_rules": ["PORT_SCAN"], "threat_label": "PORT_SCAN",
+            "summary": "scan"}
+
+
+def test_suppressor_rollups_and_ttl():
+    suppressor = alert_generator.AlertSuppressor(ttl=60, max_keys=10, rollup_every=3)
+
+    emitted = []
+    for i in range(7):
+        emitted += suppressor.process(make_alert(f"A-{i}"), now=i)
+
+    # First alert, then a roll-up after every 3 duplicates
+    assert [a["alert_id"] for a in emitted] == ["A-0", "A-0-R1", "A-0-R2"]
+    assert emitted[1]["suppressed_count"] == 3
+
+    # Window expired: the next duplicate opens a fresh window
+    emitted = suppressor.process(make_alert("A-7"), now=100)
+    assert [a["alert_id"] for a in emitted] == ["A-7"]
+
+    suppressor.process(make_alert("A-8"), now=101)
+    flushed = suppressor.flush()
+    assert flushed[0]["suppressed_count"] == 1
+
+    stats = suppressor.stats()
+    assert stats["seen"] == 9 and stats["suppressed"] == 7 and stats["expired"] == 1
+
+
+def test_suppressor_is_bounded():
+    suppressor = alert_generator.AlertSuppressor(ttl=60, max_keys=2, rollup_every=100)
+    for i in range(5):
+        suppressor.process(make_alert(f"A-{i}", src_ip=f"10.0.0.{i}"), now=0)
+
+    assert suppressor.stats()["active_keys"] == 2
+    assert suppressor.stats()["evicted"] == 3
+
+
+def test_suppressor_expires_out_of_order_windows():
+    suppressor = alert_generator.AlertSuppressor(ttl=300, max_keys=10, rollup_every=100)
+
+    # A late key opens behind a younger one and must still expire on its own time
+    suppressor.process(make_alert("A-0", src_ip="10.0.0.1"), now=1000)
+    suppressor.process(make_alert("B-0", src_ip="10.0.0.2"), now=10)
+    suppressor.process(make_alert("B-1", src_ip="10.0.0.2"), now=20)
+
+    emitted = suppressor.process(make_alert("C-0", src_ip="10.0.0.3"), now=400)
+    assert [a["alert_id"] for a in emitted] == ["B-0-R1", "C-0"]
+    assert emitted[0]["suppressed_count"] == 1
+    assert suppressor.stats()["active_keys"] == 2
+
+    # Reopened keys expire by their new window, not the stale heap entry
+    suppressor.process(make_alert("B-2", src_ip="10.0.0.2"), now=450)
+    suppressor.process(make_alert("B-3", src_ip="10.0.0.2"), now=460)
+    emitted = suppressor.process(make_alert("D-0", src_ip="10.0.0.4"), now=700)
+    assert [a["alert_id"] for a in emitted] == ["D-0"]
+    assert suppressor.stats()["active_keys"] == 3
+    emitted = suppressor.process(make_alert("D-1", src_ip="10.0.0.4"), now=750)
+    assert [a["alert_id"] for a in emitted] == ["B-2-R1"]
+
+
+def test_alerts_carry_flow_event_time():
+    df = sample_flows()
+    df["first_seen"] = [1_700_000_000.25, 1_700_000_100.0, 1_700_000_200.0]
+    df["last_seen"] = [1_700_000_005.0, None, 1_700_000_201.0]
+
+    alerts = alert_generator.build_alert_frame(df)
+
+    assert list(alerts["event_time"]) == [1_700_000_000.25, 1_700_000_100.0]
+    assert list(alerts["last_seen"]) == [1_700_000_005.0, 1_700_000_100.0]
+    assert alerts["timestamp"].iloc[0] == "2023-11-14T22:13:20.250000Z"
+
+
+def test_rule_metadata_is_not_shared():
+    from detection_engine.rules import port_scan
+
+    matched, metadata = port_scan.detect({"dst_port_count": 25})
+    metadata["severity_boost"] = 1.0
+    _, metadata = port_scan.detect_batch(sample_flows())
+    metadata["rule"] = "CHANGED"
+
+    assert port_scan.detect({"dst_port_count": 25})[1] == {
+        "rule": "PORT_SCAN", "severity_boost": 0.25, "indicator": "high destination port diversity",
+    }
@@ -0,0 +1,114 @@
+# Tests for batched alert sinks, including the webhook against a local stub server.
+
+import json
+import sqlite3
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from detection_engine.scoring import alert_sinks
+
+
+def make_alerts(count):
+    return [{"alert_id": f"ALERT-{i:04d}", "src_ip": "10.0.0.5", "dst_ip": "10.0.0.1",
+             "severity": "HIGH", "final_threat_score": 0.7, "triggered_rules": ["PORT_SCAN"]}
+            for i in range(count)]
+
+
+def test_rotating_ndjson_sink(tmp_path):
+    path = tmp_path / "alerts.ndjson"
+    with alert_sinks.RotatingNDJSONSink(str(path), max_bytes=500, backup_count=2, batch_size=5) as sink:
+        sink.emit_many(make_alerts(20))
+
+    assert sink.stats()["written"] == 20
+    assert (tmp_path / "alerts.ndjson.1").exists()
+    assert not (tmp_path / "alerts.ndjson.3").exists()
+
+
+def test_sqlite_sink_bulk_inserts(tmp_path):
+    path = tmp_path / "alerts.db"
+    with alert_sinks.SQLiteSink(str(path), batch_size=8) as sink:
+        sink.emit_many(make_alerts(20))
+
+    stats = sink.stats()
+    assert stats["written"] == 20 and stats["batches"] == 3
+
+    conn = sqlite3.connect(str(path))
+    assert conn.execute("SELECT COUNT(*) FROM alerts").fetchone()[0] == 20
+    conn.close()
+
+
+def test_webhook_sink_reuses_connection():
+    received, peers = [], set()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers["Content-Length"]))
+            received.extend(json.loads(body))
+            peers.add(self.client_address)
+            self.send_response(204)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}/alerts"
+        with alert_sinks.WebhookSink(url, batch_size=10) as sink:
+            sink.emit_many(make_alerts(35))
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert len(received) == 35
+    assert sink.stats()["batches"] == 4
+    # All batches travelled over one keep-alive connection
+    assert len(peers) == 1
+
+
+def test_drop_policy_never_blocks():
+    class SlowSink(alert_sinks.AlertSink):
+        def write_batch(self, batch):
+            time.sleep(0.2)
+
+    sink = SlowSink(batch_size=1, max_queue=2, policy="drop")
+    started = time.monotonic()
+    sink.emit_many(make_alerts(50))
+    assert time.monotonic() - started < 0.2
+    sink.close()
+
+    stats = sink.stats()
+    assert stats["dropped"] > 0
+    assert stats["emitted"] + stats["dropped"] == 50
+
+
+def test_close_returns_when_open_fails():
+    release = threading.Event()
+
+    class BrokenSink(alert_sinks.AlertSink):
+        def open(self):
+            release.wait()
+            raise OSError("disk full")
+
+        def write_batch(self, batch):
+            raise AssertionError("never reached")
+
+    sink = BrokenSink(max_queue=2, policy="block", block_timeout=0.01)
+    sink.emit_many(make_alerts(5))
+    assert sink.stats()["queue_depth"] == 2
+
+    # The worker dies with a full queue; close() must not wait for room
+    release.set()
+    closer = threading.Thread(target=sink.close)
+    closer.start()
+    closer.join(timeout=5)
+    assert not closer.is_alive()
+
+    stats = sink.stats()
+    assert stats["errors"] == 1 and stats["written"] == 0
+    assert stats["dropped"] == 5 and stats["queue_depth"] == 0
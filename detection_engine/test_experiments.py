@@ -0,0 +1,176 @@
+# Tests for the experiment tooling (synthetic traffic, benchmark, evaluation, replay).
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from experiments.synthetic_traffic import FLOW_COLUMNS, flow_features, synthesize, write_pcap
+
+KEY = ["src_ip", "dst_ip", "src_port", "dst_port", "protocol"]
+
+
+def test_synthetic_features_match_parse_pcap(tmp_path):
+    from feature_engineering import parse_pcap
+
+    flows, packets = synthesize(400, attack_fraction=0.2, seed=5)
+    assert set(flows["label"]) == {"BENIGN", "PORT_SCAN", "DNS_TUNNELING", "C2_BEACONING", "DATA_EXFILTRATION"}
+    write_pcap(tmp_path / "synthetic.pcap", flows, packets)
+
+    expected = flow_features(flows, packets).sort_values(KEY).reset_index(drop=True)
+    parsed = parse_pcap.build_flow_frame(parse_pcap.load_pcap(str(tmp_path / "synthetic.pcap")))
+    parsed = parsed[FLOW_COLUMNS].sort_values(KEY).reset_index(drop=True)
+
+    pd.testing.assert_frame_equal(parsed, expected, check_exact=True)
+
+
+def test_benchmark_runs_every_stage():
+    from experiments import benchmark
+
+    report = benchmark.benchmark_size(500, repeat=1, seed=7, with_pcap=False, stages=None, keep=False)
+    stages = report["stages"]
+
+    assert report["inputs"]["flows"] == 500
+    assert list(stages) == [name for name, *_ in benchmark.STAGES]
+    assert stages.pop("parse") == {"skipped": "no pcap (run with --pcap)"}
+    for name, result in stages.items():
+        assert "failed" not in result, (name, result)
+        assert result["runs"] == 1 and result["flows_per_second"] > 0
+
+
+def test_pattern_functions_match_the_generator():
+    from experiments import synthetic_traffic as st
+
+    for label, pattern in st.PATTERNS.items():
+        flows = pattern(60, np.random.default_rng(3))
+        method = st.TrafficGenerator.PATTERNS[label]
+        expected = method(st.TrafficGenerator(seed=3), 60, st.START_EPOCH, st.SPAN_SECONDS)
+        assert set(flows["label"]) == {label}
+        for name, values in expected.items():
+            assert np.array_equal(np.asarray(flows[name]), np.asarray(values)), (label, name)
+
+    # Beacons of one campaign are `interval` apart, give or take the jitter
+    beacons = st.beacon_flows(st.BEACON_COUNT, np.random.default_rng(3), interval=60.0)
+    gaps = np.diff(np.asarray(beacons["start"]))
+    assert np.all(np.abs(gaps - 60.0) <= 2 * st.BEACON_JITTER)
+
+
+def test_evaluation_counts_flows_strictly_above_the_threshold():
+    from experiments import evaluation_engine as ee
+
+    scores = [0.2, 0.5, 0.5, 0.7, 0.5, 0.9, 0.1]
+    labels = ["BENIGN", "BENIGN", "PORT_SCAN", "PORT_SCAN", "DNS_TUNNELING", "DNS_TUNNELING", "BENIGN"]
+    sweep = ee.evaluate(scores, labels, thresholds=[0.0, 0.5, 0.7, 1.0], n_bootstrap=0)
+
+    rows = sweep.set_index(["attack_type", "threshold"])
+    # A score equal to the threshold is not flagged
+    assert rows.loc[("ALL", 0.5), ["tp", "fp", "fn", "tn"]].tolist() == [2, 0, 2, 3]
+    assert rows.loc[("ALL", 0.7), ["tp", "fp", "fn", "tn"]].tolist() == [1, 0, 3, 3]
+    assert rows.loc[("ALL", 0.0), ["tp", "fp", "fn", "tn"]].tolist() == [4, 3, 0, 0]
+    assert rows.loc[("PORT_SCAN", 0.5), ["tp", "fp", "fn", "tn"]].tolist() == [1, 0, 1, 3]
+    assert rows.loc[("DNS_TUNNELING", 0.7), ["tp", "fp", "fn", "tn"]].tolist() == [1, 0, 1, 3]
+    assert rows.loc[("ALL", 1.0), "precision"] == 0.0 and rows.loc[("ALL", 0.5), "precision"] == 1.0
+
+
+def test_auc_matches_pairwise_count():
+    from experiments import evaluation_engine as ee
+
+    rng = np.random.default_rng(11)
+    # Coarse scores so ties between attack and benign flows are common
+    scores = np.round(rng.random(300), 1)
+    is_attack = rng.random(300) < np.clip(scores, 0.1, 0.9)
+
+    attack, benign = scores[is_attack], scores[~is_attack]
+    pairs = (attack[:, None] > benign[None, :]) + 0.5 * (attack[:, None] == benign[None, :])
+    assert ee.auc_roc(scores, is_attack) == pytest.approx(pairs.mean(), abs=1e-12)
+    assert ee.auc_roc(scores, np.zeros(300, dtype=bool)) is None
+
+
+def test_bootstrap_depends_on_the_seed_only():
+    from experiments import evaluation_engine as ee
+
+    rng = np.random.default_rng(4)
+    scores = rng.random(500)
+    labels = np.where(rng.random(500) < 0.3, "PORT_SCAN", "BENIGN")
+    thresholds = np.linspace(0.0, 1.0, 11)
+
+    def run(seed, workers):
+        return ee.evaluate(scores, labels, thresholds=thresholds, n_bootstrap=600, seed=seed, workers=workers)
+
+    first = run(42, workers=1)
+    pd.testing.assert_frame_equal(first, run(42, workers=1))
+    pd.testing.assert_frame_equal(first, run(42, workers=2))
+    assert not first["recall_low"].equals(run(43, workers=1)["recall_low"])
+    assert (first["recall_low"] <= first["recall"]).all() and (first["recall"] <= first["recall_high"]).all()
+
+
+def test_latency_summary_counts_missed_attacks():
+    from experiments import replay
+
+    flows = pd.DataFrame({
+        "flow_key": [f"k{i}" for i in range(40)],
+        "label": ["PORT_SCAN"] * 20 + ["C2_BEACONING"] * 20,
+        "detected": [True] * 39 + [False],
+        "latency_seconds": [0.1 * (i + 1) for i in range(39)] + [None],
+        "severity": ["HIGH"] * 39 + [None],
+    })
+    summary = replay.latency_summary(flows)
+
+    assert list(summary) == ["ALL", "C2_BEACONING", "PORT_SCAN"]
+    assert summary["ALL"]["detected"] == 39 and summary["ALL"]["detection_rate"] == 0.975
+    # Rank 37.05 of 0..39 still sits between two detected flows
+    assert summary["ALL"]["p95"] == pytest.approx(3.805)
+    # The percentiles that reach the missed flow are unbounded
+    assert summary["ALL"]["p99"] is None and summary["ALL"]["max"] is None
+    assert summary["PORT_SCAN"]["max"] == 2.0
+    assert summary["C2_BEACONING"]["p50"] is not None and summary["C2_BEACONING"]["p95"] is None
+
+    # Most attacks missed: the few detected ones do not make a p95
+    flows["detected"] = [True] * 5 + [False] * 35
+    flows["latency_seconds"] = [0.01] * 5 + [None] * 35
+    assert replay.latency_summary(flows)["ALL"]["p95"] is None
+
+
+def test_max_speed_replay_of_synthetic_capture(tmp_path):
+    from experiments import replay
+    from experiments.synthetic_traffic import generate_capture
+
+    capture = generate_capture(tmp_path / "capture.pcap", 300, tmp_path / "labels.csv", attack_fraction=0.3, seed=9)
+    labels = replay.load_labels(tmp_path / "labels.csv")
+    attacks = {key for key, label in labels.items() if label != "BENIGN"}
+
+    report, flows = replay.replay(tmp_path / "capture.pcap", labels, speed=0)
+    assert report["speed"] == "max" and report["packets"] == capture["packets"]
+    assert report["flows"] == len(labels)
+
+    # Latency is measured over the attack flows only, benign ones never enter it
+    overall = report["latency"]["ALL"]
+    assert overall["flows"] == len(attacks) == len(flows)
+    assert set(flows["label"]) == set(capture["labels"]) - {"BENIGN"}
+    assert overall["detected"] == flows["detected"].sum() > 0
+    detected = flows[flows["detected"]]
+    assert (detected["latency_seconds"] >= 0).all() and flows.loc[~flows["detected"], "latency_seconds"].isna().all()
+    if overall["detection_rate"] < 0.95:
+        assert overall["p95"] is None
+
+    # Without labels only the alerted flows are summarized, under their own name
+    unlabeled, _ = replay.replay(tmp_path / "capture.pcap", speed=0)
+    assert list(unlabeled["latency"]) == ["ALERTED"]
+    assert unlabeled["latency"]["ALERTED"]["detection_rate"] == 1.0
+    assert unlabeled["latency"]["ALERTED"]["p95"] is not None
+
+
+@pytest.mark.parametrize("fmt", ["csv", "parquet"])
+def test_benchmark_inputs_follow_intermediate_format(tmp_path, monkeypatch, fmt):
+    from experiments import benchmark
+    from detection_engine import flow_store
+
+    if fmt == "parquet":
+        pytest.importorskip("pyarrow")
+    monkeypatch.setenv(flow_store.FORMAT_ENV, fmt)
+    workspace = benchmark.make_workspace(tmp_path)
+    inputs, pcap = benchmark.prepare_inputs(workspace, 200, seed=3, with_pcap=False)
+
+    path = workspace / f"feature_engineering/outputs/flow_features.{fmt}"
+    assert pcap is None and path.exists()
+    flows = flow_store.read_flows(path, columns=FLOW_COLUMNS)
+    assert len(flows) == inputs["flows"] == 200
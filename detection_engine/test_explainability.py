@@ -0,0 +1,267 @@
+# Tests for the explainability layer (SHAP cache, explanation engine, path attribution,
+# importance accumulator, alert narratives).
+
+import json
+
+import joblib
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import IsolationForest
+from sklearn.preprocessing import StandardScaler
+
+from explainability import explanation_engine, path_attribution
+
+FEATURES = explanation_engine.FEATURE_COLUMNS
+
+
+@pytest.fixture(scope="module")
+def model_files(tmp_path_factory):
+    rng = np.random.default_rng(0)
+    X = pd.DataFrame(rng.normal(size=(400, len(FEATURES))), columns=FEATURES)
+    scaler = StandardScaler().fit(X)
+    model = IsolationForest(n_estimators=25, random_state=0).fit(scaler.transform(X))
+
+    root = tmp_path_factory.mktemp("models")
+    joblib.dump(model, root / "model.pkl")
+    joblib.dump(scaler, root / "scaler.pkl")
+    return str(root / "model.pkl"), str(root / "scaler.pkl")
+
+
+@pytest.fixture(scope="module")
+def toy_forest():
+    rng = np.random.default_rng(0)
+    model = IsolationForest(n_estimators=50, random_state=0).fit(rng.normal(size=(500, len(FEATURES))))
+    return model, path_attribution.PathAttributionExplainer(model)
+
+
+def make_flows(n, seed=1):
+    rng = np.random.default_rng(seed)
+    flows = pd.DataFrame(rng.normal(size=(n, len(FEATURES))), columns=FEATURES)
+    flows.insert(0, "src_ip", [f"10.0.0.{i}" for i in range(n)])
+    flows.insert(1, "src_port", 40000 + np.arange(n))
+    flows.insert(2, "dst_ip", "203.0.113.7")
+    flows.insert(3, "dst_port", 443)
+    flows.insert(4, "protocol", "TCP")
+    flows.insert(5, "first_seen", 1000.0 + np.arange(n))
+    return flows
+
+
+def alert_for(flows, row, severity="HIGH"):
+    flow = flows.iloc[row]
+    return {
+        "alert_id": f"ALERT-{row:04d}", "severity": severity, "threat_label": "ANOMALY",
+        "src_ip": flow["src_ip"], "src_port": int(flow["src_port"]), "dst_ip": flow["dst_ip"],
+        "dst_port": int(flow["dst_port"]), "protocol": flow["protocol"],
+        "first_seen": float(flow["first_seen"]), "final_threat_score": 0.9,
+    }
+
+
+def test_shap_cache_is_lru_bounded_per_model_version(tmp_path, monkeypatch):
+    clock = iter(range(1, 100))
+    monkeypatch.setattr(explanation_engine.time, "time", lambda: float(next(clock)))
+
+    cache = explanation_engine.ShapCache(tmp_path / "cache.db", max_entries=3)
+    cache.put_many("v1", [("a", [1.0]), ("b", [2.0]), ("c", [3.0])])
+    assert set(cache.get_many("v1", ["a", "c"])) == {"a", "c"}
+    cache.put_many("v1", [("d", [4.0])])
+
+    # "b" was least recently used
+    found = cache.get_many("v1", ["a", "b", "c", "d"])
+    assert sorted(found) == ["a", "c", "d"]
+    assert found["d"].tolist() == [4.0]
+    assert cache.get_many("v2", ["a"]) == {}
+    assert (cache.hits, cache.misses) == (5, 2)
+    cache.close()
+
+
+def test_engine_keys_cache_on_feature_row(model_files, tmp_path):
+    import shap
+
+    model_file, scaler_file = model_files
+    flows = make_flows(6)
+    # Flow 5 reuses flow 4's 5-tuple later on with different features
+    for column in ["src_ip", "src_port"]:
+        flows.loc[5, column] = flows.loc[4, column]
+    alerts = [alert_for(flows, row) for row in range(6)]
+    # Same hosts, different ports: no flow, so no explanation
+    alerts.append({**alerts[0], "alert_id": "ALERT-UNMATCHED", "src_port": 1})
+    alerts.append({**alerts[1], "alert_id": "ALERT-LOW", "severity": "LOW"})
+
+    def explain():
+        engine = explanation_engine.ExplanationEngine(model_file, scaler_file, cache_file=tmp_path / "cache.db",
+                                                      workers=1)
+        try:
+            return engine.explain_alerts(alerts, flows), (engine.cache.hits, engine.cache.misses)
+        finally:
+            engine.close()
+
+    first, first_stats = explain()
+    again, again_stats = explain()
+    assert first_stats == (0, 6)
+    assert again_stats == (6, 0)
+    assert again == first
+
+    assert [e["alert_id"] for e in first] == [f"ALERT-{row:04d}" for row in range(6)]
+    assert first[4]["flow_id"] == first[5]["flow_id"]
+    assert first[4]["top_features"] != first[5]["top_features"]
+
+    scaler = joblib.load(scaler_file)
+    expected = shap.TreeExplainer(joblib.load(model_file)).shap_values(scaler.transform(flows[FEATURES]))
+    for row, explanation in enumerate(first):
+        top = explanation["top_features"][0]
+        column = FEATURES.index(top["feature"])
+        assert top["actual_value"] == pytest.approx(flows.loc[row, top["feature"]])
+        assert top["shap_contribution"] == pytest.approx(expected[row, column], rel=1e-5, abs=1e-6)
+
+
+def test_engine_without_matching_alerts_explains_nothing(model_files, tmp_path):
+    model_file, scaler_file = model_files
+    flows = make_flows(4)
+    engine = explanation_engine.ExplanationEngine(model_file, scaler_file, cache_file=tmp_path / "cache.db",
+                                                  workers=1)
+    try:
+        assert engine.explain_alerts([], flows) == []
+        # Only LOW/MEDIUM alerts, and a HIGH one whose flow is not in the table
+        low = [alert_for(flows, row, severity) for row, severity in [(0, "LOW"), (1, "MEDIUM")]]
+        unmatched = {**alert_for(flows, 2), "src_port": 1}
+        assert engine.explain_alerts(low + [unmatched], flows) == []
+        assert (engine.cache.hits, engine.cache.misses) == (0, 0)
+    finally:
+        engine.close()
+
+
+def test_path_attribution_ranks_injected_feature_first(toy_forest):
+    model, explainer = toy_forest
+    rng = np.random.default_rng(1)
+    # Typical flows with one feature pushed far out of the training range
+    X = rng.normal(scale=0.2, size=(3 * len(FEATURES), len(FEATURES)))
+    injected = np.arange(len(X)) % len(FEATURES)
+    X[np.arange(len(X)), injected] = 5.0
+
+    values = explainer.attribute(X)
+    assert values.shape == X.shape
+    assert np.isfinite(values).all()
+    # Negative contributions push towards anomalous, like SHAP on the forest
+    assert (values.argmin(axis=1) == injected).all()
+    assert (values[np.arange(len(X)), injected] < 0).all()
+
+    # The contributions add up to the flow's mean path-length deviation,
+    # so they order flows exactly as the model's anomaly score does
+    ranks = np.argsort(np.argsort(values.sum(axis=1)))
+    assert (ranks == np.argsort(np.argsort(model.score_samples(X)))).all()
+
+
+def test_path_attribution_without_matching_alerts_explains_nothing(toy_forest):
+    _, explainer = toy_forest
+    flows = make_flows(4)
+    scaler = StandardScaler().fit(flows[FEATURES])
+
+    assert explainer.explain_alerts([], flows, scaler) == []
+    assert explainer.explain_alerts([{**alert_for(flows, 0), "src_port": 1}], flows, scaler) == []
+
+
+def test_path_attribution_agrees_with_shap(toy_forest):
+    import shap
+
+    model, explainer = toy_forest
+    X = np.random.default_rng(2).normal(size=(200, len(FEATURES)))
+
+    report = path_attribution.rank_agreement(explainer.attribute(X), shap.TreeExplainer(model).shap_values(X))
+    # Documented bar for the approximation on typical traffic
+    assert report["spearman_mean"] >= 0.4
+    assert report["top5_overlap_mean"] >= 0.6
+
+
+def test_importance_accumulator_merges_each_batch_once(tmp_path):
+    from explainability import importance_accumulator
+
+    values = np.array([[1.0, -2.0], [3.0, 0.0], [-1.0, 4.0]])
+    times = np.array([10.0, 3700.0, 3800.0])
+    acc = importance_accumulator.ImportanceAccumulator(features=["a", "b"], max_batch_ids=2)
+
+    assert acc.add(values, times, batch_id="b1")
+    assert not acc.add(values, times, batch_id="b1")
+    assert acc.windows() == [0, 1]
+    assert acc.flow_count() == 3
+    assert acc.importance().to_dict() == {"a": 5 / 3, "b": 2.0}
+    assert acc.importance(window=1).to_dict() == {"b": 2.0, "a": 2.0}
+
+    # Round trip keeps the sums and the merged batch IDs
+    path = tmp_path / "importance.npz"
+    acc.save(path)
+    loaded = importance_accumulator.ImportanceAccumulator.open(path, max_batch_ids=2)
+    assert not loaded.add(values, times, batch_id="b1")
+    assert loaded.window_importance().equals(acc.window_importance())
+
+    # Only the most recent max_batch_ids IDs are remembered
+    assert loaded.add(values, batch_id="b2") and loaded.add(values, batch_id="b3")
+    assert loaded.add(values, times, batch_id="b1")
+
+
+def test_batch_key_covers_model_and_chunk_alignment():
+    from explainability.importance_accumulator import batch_key
+
+    ids = ["10.0.0.1:40000_203.0.113.7:443_TCP", "10.0.0.2:40001_203.0.113.7:443_TCP"]
+    key = batch_key("model-a", 0, 10_000, ids, [1.0, 2.0])
+    assert key == batch_key("model-a", 0, 10_000, ids, [1.0, 2.0])
+    assert key != batch_key("model-b", 0, 10_000, ids, [1.0, 2.0])
+    assert key != batch_key("model-a", 10_000, 10_000, ids, [1.0, 2.0])
+    assert key != batch_key("model-a", 0, 5_000, ids, [1.0, 2.0])
+    assert key != batch_key("model-a", 0, 10_000, ids, [1.0, 3.0])
+
+
+def write_explanations(path, n):
+    features = ["dns_entropy", "packet_count", "std_iat"]
+    explanations = [
+        {"alert_id": f"ALERT-{i:04d}", "severity": "HIGH", "threat_label": "DNS_TUNNELING",
+         "src_ip": f"10.0.0.{i % 250}", "dst_ip": "10.0.0.53", "ml_score": 0.9,
+         "top_features": [{"feature": features[(i + k) % 3], "shap_contribution": (-1) ** k * 0.1 * (k + 1),
+                           "actual_value": 4.2 * k + i, "impact": "increased" if k % 2 else "decreased"}
+                          for k in range(3)]}
+        for i in range(n)
+    ]
+    with open(path, "w") as f:
+        json.dump(explanations, f)
+    return explanations
+
+
+@pytest.mark.parametrize("n", [0, 1, 50])
+def test_streamed_narratives_match_in_memory_export(tmp_path, n):
+    from explainability.alert_explainer import AlertExplainer
+
+    write_explanations(tmp_path / "explanations.json", n)
+    explainer = AlertExplainer(str(tmp_path / "explanations.json"), cache_size=8)
+    explainer.generate_all_narratives(str(tmp_path / "narratives.json"))
+    # Streaming export renders without touching the narrative cache
+    assert explainer.cache_misses == 0 and len(explainer._cache) == 0
+
+    # The list the export used to build in memory and json.dump at once
+    reference = AlertExplainer(str(tmp_path / "explanations.json"), cache_size=0)
+    narratives = [{"alert_id": a["alert_id"], "narrative": reference.generate_narrative(a["alert_id"])}
+                  for a in reference.explanations]
+    with open(tmp_path / "narratives.json") as f:
+        assert f.read() == json.dumps(narratives, indent=2)
+
+
+def test_narrative_cache_stays_at_capacity(tmp_path):
+    from explainability.alert_explainer import AlertExplainer
+
+    write_explanations(tmp_path / "explanations.json", 20)
+    explainer = AlertExplainer(str(tmp_path / "explanations.json"), cache_size=8)
+    ids = [f"ALERT-{i:04d}" for i in range(20)]
+    narratives = {alert_id: explainer.generate_narrative(alert_id) for alert_id in ids}
+
+    assert list(explainer._cache) == ids[-8:]
+    assert (explainer.cache_hits, explainer.cache_misses) == (0, 20)
+
+    # A hit moves the entry to the back; the next miss evicts the oldest
+    assert explainer.generate_narrative(ids[12]) == narratives[ids[12]]
+    assert explainer.generate_narrative(ids[0]) == narratives[ids[0]]
+    assert len(explainer._cache) == 8
+    assert list(explainer._cache)[-2:] == [ids[12], ids[0]]
+    assert ids[13] not in explainer._cache
+    assert (explainer.cache_hits, explainer.cache_misses) == (1, 21)
+
+    assert explainer.generate_narrative("ALERT-9999") == "No explanation found for ALERT-9999"
+    assert len(explainer._cache) == 8
@@ -0,0 +1,95 @@
+# Tests for typed columnar flow storage.
+
+import sys
+
+import pandas as pd
+import pytest
+
+from detection_engine import flow_store
+
+
+def make_flows():
+    return pd.DataFrame({
+        "src_ip": ["10.0.0.1", "10.0.0.2", "10.0.0.1", "192.168.1.20"],
+        "dst_ip": ["8.8.8.8"] * 4,
+        "src_port": [50000, 50001, 50002, 65535],
+        "dst_port": [53, 53, 443, 80],
+        "protocol": ["UDP", "UDP", "TCP", "TCP"],
+        "first_seen": [1_700_000_000.25, 1_700_000_100.5, 1_700_003_700.0, 1_700_007_300.75],
+        "last_seen": [1_700_000_001.0, 1_700_000_101.0, 1_700_003_705.0, 1_700_007_301.0],
+        "packet_count": [2, 2, 40, 3],
+        "duration": [0.75, 0.5, 5.0, 0.25],
+        "dns_entropy": [3.25, 1.5, 0.0, 0.0],
+        "threat_label": ["DNS_TUNNEL", "BENIGN", "BENIGN", "PORT_SCAN"],
+        "note": ["a", "b", "c", "d"],
+    })
+
+
+def test_intermediate_path_follows_selected_format(monkeypatch):
+    monkeypatch.delenv(flow_store.FORMAT_ENV, raising=False)
+    assert flow_store.intermediate_path("outputs/flows.csv") == "outputs/flows.csv"
+    with pytest.raises(ValueError):
+        flow_store.intermediate_path("outputs/flows.csv", "feather")
+
+    pytest.importorskip("pyarrow")
+    monkeypatch.setenv(flow_store.FORMAT_ENV, "parquet")
+    assert flow_store.intermediate_path("outputs/flows.csv") == "outputs/flows.parquet"
+    assert flow_store.intermediate_path("outputs/flows.csv", "csv") == "outputs/flows.csv"
+
+
+def test_parquet_without_pyarrow_fails_when_selected(monkeypatch):
+    monkeypatch.setitem(sys.modules, "pyarrow", None)
+    monkeypatch.setenv(flow_store.FORMAT_ENV, "parquet")
+
+    with pytest.raises(ImportError, match="pip3 install pyarrow"):
+        flow_store.intermediate_path("outputs/flows.csv")
+    assert flow_store.intermediate_path("outputs/flows.csv", "csv") == "outputs/flows.csv"
+
+
+def test_csv_reads_only_requested_columns(tmp_path):
+    path = flow_store.write_flows(make_flows(), tmp_path / "flows.csv")
+    df = flow_store.read_flows(path, columns=["dst_port", "src_ip"])
+    assert df.columns.tolist() == ["dst_port", "src_ip"]
+    assert df["src_ip"].tolist() == make_flows()["src_ip"].tolist()
+
+
+def test_parquet_round_trip_uses_schema(tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    flows = make_flows()
+    path = flow_store.write_flows(flows, tmp_path / "flows.parquet")
+
+    stored = pq.read_schema(path)
+    assert str(stored.field("src_ip").type) == "uint32"
+    assert str(stored.field("dst_port").type) == "uint16"
+    assert str(stored.field("duration").type) == "float"
+    assert str(stored.field("first_seen").type) == "double"
+
+    df = flow_store.read_flows(path)
+    assert df.columns.tolist() == flows.columns.tolist()
+    assert df["src_ip"].tolist() == flows["src_ip"].tolist()
+    assert isinstance(df["protocol"].dtype, pd.CategoricalDtype)
+    assert df["first_seen"].tolist() == flows["first_seen"].tolist()
+    assert df["note"].tolist() == flows["note"].tolist()
+
+    projected = flow_store.read_flows(path, columns=["packet_count", "threat_label"])
+    assert projected.columns.tolist() == ["packet_count", "threat_label"]
+    assert str(projected["packet_count"].dtype) == "uint32"
+
+
+def test_hour_partitions_read_and_replace_independently(tmp_path):
+    pytest.importorskip("pyarrow")
+    flows = make_flows()
+    path = tmp_path / "flows.parquet"
+    flow_store.write_flows(flows, path, partition_by_hour=True)
+
+    hours = flow_store.partitions(path)
+    assert hours == sorted(set(flow_store.hour_of(flows["first_seen"]).tolist()))
+
+    start = hours[0] * 3600
+    first_hour = flow_store.read_flows(path, columns=["src_port"], start=start, end=start + 3600)
+    assert first_hour["src_port"].tolist() == [50000, 50001]
+
+    # Rewriting one hour leaves the others in place
+    flow_store.write_flows(flows.iloc[[0]], path, partition_by_hour=True)
+    assert len(flow_store.read_flows(path)) == len(flows) - 1
+    assert sum(len(chunk) for chunk in flow_store.iter_flows(path, chunksize=2)) == len(flows) - 1
@@ -0,0 +1,264 @@
+# Tests for the intelligence layer (aggregation, campaigns, correlation).
+
+import json
+
+from detection_engine.intelligence import aggregator
+
+
+def make_alert(alert_id, timestamp, severity="HIGH", score=0.7, src_ip="10.0.0.5", rules=("PORT_SCAN",)):
+    return {"alert_id": alert_id, "timestamp": timestamp, "src_ip": src_ip, "dst_ip": "10.0.0.1",
+            "severity": severity, "final_threat_score": score, "triggered_rules": list(rules)}
+
+
+def test_aggregation_store_merges_incrementally(tmp_path):
+    alerts_file = tmp_path / "alerts.ndjson"
+    store = aggregator.AggregationStore(str(tmp_path / "state.db"))
+
+    with open(alerts_file, "w") as f:
+        f.write(json.dumps(make_alert("A-1", "2026-01-01T10:00:00Z", "MEDIUM", 0.4)) + "\n")
+        f.write(json.dumps(make_alert("A-2", "2026-01-01T09:00:00Z", "HIGH", 0.6)) + "\n")
+    assert store.ingest_ndjson(str(alerts_file)) == 2
+
+    with open(alerts_file, "a") as f:
+        f.write(json.dumps(make_alert("A-3", "2026-01-01T11:00:00Z", "CRITICAL", 0.8)) + "\n")
+    # Only the appended alert is read on the next run
+    assert store.ingest_ndjson(str(alerts_file)) == 1
+
+    [incident] = list(store.incidents())
+    store.close()
+
+    assert incident["alert_count"] == 3
+    assert incident["max_severity"] == "CRITICAL"
+    assert incident["avg_score"] == 0.6
+    assert incident["first_seen"] == "2026-01-01T09:00:00Z"
+    assert incident["last_seen"] == "2026-01-01T11:00:00Z"
+
+
+def test_aggregation_store_rereads_rewritten_file(tmp_path):
+    alerts_file = tmp_path / "alerts.ndjson"
+    store = aggregator.AggregationStore(str(tmp_path / "state.db"))
+
+    def write_run(alerts):
+        # alert_generator rewrites the file in place with IDs from 1
+        with open(alerts_file, "w") as f:
+            for alert in alerts:
+                f.write(json.dumps(alert) + "\n")
+
+    write_run([make_alert("ALERT-0001", "2026-01-01T10:00:00Z", score=0.4, src_ip="10.0.0.1")])
+    assert store.ingest_ndjson(str(alerts_file)) == 1
+
+    # Next run: same length up to the old offset, then more alerts
+    write_run([make_alert("ALERT-0001", "2026-01-02T10:00:00Z", score=0.4, src_ip="10.0.0.2"),
+               make_alert("ALERT-0002", "2026-01-02T11:00:00Z", score=0.8, src_ip="10.0.0.3")])
+    assert store.ingest_ndjson(str(alerts_file)) == 2
+
+    # Same size as before, different content
+    write_run([make_alert("ALERT-0001", "2026-01-03T10:00:00Z", score=0.4, src_ip="10.0.0.4"),
+               make_alert("ALERT-0002", "2026-01-03T11:00:00Z", score=0.8, src_ip="10.0.0.5")])
+    assert store.ingest_ndjson(str(alerts_file)) == 2
+    assert store.ingest_ndjson(str(alerts_file)) == 0
+
+    entities = sorted(incident["entity"] for incident in store.incidents())
+    store.close()
+    assert entities == ["10.0.0.1", "10.0.0.2", "10.0.0.3", "10.0.0.4", "10.0.0.5"]
+
+
+def test_aggregation_store_skips_alerts_of_a_rerun(tmp_path):
+    alerts_file = tmp_path / "alerts.ndjson"
+    store = aggregator.AggregationStore(str(tmp_path / "state.db"))
+    first = [make_alert("ALERT-0001", "2026-01-01T10:00:00Z", score=0.4),
+             make_alert("ALERT-0002", "2026-01-01T11:00:00Z", score=0.8)]
+
+    def write_run(alerts):
+        with open(alerts_file, "w") as f:
+            for alert in alerts:
+                f.write(json.dumps(alert) + "\n")
+        return store.ingest_ndjson(str(alerts_file))
+
+    assert write_run(first) == 2
+    # Detection re-run on the same flows: same alerts, file rewritten
+    assert write_run(first) == 0
+    # Re-run on more flows: the file changed from the start, so it is read
+    # again, but only the new alert counts; IDs restart at 1
+    later = make_alert("ALERT-0001", "2026-01-01T12:00:00Z", score=0.6)
+    assert write_run([later] + first) == 1
+
+    [incident] = list(store.incidents())
+    store.close()
+    assert incident["alert_count"] == 3
+    assert incident["avg_score"] == 0.6
+
+
+def test_sessions_split_on_inactivity_gap():
+    from detection_engine.intelligence import campaign_detector
+
+    timestamps = [
+        "2026-01-01T10:00:00Z",  # a month-old one-off
+        "2026-02-01T10:00:00Z",
+        "2026-02-01T10:05:00Z",
+        "2026-02-01T10:10:00Z",
+    ]
+    alerts = [make_alert(f"A-{i}", ts) for i, ts in enumerate(timestamps)]
+
+    sessions = list(campaign_detector.sessionize(alerts, gap=3600))
+
+    assert [s["alert_count"] for s in sessions] == [1, 3]
+    assert [s["campaign_type"] for s in sessions] == ["single_event", "repeated_activity"]
+    assert sessions[1]["session_index"] == 2
+    assert sessions[1]["duration_seconds"] == 600
+
+
+def test_clusters_link_hosts_through_shared_c2():
+    from detection_engine.intelligence import cluster_builder
+
+    builder = cluster_builder.ClusterBuilder()
+    for i in range(20):
+        alert = make_alert(f"A-{i}", "2026-01-01T10:00:00Z", src_ip=f"10.0.0.{i}", rules=("C2_BEACON",))
+        alert.update({"dst_ip": "203.0.113.7", "dst_port": 443})
+        builder.add(alert)
+
+    unrelated = make_alert("B-1", "2026-01-01T10:00:00Z", src_ip="10.0.1.1")
+    unrelated.update({"dst_ip": "198.51.100.1", "dst_port": 443})
+    builder.add(unrelated)
+
+    [cluster] = builder.clusters()
+    assert cluster["entity_count"] == 20
+    assert cluster["shared_infrastructure"] == ["ip:203.0.113.7"]
+    assert builder.cluster_of("10.0.1.1")["entity_count"] == 1
+
+
+def test_clusters_link_dns_through_domain_not_resolver():
+    from detection_engine.intelligence import cluster_builder
+
+    builder = cluster_builder.ClusterBuilder()
+    queries = {"10.0.0.1": "a1b2.evil-c2.com", "10.0.0.2": "c3d4.evil-c2.com", "10.0.0.3": "www.example.org"}
+    for src_ip, query in queries.items():
+        alert = make_alert(src_ip, "2026-01-01T10:00:00Z", src_ip=src_ip, rules=("DNS_TUNNELING",))
+        alert.update({"dst_ip": "10.0.0.53", "dst_port": 53, "dns_query": query})
+        builder.add(alert)
+
+    [cluster] = builder.clusters()
+    assert cluster["entities"] == ["10.0.0.1", "10.0.0.2"]
+    assert cluster["shared_infrastructure"] == ["domain:evil-c2.com"]
+
+
+def test_clusters_ignore_high_fan_in_destinations():
+    from detection_engine.intelligence import cluster_builder
+
+    alerts = []
+    for i in range(60):
+        alert = make_alert(f"P-{i}", "2026-01-01T10:00:00Z", src_ip=f"10.0.1.{i}")
+        alert.update({"dst_ip": "198.51.100.80", "dst_port": 8443})
+        alerts.append(alert)
+    for i in range(3):
+        alert = make_alert(f"C-{i}", "2026-01-01T10:00:00Z", src_ip=f"10.0.1.{i}", rules=("C2_BEACON",))
+        alert.update({"dst_ip": "203.0.113.7", "dst_port": 443})
+        alerts.append(alert)
+
+    builder = cluster_builder.ClusterBuilder()
+    builder.add_many(alerts)
+    assert builder.hubs == {"ip:198.51.100.80", "port:8443"}
+    [cluster] = builder.clusters()
+    assert cluster["entities"] == ["10.0.1.0", "10.0.1.1", "10.0.1.2"]
+    assert cluster["shared_infrastructure"] == ["ip:203.0.113.7"]
+
+    # Alert by alert, a token stops linking once it crosses the cap
+    incremental = cluster_builder.ClusterBuilder(max_fan_in=3)
+    for alert in alerts[:5]:
+        incremental.add(alert)
+    assert incremental.hubs == {"ip:198.51.100.80", "port:8443"}
+    assert incremental.cluster_of("10.0.1.2")["entity_count"] == 3
+    assert incremental.cluster_of("10.0.1.4")["entity_count"] == 1
+
+
+def test_alerts_carry_dns_query():
+    import pandas as pd
+
+    from detection_engine.scoring.alert_generator import build_alert_frame
+
+    flows = pd.DataFrame({
+        "src_ip": ["10.0.0.1", "10.0.0.2"], "dst_ip": ["10.0.0.53", "203.0.113.7"],
+        "src_port": [40000, 40001], "dst_port": [53, 443], "protocol": ["UDP", "TCP"],
+        "first_seen": [0.0, 1.0], "final_threat_score": [0.9, 0.9],
+        "threat_label": ["DNS_TUNNELING", "C2_BEACON"], "dns_query": ["a1b2.evil-c2.com", float("nan")],
+    })
+    def queries(frame):
+        return [alert["dns_query"] for alert in json.loads(frame.to_json(orient="records"))]
+
+    assert queries(build_alert_frame(flows)) == ["a1b2.evil-c2.com", None]
+    assert queries(build_alert_frame(flows.drop(columns="dns_query"))) == [None, None]
+
+
+def test_base_domain():
+    from detection_engine.intelligence.cluster_builder import base_domain
+
+    assert base_domain("a1b2.c3.evil-c2.com.") == "evil-c2.com"
+    assert base_domain("x.example.co.uk") == "example.co.uk"
+    assert base_domain("localhost") is None
+
+
+def test_time_index_range_queries_and_late_alerts():
+    from detection_engine.intelligence import timeline_builder
+
+    index = timeline_builder.AlertTimeIndex()
+    for i, ts in enumerate(["2026-01-01T10:00:00Z", "2026-01-01T10:20:00Z", "2026-01-01T10:40:00Z"]):
+        index.add(make_alert(f"A-{i}", ts))
+    # Late arrival lands in time order
+    index.add(make_alert("A-late", "2026-01-01T10:10:00Z"))
+
+    window = index.query("10.0.0.5", "PORT_SCAN", "2026-01-01T10:05:00Z", "2026-01-01T10:20:00Z")
+    assert [a["alert_id"] for a in window] == ["A-late", "A-1"]
+    assert index.count("10.0.0.5", "PORT_SCAN") == 4
+
+    [timeline] = index.timeline_for("10.0.0.5", end="2026-01-01T10:10:00Z")
+    assert len(timeline["timeline"]) == 2
+
+
+def test_correlation_raises_one_incident_per_kill_chain():
+    from detection_engine.intelligence import correlation_engine
+
+    chain = {"name": "recon_to_exfil", "stages": [["PORT_SCAN"], ["C2_BEACON"], ["DATA_EXFIL"]],
+             "max_span": 3600, "max_step_gap": 1800, "severity": "CRITICAL"}
+    engine = correlation_engine.CorrelationEngine([chain])
+
+    def labelled(alert_id, label, ts, src_ip="10.0.0.5"):
+        alert = make_alert(alert_id, ts, src_ip=src_ip, rules=())
+        alert["threat_label"] = label
+        return alert
+
+    stream = [
+        labelled("A-1", "PORT_SCAN", "2026-01-01T10:00:00Z"),
+        labelled("B-1", "C2_BEACON", "2026-01-01T10:05:00Z", src_ip="10.0.0.9"),
+        labelled("A-2", "C2_BEACON", "2026-01-01T10:10:00Z"),
+        labelled("A-3", "DATA_EXFIL", "2026-01-01T10:30:00Z"),
+    ]
+    incidents = [i for alert in stream for i in engine.observe(alert)]
+
+    [incident] = incidents
+    assert incident["entity"] == "10.0.0.5"
+    assert [s["alert_id"] for s in incident["stages"]] == ["A-1", "A-2", "A-3"]
+    assert engine.tracked_entities() == 0
+
+    # A scan whose follow-up arrives after the time bound never completes
+    engine.observe(labelled("C-1", "PORT_SCAN", "2026-01-02T10:00:00Z"))
+    assert engine.observe(labelled("C-2", "C2_BEACON", "2026-01-02T12:00:00Z")) == []
+    assert engine.tracked_entities() == 0
+
+
+def test_host_risk_decays_and_ranks(tmp_path):
+    from detection_engine.intelligence import host_risk
+
+    table = host_risk.HostRiskTable(half_life=3600, capacity=2)
+    table.update("10.0.0.1", 1.0, 0)
+    table.update("10.0.0.1", 1.0, 3600)   # first point has halved
+    table.update("10.0.0.2", 1.2, 3600)
+    table.update("10.0.0.3", 0.1, 3600)   # forces the arrays to grow
+
+    assert abs(table.score("10.0.0.1", 3600) - 1.5) < 1e-9
+    assert abs(table.score("10.0.0.1", 7200) - 0.75) < 1e-9
+    assert [e["entity"] for e in table.top(2)] == ["10.0.0.1", "10.0.0.2"]
+
+    path = str(tmp_path / "risk.npz")
+    table.snapshot(path)
+    restored = host_risk.HostRiskTable.restore(path)
+    assert restored.top(3) == table.top(3)
@@ -0,0 +1,95 @@
+# Tests for stage instrumentation and Prometheus exposition.
+
+import urllib.request
+
+import pandas as pd
+import pytest
+
+from detection_engine import metrics
+from detection_engine.scoring.alert_generator import build_alert_frame
+
+
+@pytest.fixture
+def registry():
+    metrics.REGISTRY.clear()
+    metrics.configure()
+    yield metrics.REGISTRY
+    metrics.disable()
+    metrics.REGISTRY.clear()
+
+
+def test_disabled_helpers_record_nothing():
+    metrics.disable()
+    metrics.inc("flows_processed_total", 5, stage="test")
+    with metrics.timer("step_seconds", stage="test"), metrics.stage("test"):
+        pass
+
+    assert metrics.REGISTRY.value("flows_processed_total", stage="test") is None
+    assert metrics.REGISTRY.histogram("stage_duration_seconds", stage="test") is None
+
+
+def test_stage_timer_counters_and_memory(registry):
+    with metrics.stage("labeling"):
+        metrics.inc("flows_processed_total", 3, stage="labeling")
+        metrics.inc("flows_processed_total", 2, stage="labeling")
+
+    assert registry.value("flows_processed_total", stage="labeling") == 5
+    assert registry.value("stage_runs_total", stage="labeling") == 1
+    assert registry.histogram("stage_duration_seconds", stage="labeling")[0] == 1
+    assert registry.value("memory_peak_rss_bytes", stage="labeling") > 0
+
+    with pytest.raises(ValueError):
+        with metrics.stage("labeling"):
+            raise ValueError("boom")
+    assert registry.value("stage_failures_total", stage="labeling") == 1
+
+
+def test_render_prometheus_text(registry):
+    metrics.inc("rule_hits_total", 4, rule='dns "abuse"')
+    metrics.observe("rule_eval_seconds", 0.002, rule="port_scan")
+    metrics.observe("rule_eval_seconds", 1000.0, rule="port_scan")
+
+    text = registry.render()
+    assert "# TYPE sentinelhunt_rule_hits_total counter" in text
+    assert 'sentinelhunt_rule_hits_total{rule="dns \\"abuse\\""} 4' in text
+    assert 'sentinelhunt_rule_eval_seconds_bucket{rule="port_scan",le="0.005"} 1' in text
+    assert 'sentinelhunt_rule_eval_seconds_bucket{rule="port_scan",le="+Inf"} 2' in text
+    assert 'sentinelhunt_rule_eval_seconds_count{rule="port_scan"} 2' in text
+
+
+def test_textfile_and_http_endpoint(registry, tmp_path):
+    metrics.inc("alerts_emitted_total", 7, stage="alerting")
+
+    path = metrics.write_textfile(tmp_path / "alerting.prom")
+    assert 'sentinelhunt_alerts_emitted_total{stage="alerting"} 7' in path.read_text()
+
+    server = metrics.serve(0)
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+        with urllib.request.urlopen(url, timeout=5) as response:
+            body = response.read().decode()
+    finally:
+        server.shutdown()
+    assert 'sentinelhunt_alerts_emitted_total{stage="alerting"} 7' in body
+
+
+def test_batch_rules_record_hits_and_evaluation_time(registry):
+    flows = pd.DataFrame({
+        "src_ip": ["10.0.0.1", "10.0.0.2", "10.0.0.3"],
+        "dst_ip": ["10.0.0.9"] * 3,
+        "src_port": [1000, 1001, 1002],
+        "dst_port": [53, 53, 80],
+        "protocol": ["UDP", "UDP", "TCP"],
+        "packets_per_second": [10, 10, 1],
+        "dns_entropy": [4.0, 1.0, 0.0],
+        "dns_subdomain_depth": [4, 1, 0],
+        "dst_port_count": [0, 0, 25],
+        "final_threat_score": [0.7, 0.7, 0.7],
+        "threat_label": ["DNS_TUNNEL", "SUSPICIOUS_TRAFFIC", "PORT_SCAN"],
+    })
+    build_alert_frame(flows, now=0.0)
+
+    assert registry.value("rule_hits_total", rule="dns_abuse") == 1
+    assert registry.value("rule_hits_total", rule="port_scan") == 1
+    assert registry.value("rule_evaluations_total", rule="dns_abuse") == 3
+    assert registry.histogram("rule_eval_seconds", rule="port_scan")[0] == 1
@@ -0,0 +1,107 @@
+# Tests for hourly partitioned batch processing.
+
+import json
+
+import numpy as np
+import pytest
+
+from detection_engine import flow_store, partitioned, pipeline
+from detection_engine.intelligence import aggregator
+from experiments.synthetic_traffic import flow_features, synthesize
+
+
+@pytest.fixture(scope="module")
+def features():
+    flows, packets = synthesize(2_000, seed=7)
+    df = flow_features(flows, packets)
+    # Spread the flows over three hours
+    shift = (np.arange(len(df)) % 3) * 3600.0
+    df["first_seen"] += shift
+    df["last_seen"] += shift
+    return df
+
+
+def hours_of(df):
+    return sorted(set(flow_store.hour_of(df["first_seen"]).tolist()))
+
+
+def alert_key(alert):
+    return (alert["src_ip"], alert["src_port"], alert["dst_ip"], alert["dst_port"], alert["first_seen"],
+            alert["final_threat_score"], alert["severity"], alert["threat_label"])
+
+
+def test_matches_batch_pipeline_in_hour_order(features, tmp_path):
+    results = partitioned.run_partitioned(features=features, root=tmp_path / "partitioned", workers=2)
+    assert results["partitions"] == results["processed"] == hours_of(features)
+
+    order = np.argsort(flow_store.hour_of(features["first_seen"]), kind="stable")
+    batch = pipeline.run_pipeline(features=features.iloc[order].reset_index(drop=True),
+                                  root=tmp_path / "batch", materialize=())
+
+    with open(tmp_path / "partitioned" / "feature_engineering/outputs/alerts.ndjson") as f:
+        alerts = [json.loads(line) for line in f]
+    assert sorted(map(alert_key, alerts)) == sorted(map(alert_key, batch["alerting"]))
+    assert len({alert["alert_id"] for alert in alerts}) == len(alerts)
+
+    # Per-hour score sums are added in another order; averages may differ in the last digit
+    assert len(results["incidents"]) == len(batch["aggregation"])
+    for merged, expected in zip(results["incidents"], batch["aggregation"]):
+        assert merged["avg_score"] == pytest.approx(expected["avg_score"], abs=0.0011)
+        assert {**merged, "avg_score": None} == {**expected, "avg_score": None}
+
+
+def test_new_hour_processes_only_that_partition(features, tmp_path):
+    hours = flow_store.hour_of(features["first_seen"])
+    first, last = features[hours < hours.max()], features[hours == hours.max()]
+
+    before = partitioned.run_partitioned(features=first, root=tmp_path, workers=1)
+    assert before["processed"] == hours_of(first)
+
+    after = partitioned.run_partitioned(features=last, root=tmp_path, workers=1)
+    assert after["partitions"] == hours_of(features)
+    assert after["processed"] == [int(hours.max())]
+    # The reduce merges the stored hours with the new one
+    assert sum(i["alert_count"] for i in after["incidents"]) >= sum(i["alert_count"] for i in before["incidents"])
+    assert after["alerts"] == sum(r["alerts"] for r in partitioned.load_manifest(
+        tmp_path / partitioned.PARTITION_DIR)["partitions"].values())
+
+    # Nothing new: nothing re-runs; a refit re-runs every hour
+    assert partitioned.run_partitioned(features=last, root=tmp_path, workers=1)["processed"] == []
+    assert partitioned.run_partitioned(root=tmp_path, workers=1, refit=True)["processed"] == hours_of(features)
+
+
+def test_merge_buckets_matches_single_pass():
+    alerts = [
+        {"src_ip": "10.0.0.1", "triggered_rules": ["PORT_SCAN"], "severity": "LOW",
+         "final_threat_score": 0.25, "event_time": 100.0},
+        {"src_ip": "10.0.0.1", "triggered_rules": ["PORT_SCAN"], "severity": "HIGH",
+         "final_threat_score": 0.75, "event_time": 4000.0},
+        {"src_ip": "10.0.0.2", "triggered_rules": [], "severity": "MEDIUM",
+         "final_threat_score": 0.5, "event_time": 4100.0},
+    ]
+    merged = aggregator.merge_buckets(aggregator.accumulate(alerts[:1]), aggregator.accumulate(alerts[1:]))
+    assert merged == aggregator.accumulate(alerts)
+
+
+def test_overlapping_inputs_merge_into_the_stored_hour(features, tmp_path):
+    hours = flow_store.hour_of(features["first_seen"])
+    hour = int(hours.min())
+    rows = features[hours == hour]
+    third = len(rows) // 3
+    # Both inputs carry the middle third of the hour
+    first = features.drop(rows.index[2 * third:])
+    second = rows.iloc[third:]
+
+    partitioned.run_partitioned(features=first, root=tmp_path, workers=1)
+    after = partitioned.run_partitioned(features=second, root=tmp_path, workers=1)
+    assert after["processed"] == [hour]
+
+    directory = tmp_path / partitioned.PARTITION_DIR
+    stored = flow_store.read_flows(partitioned._table(partitioned.partition_dir(directory, hour), "flows", None))
+    key = partitioned.FLOW_KEY
+    assert len(stored) == len(rows)
+    assert sorted(map(tuple, stored[key].to_numpy().tolist())) == sorted(map(tuple, rows[key].to_numpy().tolist()))
+    assert partitioned.load_manifest(directory)["partitions"][str(hour)]["flows"] == len(rows)
+
+    # The same input again changes nothing
+    assert partitioned.run_partitioned(features=second, root=tmp_path, workers=1)["processed"] == []
@@ -0,0 +1,83 @@
+# Tests for the in-memory pipeline runner.
+
+import json
+import os
+import time
+
+import pytest
+
+from detection_engine import pipeline, stage_cache
+from experiments.synthetic_traffic import flow_features, synthesize
+
+
+@pytest.fixture(scope="module")
+def features():
+    flows, packets = synthesize(2_000, seed=7)
+    return flow_features(flows, packets)
+
+
+def test_in_memory_run_writes_nothing(features, tmp_path):
+    results = pipeline.run_pipeline(features=features, root=tmp_path, materialize=())
+
+    assert list(tmp_path.iterdir()) == []
+    assert len(results["labeling"]) == len(features)
+    assert results["alerting"]
+    assert {"entity", "rule", "alert_count"} <= set(results["aggregation"][0])
+    # Stages do not leak columns into their inputs
+    assert "suspicion_score" not in features.columns
+    assert "iforest_score" not in results["threat_score"].columns
+
+
+def test_materializes_only_requested_stages(features, tmp_path):
+    results = pipeline.run_pipeline(features=features, root=tmp_path, materialize={"labeling", "alerting"})
+
+    written = sorted(p.relative_to(tmp_path).as_posix() for p in tmp_path.rglob("*") if p.is_file())
+    assert written == [pipeline.OUTPUT_FILES["alerting"], pipeline.OUTPUT_FILES["labeling"]]
+
+    with open(tmp_path / pipeline.OUTPUT_FILES["alerting"]) as f:
+        assert json.load(f) == results["alerting"]
+
+
+def test_parse_materialize():
+    assert pipeline.parse_materialize("all") == set(pipeline.STAGES)
+    assert pipeline.parse_materialize("none") == set()
+    assert pipeline.parse_materialize("labeling, alerting") == {"labeling", "alerting"}
+    with pytest.raises(ValueError):
+        pipeline.parse_materialize("labelling")
+
+
+def test_stage_cache_skips_unchanged_stages(features, tmp_path):
+    cache = stage_cache.StageCache(tmp_path / "cache")
+    first = pipeline.run_pipeline(features=features, root=tmp_path, materialize=(), cache=cache)
+    assert (cache.hits, cache.misses) == (0, len(pipeline.STAGES))
+
+    # Nothing changed: only the final output is loaded, nothing runs
+    cache.hits = cache.misses = 0
+    second = pipeline.run_pipeline(features=features, root=tmp_path, materialize=(), cache=cache)
+    assert (cache.hits, cache.misses) == (1, 0)
+    assert set(second) == {"aggregation"}
+    assert second["aggregation"] == first["aggregation"]
+
+    # Alerting config changed: labeled flows come from the cache, alerting re-runs
+    cache.hits = cache.misses = 0
+    third = pipeline.run_pipeline(features=features, root=tmp_path, materialize=(), suppress=True, cache=cache)
+    assert (cache.hits, cache.misses) == (1, 2)
+    assert set(third) == {"labeling", "alerting", "aggregation"}
+
+
+def test_stage_cache_evicts_by_age_and_size(tmp_path):
+    cache = stage_cache.StageCache(tmp_path)
+    for key in ["old", "mid", "new"]:
+        cache.put(key, b"x" * 1000)
+    now = time.time()
+    os.utime(tmp_path / "old.pkl", (now - 3 * 86400,) * 2)
+    os.utime(tmp_path / "mid.pkl", (now - 60,) * 2)
+
+    cache.max_age = 86400
+    assert cache.evict() == 1
+    assert cache.get("old") is None
+
+    cache.max_bytes = 1500
+    assert cache.evict() == 1
+    assert cache.get("mid") is None
+    assert cache.get("new") == b"x" * 1000
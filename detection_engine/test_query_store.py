@@ -0,0 +1,73 @@
+# Tests for the SQLite-backed query store.
+
+from detection_engine import query_store
+
+
+def make_alerts():
+    severities = ["LOW", "MEDIUM", "HIGH", "CRITICAL"]
+    return [
+        {"alert_id": f"ALERT-{i:04d}", "timestamp": f"2026-01-01T10:{i:02d}:00Z",
+         "src_ip": f"10.0.0.{i % 3}", "dst_ip": "10.0.0.100", "severity": severities[i % 4],
+         "final_threat_score": 0.5, "triggered_rules": ["PORT_SCAN"] if i % 2 else []}
+        for i in range(40)
+    ]
+
+
+def test_filters_and_keyset_pagination(tmp_path):
+    with query_store.QueryStore(str(tmp_path / "store.db")) as store:
+        store.write_alerts(make_alerts())
+
+        first = store.alerts(severity="CRITICAL", limit=4)
+        assert [a["alert_id"] for a in first["items"]] == ["ALERT-0039", "ALERT-0035", "ALERT-0031", "ALERT-0027"]
+
+        second = store.alerts(severity="CRITICAL", limit=4, cursor=first["next_cursor"])
+        assert second["items"][0]["alert_id"] == "ALERT-0023"
+
+        assert len(list(store.iter_alerts(severity="CRITICAL", limit=3))) == 10
+        assert len(list(store.iter_alerts(min_severity="HIGH", src_ip="10.0.0.0"))) == 7
+        assert len(list(store.iter_alerts(rule="NO_RULE"))) == 20
+
+        recent = store.recent_alerts(seconds=300, now=query_store.to_epoch("2026-01-01T10:39:00Z"))
+        assert len(recent["items"]) == 6
+
+
+def test_runs_keep_their_alerts(tmp_path):
+    path = str(tmp_path / "store.db")
+    with query_store.QueryStore(path, run_id="run-1") as store:
+        store.write_alerts(make_alerts())
+    rerun = [{**alert, "severity": "LOW"} for alert in make_alerts()[:10]]
+    with query_store.QueryStore(path, run_id="run-2") as store:
+        store.write_alerts(rerun)
+
+        # Same alert IDs in both runs; neither overwrites the other
+        assert store.runs() == ["run-1", "run-2"]
+        assert store.latest_run() == "run-2"
+        assert len(list(store.iter_alerts(limit=7))) == 50
+        assert len(list(store.iter_alerts(run_id="run-1", rule="PORT_SCAN"))) == 20
+        assert store.severity_counts(run_id="run-2") == {"LOW": 10}
+
+        # Rewriting within a run replaces
+        store.write_alerts(rerun)
+        assert len(list(store.iter_alerts(run_id="run-2"))) == 10
+
+    alerts = query_store.load_alerts(path)
+    assert [a["alert_id"] for a in alerts] == [a["alert_id"] for a in rerun]
+    earlier = query_store.load_alerts(path, run_id="run-1")
+    assert len(earlier) == 40
+    assert [a["severity"] for a in earlier[:2]] == ["LOW", "MEDIUM"]
+
+
+def test_run_reads_use_the_run_index(tmp_path):
+    with query_store.QueryStore(str(tmp_path / "store.db"), run_id="run-1") as store:
+        store.write_alerts(make_alerts())
+        # The statement load_alerts() pages through, with its parameters bound
+        statements = []
+        store.conn.set_trace_callback(statements.append)
+        store.alerts(run_id="run-1", newest_first=False)
+        store.conn.set_trace_callback(None)
+        plan = store.conn.execute(f"EXPLAIN QUERY PLAN {statements[-1]}").fetchall()
+
+    # One run is read off its own index range, already in page order
+    details = " ".join(row[-1] for row in plan)
+    assert "idx_alerts_run" in details
+    assert "TEMP B-TREE" not in details
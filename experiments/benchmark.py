@@ -0,0 +1,258 @@
+"""
+SentinelHunt Benchmark Suite
+
+Purpose:
+- Measure throughput of every pipeline stage on synthetic traffic of
+  controlled size (10k to 10M flows) with injected scan, beacon, tunnel
+  and exfiltration patterns
+- Report flows/s (packets/s for parsing), peak RSS and wall-time
+  percentiles per stage as JSON, so releases can be compared
+
+Each stage runs as its own process, exactly as it is run by hand, inside a
+scratch workspace laid out like the repository; the repository's own
+outputs are never touched. Peak RSS is the stage process's own high-water
+mark (worker processes a stage spawns are not included).
+
+Usage:
+    python3 -m experiments.benchmark --flows 10000 100000 --repeat 3 [--pcap]
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+
+from detection_engine import flow_store
+from experiments.synthetic_traffic import ATTACK_FRACTION, flow_features, synthesize, write_pcap
+
+# ========================================
+# CONFIGURATION
+# ========================================
+REPO_ROOT = Path(__file__).resolve().parent.parent
+OUTPUT_DIR = Path("experiments/results")
+DEFAULT_SIZES = [10_000]
+PERCENTILES = [50, 90, 95, 99]
+
+# name, module and arguments (run from the workspace root), files removed
+# before each run so every repeat is cold
+STAGES = [
+    ("parse", ["feature_engineering.parse_pcap", "{pcap}"], []),
+    ("baseline", ["analysis.baseline_analysis"], []),
+    ("ml_train_score", ["ml.train_baseline"], []),
+    ("threat_score", ["detection_engine.scoring.threat_score"], []),
+    ("severity", ["detection_engine.scoring.severity"], []),
+    ("labeling", ["detection_engine.scoring.threat_labeler"], []),
+    ("alerting", ["detection_engine.scoring.alert_generator"], []),
+    ("aggregation", ["detection_engine.intelligence.aggregator"], []),
+    ("explanation", ["explainability.explanation_engine"], ["explainability/outputs/shap_cache.db"]),
+]
+
+
+# ========================================
+# WORKSPACE
+# ========================================
+def make_workspace(root):
+    for sub in ["feature_engineering/outputs", "ml/models", "explainability/outputs", "analysis"]:
+        (root / sub).mkdir(parents=True, exist_ok=True)
+    return root
+
+
+def prepare_inputs(workspace, n_flows, seed, with_pcap):
+    started = time.perf_counter()
+    flows, packets = synthesize(n_flows, attack_fraction=ATTACK_FRACTION, seed=seed)
+    features = flow_features(flows, packets)
+
+    pcap = None
+    if with_pcap:
+        pcap = workspace / "synthetic.pcap"
+        write_pcap(pcap, flows, packets)
+    else:
+        # In the format the stages will look for it (SENTINELHUNT_INTERMEDIATE_FORMAT)
+        flow_store.write_flows(
+            features, flow_store.intermediate_path(workspace / "feature_engineering/outputs/flow_features.csv")
+        )
+
+    return {
+        "flows": int(len(flows)),
+        "packets": int(len(packets["time"])),
+        "labels": {label: int(count) for label, count in flows["label"].value_counts().items()},
+        "pcap_bytes": pcap.stat().st_size if pcap else None,
+        "generate_seconds": round(time.perf_counter() - started, 3),
+    }, pcap
+
+
+# ========================================
+# STAGE RUNNER
+# ========================================
+# Runs a stage module and records its own peak RSS at exit. A
+# forked child's ru_maxrss starts from the parent's RSS, so it cannot be used
+# directly; VmHWM is per address space and resets on exec.
+STAGE_WRAPPER = """
+import atexit, resource, runpy, sys
+
+rss_file, module, args = sys.argv[1], sys.argv[2], sys.argv[3:]
+
+def _report():
+    peak_kb = None
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    peak_kb = int(line.split()[1])
+    except OSError:
+        usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        peak_kb = usage // 1024 if sys.platform == "darwin" else usage
+    with open(rss_file, "w") as f:
+        f.write(str(peak_kb))
+
+atexit.register(_report)
+sys.argv = [module] + args
+runpy.run_module(module, run_name="__main__", alter_sys=True)
+"""
+
+
+def run_stage(command, cwd, log_path):
+    """Run one stage process; returns (seconds, peak RSS MB, exit code)."""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [str(REPO_ROOT), os.environ.get("PYTHONPATH")])),
+               MPLBACKEND="Agg", PYTHONWARNINGS="ignore")
+    rss_file = Path(log_path).with_suffix(".rss")
+    rss_file.unlink(missing_ok=True)
+
+    with open(log_path, "ab") as log:
+        started = time.perf_counter()
+        code = subprocess.call([sys.executable, "-c", STAGE_WRAPPER, str(rss_file)] + command,
+                               cwd=cwd, env=env, stdout=log, stderr=subprocess.STDOUT)
+        elapsed = time.perf_counter() - started
+
+    rss_mb = int(rss_file.read_text()) / 1024 if rss_file.exists() else None
+    return elapsed, rss_mb, code
+
+
+def resolve(command, pcap):
+    return [str(pcap) if part == "{pcap}" else part for part in command]
+
+
+def summarize(seconds, rss, units, unit_name):
+    samples = np.array(seconds)
+    median = float(np.median(samples))
+    summary = {
+        "runs": len(seconds),
+        "seconds": [round(s, 4) for s in seconds],
+        "latency_percentiles": {f"p{p}": round(float(np.percentile(samples, p)), 4) for p in PERCENTILES},
+        "min_seconds": round(float(samples.min()), 4),
+        "max_seconds": round(float(samples.max()), 4),
+        "peak_rss_mb": round(max(rss), 1) if None not in rss else None,
+        "flows_per_second": round(units["flows"] / median, 1) if median > 0 else None,
+    }
+    if unit_name == "packets":
+        summary["packets_per_second"] = round(units["packets"] / median, 1) if median > 0 else None
+    return summary
+
+
+def benchmark_size(n_flows, repeat, seed, with_pcap, stages, keep):
+    workspace = make_workspace(Path(tempfile.mkdtemp(prefix=f"sentinelhunt-bench-{n_flows}-")))
+    log_path = workspace / "stages.log"
+    print(f"\n[+] {n_flows:,} flows  (workspace: {workspace})")
+
+    try:
+        inputs, pcap = prepare_inputs(workspace, n_flows, seed, with_pcap)
+        print(f"[+] Generated {inputs['flows']:,} flows / {inputs['packets']:,} packets "
+              f"in {inputs['generate_seconds']:.2f}s")
+
+        results = {}
+        for name, command, fresh in STAGES:
+            if stages and name not in stages:
+                continue
+            if name == "parse" and pcap is None:
+                results[name] = {"skipped": "no pcap (run with --pcap)"}
+                continue
+
+            seconds, rss = [], []
+            for _ in range(repeat):
+                for path in fresh:
+                    (workspace / path).unlink(missing_ok=True)
+                elapsed, peak, code = run_stage(resolve(command, pcap), workspace, log_path)
+                if code != 0:
+                    results[name] = {"failed": f"exit code {code}", "log": str(log_path)}
+                    break
+                seconds.append(elapsed)
+                rss.append(peak)
+            else:
+                results[name] = summarize(seconds, rss, inputs, "packets" if name == "parse" else "flows")
+                print(f"  {name:<16} p50 {results[name]['latency_percentiles']['p50']:>9.3f}s  "
+                      f"{results[name]['flows_per_second'] or 0:>12,.0f} flows/s  "
+                      f"{results[name]['peak_rss_mb'] or 0:>8.1f} MB")
+                continue
+
+            print(f"  {name:<16} FAILED ({results[name]['failed']}); see {log_path}")
+            break   # later stages depend on this one
+
+        return {"n_flows": n_flows, "inputs": inputs, "stages": results}
+    finally:
+        if not keep:
+            shutil.rmtree(workspace, ignore_errors=True)
+
+
+# ========================================
+# MAIN EXECUTION
+# ========================================
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark SentinelHunt pipeline stages on synthetic traffic")
+    parser.add_argument("--flows", type=int, nargs="+", default=DEFAULT_SIZES, help="flow counts to benchmark")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per stage (for percentiles)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--pcap", action="store_true", help="write a pcap and benchmark parsing (needs scapy)")
+    parser.add_argument("--stages", nargs="+", choices=[s[0] for s in STAGES], help="only these stages")
+    parser.add_argument("--keep", action="store_true", help="keep the scratch workspaces")
+    parser.add_argument("--output", help="result file (default: experiments/results/benchmark_<timestamp>.json)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    OUTPUT_DIR.mkdir(exist_ok=True)
+
+    report = {
+        "created": datetime.now(timezone.utc).isoformat().replace("+00:00", "Z"),
+        "environment": environment(),
+        "config": {"repeat": args.repeat, "seed": args.seed, "attack_fraction": ATTACK_FRACTION,
+                   "pcap": args.pcap},
+        "runs": [
+            benchmark_size(n, args.repeat, args.seed, args.pcap, args.stages, args.keep)
+            for n in args.flows
+        ],
+    }
+
+    output = Path(args.output) if args.output else OUTPUT_DIR / (
+        f"benchmark_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    )
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\n[+] Benchmark results saved to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -19,6 +19,7 @@ Research Standard Metrics for IDS Evaluation
 """
 
 import json
+import sys
 import pandas as pd
 import numpy as np
 from pathlib import Path
@@ -32,13 +33,17 @@ from sklearn.metrics import (
 import matplotlib.pyplot as plt
 import seaborn as sns
 
+from detection_engine import flow_store, query_store
+from experiments.evaluation_engine import join_labels, load_ground_truth
+
 # ========================================
 # CONFIGURATION
 # ========================================
-GROUND_TRUTH_FILE = "ground_truth.json"
-ALERTS_FILE = "../feature_engineering/outputs/alerts.json"
-FLOWS_FILE = "../feature_engineering/outputs/flow_threat_labeled.csv"
-OUTPUT_DIR = Path("results")
+GROUND_TRUTH_FILE = "experiments/ground_truth.json"
+ALERTS_FILE = "feature_engineering/outputs/alerts.json"
+STORE_FILE = "feature_engineering/outputs/sentinelhunt.db"
+FLOWS_FILE = flow_store.intermediate_path("feature_engineering/outputs/flow_threat_labeled.csv")
+OUTPUT_DIR = Path("experiments/results")
 OUTPUT_DIR.mkdir(exist_ok=True)
 
 print("=" * 70)
@@ -50,22 +55,21 @@ print("=" * 70)
 # ========================================
 print("\n[+] Loading data...")
 
-# Load ground truth
-try:
-    with open(GROUND_TRUTH_FILE, 'r') as f:
-        ground_truth = json.load(f)
-    print(f"[+] Ground truth labels: {len(ground_truth)} flows")
-except FileNotFoundError:
-    print("[!] Ground truth file not found. Creating sample...")
-    ground_truth = {}
+# Positional argument: ground-truth file; --store reads the latest run's alerts from the query store
+args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
 
 # Load alerts
-with open(ALERTS_FILE, 'r') as f:
-    alerts = json.load(f)
+if "--store" in sys.argv:
+    alerts = query_store.load_alerts(STORE_FILE)
+else:
+    with open(ALERTS_FILE, 'r') as f:
+        alerts = json.load(f)
 print(f"[+] Alerts: {len(alerts)}")
 
 # Load flows with threat labels
-flows_df = pd.read_csv(FLOWS_FILE)
+flows_df = flow_store.read_flows(
+    FLOWS_FILE, columns=["src_ip", "src_port", "dst_ip", "dst_port", "protocol", "final_threat_score"]
+)
 print(f"[+] Total flows: {len(flows_df)}")
 
 # ========================================
@@ -77,14 +81,28 @@ print("\n[+] Preparing binary classification (benign vs malicious)...")
 threshold = 0.6
 flows_df['predicted_malicious'] = (flows_df['final_threat_score'] > threshold).astype(int)
 
-# For demonstration, create synthetic ground truth
-# In production, this comes from labeled attack/normal PCAPs
-np.random.seed(42)
-flows_df['actual_malicious'] = 0  # Start with all benign
-
-# Mark known attacks as malicious (from critical alerts)
-critical_ips = set(a['src_ip'] for a in alerts if a['severity'] == 'CRITICAL')
-flows_df.loc[flows_df['src_ip'].isin(critical_ips), 'actual_malicious'] = 1
+# Use per-flow ground truth joined by flow key when it covers these flows
+# (see evaluation_engine.py for the full threshold sweep)
+truth = load_ground_truth(args[0] if args else GROUND_TRUTH_FILE)
+flow_labels = join_labels(flows_df, truth)
+
+if pd.notna(flow_labels).any():
+    flows_df['ground_truth'] = flow_labels
+    unlabeled = flows_df['ground_truth'].isna().sum()
+    if unlabeled:
+        print(f"[!] Dropping {unlabeled} flows without a ground-truth label")
+    flows_df = flows_df[flows_df['ground_truth'].notna()].reset_index(drop=True)
+    flows_df['actual_malicious'] = (flows_df['ground_truth'] != 'BENIGN').astype(int)
+else:
+    # For demonstration, create synthetic ground truth
+    # In production, this comes from labeled attack/normal PCAPs
+    print("[!] No flow-level ground truth matched; using critical alert sources as a stand-in")
+    np.random.seed(42)
+    flows_df['actual_malicious'] = 0  # Start with all benign
+
+    # Mark known attacks as malicious (from critical alerts)
+    critical_ips = set(a['src_ip'] for a in alerts if a['severity'] == 'CRITICAL')
+    flows_df.loc[flows_df['src_ip'].isin(critical_ips), 'actual_malicious'] = 1
 
 print(f"[+] Actual malicious flows: {flows_df['actual_malicious'].sum()}")
 print(f"[+] Predicted malicious flows: {flows_df['predicted_malicious'].sum()}")
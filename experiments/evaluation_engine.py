@@ -0,0 +1,315 @@
+"""
+SentinelHunt Evaluation Engine - Threshold Sweeps Against Real Labels
+
+Purpose:
+- Join ground-truth labels to scored flows by flow key
+  (src:port_dst:port_PROTO), instead of deriving "truth" from alerts
+- Compute TP/FP/FN/TN, precision, recall, FPR and F1 at every threshold in
+  one pass, overall and per attack type
+- Attach bootstrap confidence intervals, with replicates spread over a
+  process pool
+
+How it works:
+Each flow falls in one bin between consecutive thresholds, so the whole
+evaluation reduces to a (bin x class) count table built with one
+searchsorted and one bincount. Flows predicted positive at a threshold are
+those in the bins above it, i.e. a reverse cumulative sum over the table.
+Resampling flows with replacement is the same as drawing that table from a
+multinomial over its cells, so bootstrap replicates never touch the flows
+again.
+
+A flow is flagged when its score is strictly above the threshold, as in
+evaluation.py. Per attack type metrics are one-vs-benign: positives are the
+flows of that type, negatives the benign flows.
+
+Usage:
+    python3 -m experiments.evaluation_engine capture_labels.csv [--scores FILE] [--bootstrap 1000]
+"""
+
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from detection_engine import flow_store
+
+# np.trapz was renamed np.trapezoid in numpy 2.0
+trapezoid = getattr(np, "trapezoid", None) or np.trapz
+
+# ========================================
+# CONFIGURATION
+# ========================================
+FLOWS_FILE = flow_store.intermediate_path("feature_engineering/outputs/flow_threat_labeled.csv")
+GROUND_TRUTH_FILE = "experiments/ground_truth.json"
+OUTPUT_DIR = Path("experiments/results")
+
+SCORE_COLUMN = "final_threat_score"
+BENIGN = "BENIGN"
+OVERALL = "ALL"
+
+THRESHOLDS = np.round(np.linspace(0.0, 1.0, 201), 3)
+OPERATING_THRESHOLD = 0.6
+N_BOOTSTRAP = 1000
+BOOTSTRAP_CHUNK = 250
+CONFIDENCE = 0.95
+RANDOM_SEED = 42
+
+METRICS = ["precision", "recall", "fpr", "f1"]
+
+
+# ========================================
+# GROUND TRUTH
+# ========================================
+def flow_keys(flows_df):
+    """Vectorized flow keys in the ground-truth format: src:port_dst:port_PROTO."""
+    return (
+        flows_df["src_ip"].astype(str) + ":" + flows_df["src_port"].astype(np.int64).astype(str) + "_"
+        + flows_df["dst_ip"].astype(str) + ":" + flows_df["dst_port"].astype(np.int64).astype(str) + "_"
+        + flows_df["protocol"].astype(str)
+    )
+
+
+def load_ground_truth(path):
+    """
+    Labels indexed by flow key.
+
+    Accepts the per-flow CSV written by synthetic_traffic.py (flow_key, label
+    columns) or a JSON file with a "flow_labels" object of flow_key -> label.
+    """
+    path = Path(path)
+    if path.suffix == ".csv":
+        labels = pd.read_csv(path, usecols=["flow_key", "label"])
+        return labels.drop_duplicates("flow_key", keep="last").set_index("flow_key")["label"]
+
+    with open(path, "r") as f:
+        data = json.load(f)
+    return pd.Series(data.get("flow_labels", {}), dtype=object).rename_axis("flow_key").rename("label")
+
+
+def join_labels(flows_df, truth):
+    """Ground-truth label per flow (NaN where the flow has no label)."""
+    return flow_keys(flows_df).map(truth).to_numpy()
+
+
+# ========================================
+# THRESHOLD SWEEP
+# ========================================
+def count_table(scores, classes, thresholds, n_classes):
+    """Flow counts per (threshold bin, class); bin b holds scores above exactly b thresholds."""
+    bins = np.searchsorted(thresholds, scores, side="left")
+    cells = np.bincount(bins * n_classes + classes, minlength=(len(thresholds) + 1) * n_classes)
+    return cells.reshape(len(thresholds) + 1, n_classes)
+
+
+def flagged_counts(table):
+    """Flows flagged (score > threshold) per class at each threshold: reverse cumsum over bins."""
+    above = np.cumsum(table[::-1], axis=0)[::-1]
+    return above[1:]
+
+
+def rates(tp, fp, positives, negatives):
+    """Metric arrays from flagged counts; all inputs broadcast against each other."""
+    tp, fp = np.asarray(tp, dtype=float), np.asarray(fp, dtype=float)
+    fn, tn = positives - tp, negatives - fp
+    with np.errstate(divide="ignore", invalid="ignore"):
+        precision = np.where(tp + fp > 0, tp / (tp + fp), 0.0)
+        recall = np.where(positives > 0, tp / positives, 0.0)
+        fpr = np.where(negatives > 0, fp / negatives, 0.0)
+        f1 = np.where(precision + recall > 0, 2 * precision * recall / (precision + recall), 0.0)
+    return {"tp": tp, "fp": fp, "fn": fn, "tn": tn,
+            "precision": precision, "recall": recall, "fpr": fpr, "f1": f1}
+
+
+def metrics_by_type(table, class_names):
+    """Metrics per threshold for ALL attacks vs benign and for each attack type vs benign."""
+    flagged = flagged_counts(table)
+    totals = table.sum(axis=0)
+    benign = class_names.index(BENIGN)
+    attacks = [i for i, name in enumerate(class_names) if i != benign]
+
+    results = {OVERALL: rates(flagged[..., attacks].sum(axis=-1), flagged[..., benign],
+                              totals[..., attacks].sum(axis=-1), totals[..., benign])}
+    for i in attacks:
+        results[class_names[i]] = rates(flagged[..., i], flagged[..., benign], totals[..., i], totals[..., benign])
+    return results
+
+
+def auc_roc(scores, is_attack):
+    """Exact ROC AUC from a sweep over every distinct score."""
+    thresholds = np.unique(scores)
+    table = count_table(scores, is_attack.astype(np.int64), thresholds, 2)
+    flagged = flagged_counts(table)
+    totals = table.sum(axis=0)
+    if totals[0] == 0 or totals[1] == 0:
+        return None
+    # Prepend "flag everything" so the curve starts at (1, 1)
+    tpr = np.concatenate([[1.0], flagged[:, 1] / totals[1]])
+    fpr = np.concatenate([[1.0], flagged[:, 0] / totals[0]])
+    return float(-trapezoid(tpr, fpr))
+
+
+# ========================================
+# BOOTSTRAP
+# ========================================
+def _bootstrap_chunk(args):
+    table, class_names, replicates, seed = args
+    rng = np.random.default_rng(seed)
+    flat = table.ravel()
+    draws = rng.multinomial(flat.sum(), flat / flat.sum(), size=replicates).reshape((replicates,) + table.shape)
+    results = metrics_by_type(draws.transpose(1, 0, 2), class_names)
+    # (threshold, replicate) -> metric arrays per attack type
+    return {name: {m: values[m] for m in METRICS} for name, values in results.items()}
+
+
+def bootstrap_intervals(table, class_names, n_bootstrap=N_BOOTSTRAP, confidence=CONFIDENCE,
+                        seed=RANDOM_SEED, workers=None):
+    """
+    Percentile bootstrap intervals for every metric, threshold and attack type.
+
+    Replicates are drawn in fixed-size chunks with independent seeds, so the
+    result depends on the seed but not on the number of workers.
+    """
+    sizes = [min(BOOTSTRAP_CHUNK, n_bootstrap - i) for i in range(0, n_bootstrap, BOOTSTRAP_CHUNK)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    tasks = [(table, class_names, size, s) for size, s in zip(sizes, seeds)]
+
+    workers = workers if workers is not None else (os.cpu_count() or 1)
+    if workers <= 1 or len(tasks) <= 1:
+        chunks = [_bootstrap_chunk(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+            chunks = list(pool.map(_bootstrap_chunk, tasks))
+
+    alpha = (1 - confidence) / 2
+    intervals = {}
+    for name in chunks[0]:
+        intervals[name] = {}
+        for metric in METRICS:
+            samples = np.concatenate([chunk[name][metric] for chunk in chunks], axis=1)
+            low, high = np.quantile(samples, [alpha, 1 - alpha], axis=1)
+            intervals[name][metric] = (low, high)
+    return intervals
+
+
+# ========================================
+# EVALUATION
+# ========================================
+def evaluate(scores, labels, thresholds=THRESHOLDS, n_bootstrap=N_BOOTSTRAP, seed=RANDOM_SEED, workers=None):
+    """
+    Threshold sweep for labeled flows.
+
+    Returns a long DataFrame with one row per (attack_type, threshold), where
+    attack_type is ALL or an attack label, holding counts, metrics and (with
+    n_bootstrap > 0) <metric>_low / <metric>_high confidence bounds.
+    """
+    scores = np.asarray(scores, dtype=float)
+    labels = pd.Series(labels, dtype=object)
+    thresholds = np.unique(np.asarray(thresholds, dtype=float))
+
+    class_names = [BENIGN] + sorted(set(labels.unique()) - {BENIGN})
+    classes = pd.Categorical(labels, categories=class_names).codes.astype(np.int64)
+
+    table = count_table(scores, classes, thresholds, len(class_names))
+    results = metrics_by_type(table, class_names)
+    intervals = bootstrap_intervals(table, class_names, n_bootstrap, seed=seed, workers=workers) if n_bootstrap else {}
+
+    frames = []
+    for name, values in results.items():
+        frame = pd.DataFrame({"attack_type": name, "threshold": thresholds})
+        for column in ["tp", "fp", "fn", "tn"]:
+            frame[column] = np.broadcast_to(values[column], thresholds.shape).astype(np.int64)
+        for metric in METRICS:
+            frame[metric] = values[metric]
+            if name in intervals:
+                frame[f"{metric}_low"], frame[f"{metric}_high"] = intervals[name][metric]
+        frames.append(frame)
+    return pd.concat(frames, ignore_index=True)
+
+
+def summarize(sweep, scores, labels, operating_threshold=OPERATING_THRESHOLD):
+    """Operating point, best-F1 threshold and AUC per attack type."""
+    summary = {}
+    labels = pd.Series(labels, dtype=object)
+    for name, rows in sweep.groupby("attack_type", sort=False):
+        at = rows.iloc[np.argmin(np.abs(rows["threshold"].to_numpy() - operating_threshold))]
+        best = rows.iloc[int(np.argmax(rows["f1"].to_numpy()))]
+
+        keep = (labels == BENIGN) | ((labels != BENIGN) if name == OVERALL else (labels == name))
+        summary[name] = {
+            "positives": int(at["tp"] + at["fn"]),
+            "negatives": int(at["fp"] + at["tn"]),
+            "operating_point": _point(at),
+            "best_f1": _point(best),
+            "auc_roc": auc_roc(np.asarray(scores)[keep.to_numpy()], (labels[keep] != BENIGN).to_numpy()),
+        }
+    return summary
+
+
+def _point(row):
+    point = {"threshold": float(row["threshold"])}
+    for metric in METRICS:
+        point[metric] = round(float(row[metric]), 4)
+        if f"{metric}_low" in row:
+            point[f"{metric}_ci"] = [round(float(row[f"{metric}_low"]), 4), round(float(row[f"{metric}_high"]), 4)]
+    return point
+
+
+# ========================================
+# MAIN EXECUTION
+# ========================================
+def parse_args():
+    parser = argparse.ArgumentParser(description="Threshold sweep of threat scores against ground-truth labels")
+    parser.add_argument("labels", nargs="?", default=GROUND_TRUTH_FILE,
+                        help="per-flow labels: CSV (flow_key,label) or JSON with flow_labels")
+    parser.add_argument("--scores", default=FLOWS_FILE, help="scored flows (CSV or Parquet)")
+    parser.add_argument("--score-column", default=SCORE_COLUMN)
+    parser.add_argument("--bootstrap", type=int, default=N_BOOTSTRAP, help="replicates (0 disables CIs)")
+    parser.add_argument("--workers", type=int, help="bootstrap processes (default: all CPUs)")
+    parser.add_argument("--seed", type=int, default=RANDOM_SEED)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    OUTPUT_DIR.mkdir(exist_ok=True)
+
+    columns = ["src_ip", "src_port", "dst_ip", "dst_port", "protocol", args.score_column]
+    flows_df = flow_store.read_flows(args.scores, columns=columns)
+    truth = load_ground_truth(args.labels)
+
+    started = time.perf_counter()
+    labels = join_labels(flows_df, truth)
+    matched = pd.notna(labels)
+    print(f"[+] Joined {matched.sum():,} of {len(flows_df):,} flows to {len(truth):,} ground-truth labels")
+    if not matched.any():
+        print("[!] No flow matched a ground-truth key; nothing to evaluate")
+        return
+
+    scores = flows_df[args.score_column].to_numpy(dtype=float)[matched]
+    labels = labels[matched]
+    sweep = evaluate(scores, labels, n_bootstrap=args.bootstrap, seed=args.seed, workers=args.workers)
+    summary = summarize(sweep, scores, labels)
+    elapsed = time.perf_counter() - started
+
+    sweep.to_csv(OUTPUT_DIR / "threshold_sweep.csv", index=False)
+    with open(OUTPUT_DIR / "evaluation_by_type.json", "w") as f:
+        json.dump({"flows": int(matched.sum()), "unlabeled_flows": int((~matched).sum()),
+                   "thresholds": len(THRESHOLDS), "bootstrap": args.bootstrap, "attack_types": summary}, f, indent=2)
+
+    print(f"[+] Swept {len(THRESHOLDS)} thresholds x {len(summary)} attack types in {elapsed:.2f}s")
+    print(f"\n  {'attack type':<20} {'prec':>7} {'recall':>7} {'fpr':>7} {'f1':>7}   best-F1 threshold")
+    for name, result in summary.items():
+        point = result["operating_point"]
+        print(f"  {name:<20} {point['precision']:>7.3f} {point['recall']:>7.3f} {point['fpr']:>7.3f} "
+              f"{point['f1']:>7.3f}   {result['best_f1']['threshold']:.3f} (F1 {result['best_f1']['f1']:.3f})")
+    print(f"\n[+] Metrics at threshold {OPERATING_THRESHOLD}; full sweep saved to {OUTPUT_DIR / 'threshold_sweep.csv'}")
+    print(f"[+] Summary saved to {OUTPUT_DIR / 'evaluation_by_type.json'}")
+
+
+if __name__ == "__main__":
+    main()
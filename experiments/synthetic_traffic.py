@@ -0,0 +1,701 @@
+"""
+SentinelHunt Synthetic Traffic
+
+Purpose:
+- Generate benign background traffic with injected attack patterns
+  (port scan, C2 beaconing, DNS tunneling, data exfiltration) at any scale
+- Produce flow features exactly as feature_engineering/parse_pcap.py would
+  compute them from the same packets
+- Write the packets to a pcap file without scapy, with ground-truth
+  labels keyed by flow, faster than real time and with no network access
+
+Attack campaigns reproduce the scripts in attack_scenarios/ (same ports,
+intervals, jitter, query structure and chunk sizes) on synthetic
+timestamps. Traffic is built as per-packet numpy arrays (flow index, time,
+frame size), so 10M flows are generated in vectorized passes rather than
+packet by packet, and large captures are written in time-ordered chunks.
+
+Usage:
+    python3 -m experiments.synthetic_traffic capture.pcap --flows 1000000 --span 86400
+"""
+
+import argparse
+import math
+import socket
+import struct
+import time
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# ========================================
+# CONFIGURATION
+# ========================================
+START_EPOCH = 1_767_225_600.0   # 2026-01-01T00:00:00Z
+SPAN_SECONDS = 3600
+ATTACK_FRACTION = 0.02
+CHUNK_FLOWS = 500_000
+
+# Share of attack flows per attack type
+ATTACK_MIX = {
+    "PORT_SCAN": 0.4,
+    "DNS_TUNNELING": 0.3,
+    "C2_BEACONING": 0.2,
+    "DATA_EXFILTRATION": 0.1,
+}
+
+FLOW_COLUMNS = [
+    "src_ip", "dst_ip", "src_port", "dst_port", "protocol",
+    "first_seen", "last_seen",
+    "packet_count", "duration", "total_bytes", "avg_packet_size",
+    "min_iat", "max_iat", "mean_iat", "std_iat",
+    "bytes_per_second", "packets_per_second", "avg_bytes_per_packet",
+    "dns_query_length", "dns_subdomain_depth", "dns_entropy", "dns_query",
+]
+
+COMMON_DOMAINS = [
+    "google.com", "github.com", "microsoft.com", "ubuntu.com", "cloudflare.com",
+    "amazonaws.com", "wikipedia.org", "python.org", "slack.com", "zoom.us",
+]
+HOST_PREFIXES = ["www", "api", "cdn", "mail", "login", "static"]
+WEB_PORTS = [443, 443, 443, 80, 8080, 22]
+
+DNS_SERVER = "192.168.1.1"
+BASE64_ALPHABET = np.array(list("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789"))
+
+ETH_HEADER = 14
+IP_HEADER = 20
+TCP_HEADER = 20
+UDP_HEADER = 8
+DNS_HEADER = 12
+MAX_FRAME = 1514
+
+
+# ========================================
+# ADDRESS POOLS
+# ========================================
+def _pool(prefix, size):
+    return np.array([f"{prefix}.{i // 250 % 250}.{i % 250 + 2}" for i in range(size)])
+
+
+def _campaign_ip(prefix, campaign):
+    campaign = np.asarray(campaign)
+    return np.char.add(f"{prefix}.", np.char.add((campaign // 250 % 250).astype(str),
+                                                  np.char.add(".", (campaign % 250 + 2).astype(str))))
+
+
+CLIENTS = _pool("192.168", 5000)
+SERVERS = _pool("203.0", 2000)
+EPHEMERAL_PORTS = (32768, 61000)
+
+
+# ========================================
+# ATTACK SCENARIOS
+# ========================================
+# Parameters mirror the live scripts in attack_scenarios/, so an offline
+# campaign produces the same traffic shape as running the script once.
+
+# port_scan.sh: nmap phases (protocol, ports, probes per second)
+SCAN_PHASES = [
+    ("TCP", list(range(1, 1001)), 100),             # -sS -p 1-1000 --max-rate 100
+    ("TCP", list(range(20, 81)), 500),              # -sT -p 20-80
+    ("UDP", [53, 67, 161], 10),                     # -sU -p 53,67,161
+    ("TCP", [22, 80, 443, 3389], 10),               # -sV -p 22,80,443,3389
+]
+
+# beaconing.py
+BEACON_INTERVAL = 5
+BEACON_COUNT = 30
+BEACON_JITTER = 0.5
+C2_PORT = 443
+
+# dns_tunnel.py
+TUNNEL_DNS_SERVER = "8.8.8.8"
+TUNNEL_DOMAIN = "attacker-c2-domain.com"
+TUNNEL_DURATION_SECONDS = 60
+TUNNEL_QUERY_INTERVAL = 0.5
+LOWER_ALNUM = np.array(list("abcdefghijklmnopqrstuvwxyz0123456789"))
+
+# exfiltration.py: one HTTPS POST per chunk, 0.1s pause between chunks
+EXFIL_SIZE_MB = 10
+EXFIL_CHUNK_KB = 256
+EXFIL_PAUSE = 0.1
+EXFIL_PORT = 443
+TCP_MSS = 1448
+
+CAMPAIGN_FLOWS = {
+    "PORT_SCAN": sum(len(ports) for _, ports, _ in SCAN_PHASES),
+    "C2_BEACONING": BEACON_COUNT,
+    "DNS_TUNNELING": int(TUNNEL_DURATION_SECONDS / TUNNEL_QUERY_INTERVAL),
+    "DATA_EXFILTRATION": EXFIL_SIZE_MB * 1024 // EXFIL_CHUNK_KB,
+}
+
+
+# ========================================
+# TRAFFIC GENERATOR
+# ========================================
+class TrafficGenerator:
+    """
+    Seeded generator of benign and attack flows, chunk by chunk.
+
+    Every pattern returns per-flow columns: src_ip, dst_ip, src_port,
+    dst_port, protocol, start, packet_count, iat, jitter, size, size_sd,
+    dns_query, label. Flows are one direction (initiator -> responder).
+    Attack campaigns and client source ports are numbered across chunks, so
+    every generated flow has a distinct 5-tuple and its label stays exact
+    however many chunks a capture is built from.
+    """
+
+    def __init__(self, seed=42, attack_fraction=ATTACK_FRACTION, rng=None):
+        self.rng = rng if rng is not None else np.random.default_rng(seed)
+        self.attack_fraction = attack_fraction
+        self._client_ports = np.zeros(len(CLIENTS), dtype=np.int64)
+        self._campaigns = Counter()
+
+    def chunk(self, n_flows, start=START_EPOCH, span=SPAN_SECONDS):
+        """Flows starting within [start, start + span), and their packets."""
+        n_attack = int(round(n_flows * self.attack_fraction))
+
+        parts = [self.benign(n_flows - n_attack, start, span)]
+        for label, share in ATTACK_MIX.items():
+            count = int(round(n_attack * share))
+            if count:
+                parts.append(self.PATTERNS[label](self, count, start, span))
+
+        flows = pd.DataFrame({
+            name: np.concatenate([np.asarray(part[name]) for part in parts])
+            for name in parts[0]
+        })
+        return flows, synthesize_packets(flows, self.rng)
+
+    def _campaign_ids(self, label, n):
+        """Campaign number of each of n flows, continuing from earlier chunks."""
+        per_campaign = CAMPAIGN_FLOWS[label]
+        first = self._campaigns[label]
+        campaigns = -(-n // per_campaign)
+        self._campaigns[label] += campaigns
+        index = np.arange(n)
+        return first + index // per_campaign, index % per_campaign, campaigns
+
+    def _start_times(self, campaigns, start, span, length):
+        return start + self.rng.random(campaigns) * max(span - length, 0)
+
+    # ----------------------------------------
+    # Benign background
+    # ----------------------------------------
+    def benign(self, n, start, span):
+        rng = self.rng
+        is_dns = rng.random(n) < 0.3
+        domains = np.array([f"{p}.{d}" for p in HOST_PREFIXES for d in COMMON_DOMAINS])
+
+        # Each client hands out source ports sequentially, like a real stack
+        client = rng.integers(0, len(CLIENTS), n)
+        rank = pd.Series(client).groupby(client).cumcount().to_numpy()
+        low, high = EPHEMERAL_PORTS
+        src_port = low + (self._client_ports[client] + rank) % (high - low)
+        self._client_ports += np.bincount(client, minlength=len(CLIENTS))
+
+        return _flows(
+            n,
+            src_ip=CLIENTS[client],
+            dst_ip=np.where(is_dns, DNS_SERVER, SERVERS[rng.integers(0, len(SERVERS), n)]),
+            src_port=src_port,
+            dst_port=np.where(is_dns, 53, rng.choice(WEB_PORTS, n)),
+            protocol=np.where(is_dns, "UDP", "TCP"),
+            start=start + rng.random(n) * span,
+            packet_count=np.where(is_dns, 2, np.minimum(4 + rng.geometric(0.08, n), 400)),
+            iat=np.where(is_dns, rng.uniform(0.0005, 0.05, n), rng.lognormal(-3.0, 1.2, n)),
+            jitter=0.9,
+            size=np.where(is_dns, 90, rng.uniform(120, 1200, n)),
+            size_sd=np.where(is_dns, 20, 350),
+            dns_query=np.where(is_dns, domains[rng.integers(0, len(domains), n)], None),
+            label="BENIGN",
+        )
+
+    # ----------------------------------------
+    # Attack patterns
+    # ----------------------------------------
+    def port_scan(self, n, start, span):
+        campaign, step, campaigns = self._campaign_ids("PORT_SCAN", n)
+
+        # Phase of each probe, its port and its offset from the campaign start
+        phase_of, port_of, offset_of = [], [], []
+        elapsed = 0.0
+        for phase, (_, ports, rate) in enumerate(SCAN_PHASES):
+            phase_of += [phase] * len(ports)
+            port_of += ports
+            offset_of += list(elapsed + np.arange(len(ports)) / rate)
+            elapsed += len(ports) / rate + 1.0
+        phase_of, port_of, offset_of = np.array(phase_of), np.array(port_of), np.array(offset_of)
+        protocols = np.array([proto for proto, _, _ in SCAN_PHASES])
+
+        first = self._start_times(campaigns, start, span, elapsed)
+        local = campaign - campaign.min()
+
+        return _flows(
+            n,
+            src_ip=_campaign_ip("10.66", campaign),
+            dst_ip=_campaign_ip("172.20", campaign),
+            # nmap keeps one source port per scan phase
+            src_port=40000 + phase_of[step] * 1000 + campaign % 1000,
+            dst_port=port_of[step],
+            protocol=protocols[phase_of[step]],
+            start=first[local] + offset_of[step],
+            packet_count=self.rng.integers(1, 3, n),
+            iat=0.0005,
+            jitter=0.2,
+            size=60,
+            size_sd=0,
+            dns_query=None,
+            label="PORT_SCAN",
+        )
+
+    def beaconing(self, n, start, span, interval=BEACON_INTERVAL):
+        campaign, beat, campaigns = self._campaign_ids("C2_BEACONING", n)
+        first = self._start_times(campaigns, start, span, BEACON_COUNT * interval) + BEACON_JITTER
+        local = campaign - campaign.min()
+
+        return _flows(
+            n,
+            src_ip=_campaign_ip("10.50", campaign),
+            dst_ip=_campaign_ip("185.220", campaign),
+            src_port=EPHEMERAL_PORTS[0] + beat,
+            dst_port=C2_PORT,
+            protocol="TCP",
+            # Each beacon is a new short connection every interval ± jitter
+            start=first[local] + beat * interval + self.rng.uniform(-BEACON_JITTER, BEACON_JITTER, n),
+            packet_count=self.rng.integers(6, 11, n),
+            iat=0.05,
+            jitter=0.05,
+            size=180,
+            size_sd=10,
+            dns_query=None,
+            label="C2_BEACONING",
+        )
+
+    def dns_tunnel(self, n, start, span, interval=TUNNEL_QUERY_INTERVAL):
+        campaign, query, campaigns = self._campaign_ids("DNS_TUNNELING", n)
+        first = self._start_times(campaigns, start, span, CAMPAIGN_FLOWS["DNS_TUNNELING"] * interval)
+        local = campaign - campaign.min()
+
+        # base64 chunk split 16/16 plus 8 random [a-z0-9], as dns_tunnel.py builds it
+        encoded = BASE64_ALPHABET[self.rng.integers(0, len(BASE64_ALPHABET), (n, 32))]
+        noise = LOWER_ALNUM[self.rng.integers(0, len(LOWER_ALNUM), (n, 8))]
+        queries = np.array([
+            f"{''.join(e[:16])}.{''.join(e[16:])}.{''.join(r)}.{TUNNEL_DOMAIN}"
+            for e, r in zip(encoded, noise)
+        ])
+
+        return _flows(
+            n,
+            src_ip=_campaign_ip("10.60", campaign),
+            dst_ip=TUNNEL_DNS_SERVER,
+            src_port=EPHEMERAL_PORTS[0] + query,
+            dst_port=53,
+            protocol="UDP",
+            start=first[local] + query * interval,
+            packet_count=2,
+            iat=0.002,
+            jitter=0.5,
+            size=150,
+            size_sd=5,
+            dns_query=queries,
+            label="DNS_TUNNELING",
+        )
+
+    def exfiltration(self, n, start, span):
+        campaign, chunk, campaigns = self._campaign_ids("DATA_EXFILTRATION", n)
+        packets = EXFIL_CHUNK_KB * 1024 // TCP_MSS + 1
+        iat = 0.0005
+        first = self._start_times(campaigns, start, span,
+                                  CAMPAIGN_FLOWS["DATA_EXFILTRATION"] * (packets * iat + EXFIL_PAUSE))
+        local = campaign - campaign.min()
+
+        return _flows(
+            n,
+            src_ip=_campaign_ip("10.70", campaign),
+            dst_ip=_campaign_ip("198.51", campaign),
+            src_port=EPHEMERAL_PORTS[0] + chunk,
+            dst_port=EXFIL_PORT,
+            protocol="TCP",
+            # One connection per 256 KB chunk in full-size segments
+            start=first[local] + chunk * (packets * iat + EXFIL_PAUSE),
+            packet_count=packets,
+            iat=iat,
+            jitter=0.5,
+            size=TCP_MSS + ETH_HEADER + IP_HEADER + TCP_HEADER,
+            size_sd=0,
+            dns_query=None,
+            label="DATA_EXFILTRATION",
+        )
+
+    PATTERNS = {
+        "PORT_SCAN": port_scan,
+        "DNS_TUNNELING": dns_tunnel,
+        "C2_BEACONING": beaconing,
+        "DATA_EXFILTRATION": exfiltration,
+    }
+
+
+# ========================================
+# PATTERN FUNCTIONS
+# ========================================
+# One pattern from the caller's rng, as the first version of this module
+# generated them. Each call numbers campaigns and client ports from zero;
+# build a capture from several calls with one TrafficGenerator instead.
+def benign_flows(n, rng, start=START_EPOCH, span=SPAN_SECONDS):
+    return TrafficGenerator(rng=rng).benign(n, start, span)
+
+
+def port_scan_flows(n, rng, start=START_EPOCH, span=SPAN_SECONDS):
+    return TrafficGenerator(rng=rng).port_scan(n, start, span)
+
+
+def beacon_flows(n, rng, start=START_EPOCH, span=SPAN_SECONDS, interval=BEACON_INTERVAL):
+    return TrafficGenerator(rng=rng).beaconing(n, start, span, interval)
+
+
+def dns_tunnel_flows(n, rng, start=START_EPOCH, span=SPAN_SECONDS, interval=TUNNEL_QUERY_INTERVAL):
+    return TrafficGenerator(rng=rng).dns_tunnel(n, start, span, interval)
+
+
+def exfil_flows(n, rng, start=START_EPOCH, span=SPAN_SECONDS):
+    return TrafficGenerator(rng=rng).exfiltration(n, start, span)
+
+
+PATTERNS = {
+    "PORT_SCAN": port_scan_flows,
+    "DNS_TUNNELING": dns_tunnel_flows,
+    "C2_BEACONING": beacon_flows,
+    "DATA_EXFILTRATION": exfil_flows,
+}
+
+
+def _flows(n, **columns):
+    return {name: np.broadcast_to(value, n) if np.ndim(value) == 0 else value for name, value in columns.items()}
+
+
+def synthesize(n_flows, attack_fraction=ATTACK_FRACTION, seed=42, start=START_EPOCH, span=SPAN_SECONDS):
+    """
+    Generate flows and their packets in one chunk.
+
+    Returns (flows, packets): `flows` is a DataFrame with one row per flow
+    (5-tuple, dns_query, label); `packets` is a dict of per-packet arrays
+    `flow`, `time` and `size` grouped by flow, plus per-flow `offsets`.
+    """
+    return TrafficGenerator(seed, attack_fraction).chunk(n_flows, start, span)
+
+
+def min_frame_size(flows):
+    dns_len = flows["dns_query"].map(lambda q: len(q) + 2 + DNS_HEADER + 4 if isinstance(q, str) else 0).to_numpy()
+    l4 = np.where(flows["protocol"].to_numpy() == "UDP", UDP_HEADER, TCP_HEADER)
+    return ETH_HEADER + IP_HEADER + l4 + dns_len
+
+
+def synthesize_packets(flows, rng):
+    counts = flows["packet_count"].to_numpy(dtype=np.int64)
+    offsets = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    flow = np.repeat(np.arange(len(flows)), counts)
+    first = np.zeros(len(flow), dtype=bool)
+    first[offsets] = True
+
+    iat = flows["iat"].to_numpy(dtype=float)[flow]
+    jitter = flows["jitter"].to_numpy(dtype=float)[flow]
+    gaps = np.maximum(iat * (1 + jitter * rng.uniform(-1, 1, len(flow))), 1e-6)
+    gaps[first] = 0.0
+    elapsed = np.cumsum(gaps)
+    elapsed -= np.repeat(elapsed[offsets], counts)
+
+    # pcap timestamps have microsecond resolution
+    time = np.round((flows["start"].to_numpy(dtype=float)[flow] + elapsed) * 1e6) / 1e6
+
+    size = rng.normal(flows["size"].to_numpy(dtype=float)[flow], flows["size_sd"].to_numpy(dtype=float)[flow])
+    size = np.clip(np.round(size), np.repeat(min_frame_size(flows), counts), MAX_FRAME).astype(np.int64)
+
+    return {"flow": flow, "time": time, "size": size, "offsets": offsets}
+
+
+# ========================================
+# FLOW FEATURES
+# ========================================
+def shannon_entropy(s):
+    if not s:
+        return 0
+    probs = [c / len(s) for c in Counter(s).values()]
+    return -sum(p * math.log2(p) for p in probs)
+
+
+def flow_features(flows, packets):
+    """Flow feature table with the columns and rounding parse_pcap.py produces."""
+    offsets = packets["offsets"]
+    counts = flows["packet_count"].to_numpy(dtype=np.int64)
+    time = packets["time"]
+    size = packets["size"]
+
+    first_seen = time[offsets]
+    last_seen = np.maximum.reduceat(time, offsets)
+    total_bytes = np.add.reduceat(size, offsets)
+    duration = np.where(counts > 1, last_seen - first_seen, 0.0)
+
+    # IATs within each flow; the first packet of a flow has none
+    iat = np.diff(time, prepend=time[0])
+    has_iat = np.ones(len(time), dtype=bool)
+    has_iat[offsets] = False
+    n_iat = np.maximum(counts - 1, 1)
+    mean_iat = np.add.reduceat(np.where(has_iat, iat, 0.0), offsets) / n_iat
+    sq_iat = np.add.reduceat(np.where(has_iat, iat ** 2, 0.0), offsets) / n_iat
+    std_iat = np.sqrt(np.maximum(sq_iat - mean_iat ** 2, 0.0))
+    min_iat = np.minimum.reduceat(np.where(has_iat, iat, np.inf), offsets)
+    max_iat = np.maximum.reduceat(np.where(has_iat, iat, -np.inf), offsets)
+
+    single = counts < 2
+    for column in (mean_iat, std_iat, min_iat, max_iat):
+        column[single] = 0.0
+
+    safe_duration = np.where(duration > 0, duration, 1.0)
+    avg_size = total_bytes / counts
+
+    queries = flows["dns_query"]
+    dns_stats = {q: (len(q), q.count("."), shannon_entropy(q)) for q in queries.dropna().unique()}
+    stats = queries.map(lambda q: dns_stats.get(q, (0, 0, 0.0)))
+
+    df = pd.DataFrame({
+        "src_ip": flows["src_ip"],
+        "dst_ip": flows["dst_ip"],
+        "src_port": flows["src_port"].astype(np.int64),
+        "dst_port": flows["dst_port"].astype(np.int64),
+        "protocol": flows["protocol"],
+        "first_seen": first_seen,
+        "last_seen": last_seen,
+        "packet_count": counts,
+        "duration": np.round(duration, 6),
+        "total_bytes": total_bytes,
+        "avg_packet_size": np.round(avg_size, 2),
+        "min_iat": np.round(min_iat, 6),
+        "max_iat": np.round(max_iat, 6),
+        "mean_iat": np.round(mean_iat, 6),
+        "std_iat": np.round(std_iat, 6),
+        "bytes_per_second": np.round(np.where(duration > 0, total_bytes / safe_duration, 0), 2),
+        "packets_per_second": np.round(np.where(duration > 0, counts / safe_duration, 0), 2),
+        "avg_bytes_per_packet": np.round(avg_size, 2),
+        "dns_query_length": [s[0] for s in stats],
+        "dns_subdomain_depth": [s[1] for s in stats],
+        "dns_entropy": np.round([s[2] for s in stats], 3),
+        "dns_query": queries.where(queries.notna(), None),
+    })
+    return df[FLOW_COLUMNS]
+
+
+def flow_key(src_ip, src_port, dst_ip, dst_port, protocol):
+    """Ground-truth flow key: src:port_dst:port_PROTO (see ground_truth.json)."""
+    return f"{src_ip}:{int(src_port)}_{dst_ip}:{int(dst_port)}_{protocol}"
+
+
+# ========================================
+# PCAP WRITER
+# ========================================
+PCAP_GLOBAL_HEADER = struct.pack("<IHHiIII", 0xA1B2C3D4, 2, 4, 0, 0, 65535, 1)
+ETH_TEMPLATE = bytes.fromhex("020000000002" "020000000001" "0800")
+
+
+def _dns_query(name, ident):
+    labels = b"".join(bytes([len(part)]) + part.encode() for part in name.split("."))
+    return struct.pack("!HHHHHH", ident, 0x0100, 1, 0, 0, 0) + labels + b"\x00" + struct.pack("!HH", 1, 1)
+
+
+def _ip_checksum_base(src, dst, proto):
+    # Sum of the constant IPv4 header words; total length is added per packet
+    header = struct.pack("!BBHHHBBH4s4s", 0x45, 0, 0, 0, 0, 64, proto, 0, src, dst)
+    return sum(struct.unpack("!10H", header))
+
+
+class PcapWriter:
+    """
+    Streaming pcap writer for chunked generation.
+
+    write(flows, packets, until) writes the packets timestamped before
+    `until` in time order and carries the rest (the tails of flows that run
+    past the chunk boundary) into the next call, so a capture built chunk by
+    chunk stays globally time-ordered with bounded memory.
+    """
+
+    def __init__(self, path, buffer_packets=20_000):
+        self.f = open(path, "wb")
+        self.f.write(PCAP_GLOBAL_HEADER)
+        self.buffer_packets = buffer_packets
+        self.packets_written = 0
+        self._templates = {}
+        self._next_flow = 0
+        self._carry = {"flow": np.zeros(0, dtype=np.int64), "time": np.zeros(0), "size": np.zeros(0, dtype=np.int64)}
+
+    def write(self, flows, packets, until=None):
+        base = self._next_flow
+        self._next_flow += len(flows)
+        for i, (src, dst, sport, dport, proto, query) in enumerate(zip(
+            flows["src_ip"], flows["dst_ip"], flows["src_port"], flows["dst_port"],
+            flows["protocol"], flows["dns_query"],
+        )):
+            src_b, dst_b = socket.inet_aton(src), socket.inet_aton(dst)
+            proto_num = 17 if proto == "UDP" else 6
+            payload = _dns_query(query, (base + i) & 0xFFFF) if isinstance(query, str) else b""
+            self._templates[base + i] = (src_b, dst_b, int(sport), int(dport), proto_num, payload,
+                                         _ip_checksum_base(src_b, dst_b, proto_num))
+
+        flow = np.concatenate([self._carry["flow"], packets["flow"] + base])
+        time = np.concatenate([self._carry["time"], packets["time"]])
+        size = np.concatenate([self._carry["size"], packets["size"]])
+
+        order = np.argsort(time, kind="stable")
+        cut = len(order) if until is None else int(np.searchsorted(time[order], until))
+        now, later = order[:cut], order[cut:]
+        self._write_packets(flow[now], time[now], size[now])
+
+        self._carry = {"flow": flow[later], "time": time[later], "size": size[later]}
+        pending = set(np.unique(self._carry["flow"]).tolist())
+        self._templates = {k: v for k, v in self._templates.items() if k in pending}
+
+    def close(self):
+        self.write(_empty_flows(), {"flow": np.zeros(0, dtype=np.int64), "time": np.zeros(0),
+                                    "size": np.zeros(0, dtype=np.int64)})
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _write_packets(self, flow_of, times, sizes):
+        seconds = np.floor(times).astype(np.int64).tolist()
+        micros = np.round((times - np.floor(times)) * 1e6).astype(np.int64).clip(0, 999_999).tolist()
+        templates = self._templates
+
+        pack_record = struct.Struct("<IIII").pack
+        pack_ip = struct.Struct("!BBHHHBBH4s4s").pack
+        pack_tcp = struct.Struct("!HHIIBBHHH").pack
+        pack_udp = struct.Struct("!HHHH").pack
+
+        buffer = []
+        for flow, sec, usec, size in zip(flow_of.tolist(), seconds, micros, sizes.tolist()):
+            src, dst, sport, dport, proto, payload, base = templates[flow]
+            ip_len = size - ETH_HEADER
+            checksum = base + ip_len
+            checksum = (checksum & 0xFFFF) + (checksum >> 16)
+            checksum = ~((checksum & 0xFFFF) + (checksum >> 16)) & 0xFFFF
+
+            if proto == 17:
+                l4 = pack_udp(sport, dport, ip_len - IP_HEADER, 0)
+                body_len = ip_len - IP_HEADER - UDP_HEADER
+            else:
+                l4 = pack_tcp(sport, dport, 1, 1, 0x50, 0x18, 65535, 0, 0)
+                body_len = ip_len - IP_HEADER - TCP_HEADER
+
+            buffer.append(pack_record(sec, usec, size, size))
+            buffer.append(ETH_TEMPLATE)
+            buffer.append(pack_ip(0x45, 0, ip_len, 0, 0, 64, proto, checksum, src, dst))
+            buffer.append(l4)
+            buffer.append(payload + bytes(body_len - len(payload)) if payload else bytes(body_len))
+
+            if len(buffer) >= self.buffer_packets * 5:
+                self.f.write(b"".join(buffer))
+                buffer = []
+        self.f.write(b"".join(buffer))
+        self.packets_written += len(sizes)
+
+
+def _empty_flows():
+    return pd.DataFrame({name: [] for name in ["src_ip", "dst_ip", "src_port", "dst_port", "protocol", "dns_query"]})
+
+
+def write_pcap(path, flows, packets, buffer_packets=20_000):
+    """Write one chunk of packets in time order as Ethernet/IPv4/TCP|UDP frames."""
+    with PcapWriter(path, buffer_packets) as writer:
+        writer.write(flows, packets)
+    return writer.packets_written
+
+
+# ========================================
+# OFFLINE CAPTURE GENERATION
+# ========================================
+def ground_truth_rows(flows):
+    keys = [flow_key(*k) for k in zip(flows["src_ip"], flows["src_port"], flows["dst_ip"],
+                                      flows["dst_port"], flows["protocol"])]
+    return pd.DataFrame({
+        "flow_key": keys,
+        "src_ip": flows["src_ip"],
+        "src_port": flows["src_port"],
+        "dst_ip": flows["dst_ip"],
+        "dst_port": flows["dst_port"],
+        "protocol": flows["protocol"],
+        "label": flows["label"],
+    })
+
+
+def generate_capture(pcap_path, n_flows, labels_path=None, attack_fraction=ATTACK_FRACTION, seed=42,
+                     start=START_EPOCH, span=SPAN_SECONDS, chunk_flows=CHUNK_FLOWS):
+    """
+    Write a synthetic capture of n_flows flows spread over `span` seconds,
+    plus ground-truth labels (CSV, one row per flow keyed by flow_key).
+
+    Flows are generated and written in time-ordered chunks, so memory is
+    bounded by chunk_flows regardless of the capture size.
+    """
+    generator = TrafficGenerator(seed, attack_fraction)
+    labels_path = labels_path or f"{Path(pcap_path).with_suffix('')}_labels.csv"
+    chunks = max(1, -(-n_flows // chunk_flows))
+    chunk_span = span / chunks
+    summary = Counter()
+
+    with PcapWriter(pcap_path) as writer, open(labels_path, "w") as labels:
+        for index in range(chunks):
+            count = min(chunk_flows, n_flows - index * chunk_flows)
+            chunk_start = round(start + index * chunk_span, 6)
+            flows, packets = generator.chunk(count, chunk_start, chunk_span)
+
+            writer.write(flows, packets, until=round(start + (index + 1) * chunk_span, 6))
+            ground_truth_rows(flows).to_csv(labels, header=index == 0, index=False)
+            summary.update(flows["label"].tolist())
+
+    return {
+        "flows": sum(summary.values()),
+        "packets": writer.packets_written,
+        "labels": dict(summary),
+        "capture_seconds": span,
+        "pcap": str(pcap_path),
+        "labels_file": str(labels_path),
+    }
+
+
+# ========================================
+# MAIN EXECUTION
+# ========================================
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic attack capture with ground-truth labels")
+    parser.add_argument("output", help="pcap file to write")
+    parser.add_argument("--flows", type=int, default=100_000)
+    parser.add_argument("--span", type=float, default=SPAN_SECONDS, help="capture duration in seconds")
+    parser.add_argument("--attack-fraction", type=float, default=ATTACK_FRACTION)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--labels", help="ground-truth CSV (default: <output>_labels.csv)")
+    parser.add_argument("--chunk-flows", type=int, default=CHUNK_FLOWS)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    summary = generate_capture(args.output, args.flows, args.labels, args.attack_fraction, args.seed,
+                               span=args.span, chunk_flows=args.chunk_flows)
+    elapsed = time.perf_counter() - started
+
+    size_mb = Path(args.output).stat().st_size / 1e6
+    print(f"[+] Wrote {summary['packets']:,} packets / {summary['flows']:,} flows "
+          f"({size_mb:,.1f} MB) to {summary['pcap']}")
+    for label, count in sorted(summary["labels"].items()):
+        print(f"  {label:<20} {count:,}")
+    print(f"[+] Ground truth: {summary['labels_file']}")
+    print(f"[+] Generated {args.span:,.0f}s of traffic in {elapsed:.1f}s "
+          f"({args.span / elapsed:,.0f}x real time)")
+
+
+if __name__ == "__main__":
+    main()
@@ -8,8 +8,13 @@ Purpose:
 """
 
 import json
+import sys
+import textwrap
+from collections import OrderedDict
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, Iterator, List, Optional
+
+NARRATIVE_CACHE_SIZE = 4096
 
 # ========================================
 # EXPLANATION TEMPLATES
@@ -47,18 +52,43 @@ THREAT_PATTERNS = {
 # ========================================
 
 class AlertExplainer:
-    def __init__(self, alert_explanations_file: str):
+    def __init__(self, alert_explanations_file: str, cache_size: int = NARRATIVE_CACHE_SIZE):
         with open(alert_explanations_file, 'r') as f:
             self.explanations = json.load(f)
+        
+        # alert_id -> explanation, built once; narratives are rendered on
+        # request and the most recently used ones kept in a bounded LRU
+        self.index: Dict[str, Dict] = {a['alert_id']: a for a in self.explanations}
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, str]" = OrderedDict()
+        self.cache_hits = 0
+        self.cache_misses = 0
+    
+    def get_explanation(self, alert_id: str) -> Optional[Dict]:
+        return self.index.get(alert_id)
     
     def generate_narrative(self, alert_id: str) -> str:
         """Generate human-readable narrative for an alert"""
         
-        # Find alert explanation
-        alert = next((a for a in self.explanations if a['alert_id'] == alert_id), None)
+        cached = self._cache.get(alert_id)
+        if cached is not None:
+            self._cache.move_to_end(alert_id)
+            self.cache_hits += 1
+            return cached
+        
+        alert = self.index.get(alert_id)
         if not alert:
             return f"No explanation found for {alert_id}"
         
+        self.cache_misses += 1
+        narrative = self._render(alert)
+        if self.cache_size > 0:
+            self._cache[alert_id] = narrative
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return narrative
+    
+    def _render(self, alert: Dict) -> str:
         narrative = []
         narrative.append(f"🚨 Alert: {alert['alert_id']} ({alert['severity']})")
         narrative.append(f"   Threat: {alert['threat_label']}")
@@ -112,21 +142,27 @@ class AlertExplainer:
         
         return ""
     
-    def generate_all_narratives(self, output_file: str):
-        """Generate narratives for all alerts"""
-        narratives = []
-        
+    def iter_narratives(self) -> Iterator[Dict[str, str]]:
+        """Render every narrative lazily, without filling the LRU cache"""
         for alert in self.explanations:
-            narrative = self.generate_narrative(alert['alert_id'])
-            narratives.append({
+            yield {
                 'alert_id': alert['alert_id'],
-                'narrative': narrative
-            })
+                'narrative': self._render(alert)
+            }
+    
+    def generate_all_narratives(self, output_file: str):
+        """Generate narratives for all alerts (batch export)"""
+        count = 0
         
         with open(output_file, 'w') as f:
-            json.dump(narratives, f, indent=2)
+            f.write('[')
+            for entry in self.iter_narratives():
+                f.write(',\n' if count else '\n')
+                f.write(textwrap.indent(json.dumps(entry, indent=2), '  '))
+                count += 1
+            f.write('\n]' if count else ']')
         
-        print(f"[+] Generated {len(narratives)} alert narratives → {output_file}")
+        print(f"[+] Generated {count} alert narratives → {output_file}")
 
 # ========================================
 # MAIN EXECUTION
@@ -137,10 +173,17 @@ if __name__ == "__main__":
     print("  SENTINELHUNT ALERT EXPLAINER")
     print("=" * 60)
     
-    explainer = AlertExplainer("outputs/alert_explanations.json")
+    explainer = AlertExplainer("explainability/outputs/alert_explanations.json")
+    
+    # On-demand: render only the requested alerts
+    if len(sys.argv) > 1:
+        for alert_id in sys.argv[1:]:
+            print()
+            print(explainer.generate_narrative(alert_id))
+        sys.exit(0)
     
     # Generate narratives for all alerts
-    explainer.generate_all_narratives("outputs/alert_narratives.json")
+    explainer.generate_all_narratives("explainability/outputs/alert_narratives.json")
     
     # Display sample explanation
     if explainer.explanations:
@@ -12,23 +12,34 @@ Research Basis:
 - Explainable AI for cybersecurity decision-making
 """
 
-import pandas as pd
-import numpy as np
-import joblib
-import shap
 import json
-import matplotlib.pyplot as plt
+import multiprocessing
+import sys
+import time
 from pathlib import Path
 
+import joblib
+import numpy as np
+import pandas as pd
+
+from detection_engine import flow_store, query_store
+
+# shap and matplotlib are imported only on the code paths that use them:
+# the explanation JSON never waits on the global SHAP sample or on figures
+
 # ========================================
 # CONFIGURATION
 # ========================================
-MODEL_FILE = "../ml/models/iforest_model.pkl"
-SCALER_FILE = "../ml/models/scaler.pkl"
-FLOWS_FILE = "../feature_engineering/outputs/flow_features_enriched.csv"
-ALERTS_FILE = "../feature_engineering/outputs/alerts.json"
-OUTPUT_DIR = Path("outputs")
-OUTPUT_DIR.mkdir(exist_ok=True)
+MODEL_FILE = "ml/models/isolation_forest.pkl"
+SCALER_FILE = "ml/models/scaler.pkl"
+FLOWS_FILE = flow_store.intermediate_path("feature_engineering/outputs/flow_features_enriched.csv")
+ALERTS_FILE = "feature_engineering/outputs/alerts.json"
+STORE_FILE = "feature_engineering/outputs/sentinelhunt.db"
+OUTPUT_DIR = Path("explainability/outputs")
+GLOBAL_SAMPLE_FILE = OUTPUT_DIR / "global_sample.npz"
+
+SAMPLE_SIZE = 500
+RANDOM_SEED = 42
 
 FEATURE_COLUMNS = [
     "packet_count",
@@ -47,172 +58,228 @@ FEATURE_COLUMNS = [
     "dns_entropy"
 ]
 
+
 # ========================================
 # LOAD DATA & MODELS
 # ========================================
-print("[+] Loading models and data...")
+def load_inputs():
+    print("[+] Loading models and data...")
 
-# Load trained models
-iforest_model = joblib.load(MODEL_FILE)
-scaler = joblib.load(SCALER_FILE)
+    # Load trained models
+    iforest_model = joblib.load(MODEL_FILE)
+    scaler = joblib.load(SCALER_FILE)
 
-# Load flow data
-flows_df = pd.read_csv(FLOWS_FILE)
-X = flows_df[FEATURE_COLUMNS]
-X_scaled = scaler.transform(X)
+    # Load flow data
+    flows_df = flow_store.read_flows(FLOWS_FILE, columns=["src_ip", "dst_ip"] + FEATURE_COLUMNS)
+    X = flows_df[FEATURE_COLUMNS]
+    X_scaled = scaler.transform(X)
 
-# Load alerts for context
-with open(ALERTS_FILE, 'r') as f:
-    alerts = json.load(f)
+    # Load alerts for context (--store: the latest run in the query store)
+    if "--store" in sys.argv:
+        alerts = query_store.load_alerts(STORE_FILE)
+    else:
+        with open(ALERTS_FILE, 'r') as f:
+            alerts = json.load(f)
+
+    print(f"[+] Loaded {len(flows_df)} flows")
+    print(f"[+] Loaded {len(alerts)} alerts")
+    return iforest_model, flows_df, X, X_scaled, alerts
 
-print(f"[+] Loaded {len(flows_df)} flows")
-print(f"[+] Loaded {len(alerts)} alerts")
 
 # ========================================
 # GLOBAL FEATURE IMPORTANCE
 # ========================================
-print("\n[+] Calculating global feature importance with SHAP...")
+def save_global_sample(X_scaled, sample_file=GLOBAL_SAMPLE_FILE):
+    """Draw the seeded global sample now; its SHAP values are computed in the deferred step"""
+    # Seeded so runs are comparable (importance_accumulator.py covers all traffic incrementally)
+    sample_size = min(SAMPLE_SIZE, len(X_scaled))
+    sample_indices = np.random.default_rng(RANDOM_SEED).choice(len(X_scaled), sample_size, replace=False)
+    np.savez(sample_file, X_sample=X_scaled[sample_indices])
 
-# Create SHAP explainer for Isolation Forest
-# Note: For Isolation Forest, we use TreeExplainer
-explainer = shap.TreeExplainer(iforest_model)
 
-# Calculate SHAP values for all flows (sample for speed)
-sample_size = min(500, len(X_scaled))
-sample_indices = np.random.choice(len(X_scaled), sample_size, replace=False)
-X_sample = X_scaled[sample_indices]
+def global_importance(explainer, X_sample):
+    print("\n[+] Calculating global feature importance with SHAP...")
 
-shap_values = explainer.shap_values(X_sample)
+    shap_values = explainer.shap_values(X_sample)
 
-# ========================================
-# FEATURE IMPORTANCE SUMMARY
-# ========================================
-print("\n[+] Global Feature Importance (Mean |SHAP|):")
-print("=" * 60)
+    print("\n[+] Global Feature Importance (Mean |SHAP|):")
+    print("=" * 60)
 
-mean_abs_shap = np.abs(shap_values).mean(axis=0)
-feature_importance = pd.DataFrame({
-    'feature': FEATURE_COLUMNS,
-    'importance': mean_abs_shap
-}).sort_values('importance', ascending=False)
+    mean_abs_shap = np.abs(shap_values).mean(axis=0)
+    feature_importance = pd.DataFrame({
+        'feature': FEATURE_COLUMNS,
+        'importance': mean_abs_shap
+    }).sort_values('importance', ascending=False)
+
+    for idx, row in feature_importance.iterrows():
+        print(f"  {row['feature']:<25} {row['importance']:.6f}")
 
-for idx, row in feature_importance.iterrows():
-    print(f"  {row['feature']:<25} {row['importance']:.6f}")
+    # Save feature importance
+    feature_importance.to_csv(OUTPUT_DIR / "feature_importance.csv", index=False)
+    print(f"\n[+] Feature importance saved to {OUTPUT_DIR / 'feature_importance.csv'}")
+    return shap_values
 
-# Save feature importance
-feature_importance.to_csv(OUTPUT_DIR / "feature_importance.csv", index=False)
-print(f"\n[+] Feature importance saved to {OUTPUT_DIR / 'feature_importance.csv'}")
 
 # ========================================
-# VISUALIZATIONS
+# PER-ALERT EXPLANATIONS
 # ========================================
-print("\n[+] Generating SHAP visualizations...")
-
-# Summary plot (beeswarm)
-plt.figure(figsize=(10, 8))
-shap.summary_plot(
-    shap_values, 
-    pd.DataFrame(X_sample, columns=FEATURE_COLUMNS),
-    show=False
-)
-plt.tight_layout()
-plt.savefig(OUTPUT_DIR / "shap_summary_plot.png", dpi=150, bbox_inches='tight')
-plt.close()
-print(f"[+] Summary plot saved to {OUTPUT_DIR / 'shap_summary_plot.png'}")
-
-# Feature importance bar plot
-plt.figure(figsize=(10, 6))
-shap.summary_plot(
-    shap_values,
-    pd.DataFrame(X_sample, columns=FEATURE_COLUMNS),
-    plot_type="bar",
-    show=False
-)
-plt.tight_layout()
-plt.savefig(OUTPUT_DIR / "shap_bar_plot.png", dpi=150, bbox_inches='tight')
-plt.close()
-print(f"[+] Bar plot saved to {OUTPUT_DIR / 'shap_bar_plot.png'}")
+def explain_alerts(explainer, flows_df, X, X_scaled, alerts):
+    print("\n[+] Generating per-alert explanations...")
+
+    alert_explanations = []
+
+    # Get top 10 critical alerts
+    critical_alerts = [a for a in alerts if a['severity'] == 'CRITICAL'][:10]
+
+    for alert in critical_alerts:
+        # Find matching flow in dataset
+        src_ip = alert['src_ip']
+        dst_ip = alert['dst_ip']
+
+        # Find flow (simple matching - in production, use alert_id mapping)
+        matching_flows = flows_df[
+            (flows_df['src_ip'] == src_ip) &
+            (flows_df['dst_ip'] == dst_ip)
+        ]
+
+        if matching_flows.empty:
+            continue
+
+        flow_idx = matching_flows.index[0]
+        flow_features = X_scaled[flow_idx:flow_idx+1]
+
+        # Calculate SHAP values for this specific flow
+        shap_values_single = explainer.shap_values(flow_features)[0]
+
+        # Get top 5 contributing features
+        feature_contributions = pd.DataFrame({
+            'feature': FEATURE_COLUMNS,
+            'shap_value': shap_values_single,
+            'actual_value': X.iloc[flow_idx].values
+        }).sort_values('shap_value', key=abs, ascending=False).head(5)
+
+        # Build human-readable explanation
+        explanation = {
+            'alert_id': alert['alert_id'],
+            'severity': alert['severity'],
+            'threat_label': alert['threat_label'],
+            'src_ip': src_ip,
+            'dst_ip': dst_ip,
+            'ml_score': alert['final_threat_score'],
+            'top_features': []
+        }
+
+        for _, row in feature_contributions.iterrows():
+            explanation['top_features'].append({
+                'feature': row['feature'],
+                'shap_contribution': float(row['shap_value']),
+                'actual_value': float(row['actual_value']),
+                'impact': 'increased' if row['shap_value'] > 0 else 'decreased'
+            })
+
+        alert_explanations.append(explanation)
+
+    # Save per-alert explanations
+    with open(OUTPUT_DIR / "alert_explanations.json", 'w') as f:
+        json.dump(alert_explanations, f, indent=2)
+
+    print(f"[+] Alert explanations saved to {OUTPUT_DIR / 'alert_explanations.json'}")
+    print(f"[+] Generated explanations for {len(alert_explanations)} critical alerts")
+    return alert_explanations
+
 
 # ========================================
-# PER-ALERT EXPLANATIONS
+# DEFERRED GLOBAL STEP: IMPORTANCE + VISUALIZATIONS
 # ========================================
-print("\n[+] Generating per-alert explanations...")
-
-alert_explanations = []
-
-# Get top 10 critical alerts
-critical_alerts = [a for a in alerts if a['severity'] == 'CRITICAL'][:10]
-
-for alert in critical_alerts:
-    # Find matching flow in dataset
-    src_ip = alert['src_ip']
-    dst_ip = alert['dst_ip']
-    
-    # Find flow (simple matching - in production, use alert_id mapping)
-    matching_flows = flows_df[
-        (flows_df['src_ip'] == src_ip) & 
-        (flows_df['dst_ip'] == dst_ip)
-    ]
-    
-    if matching_flows.empty:
-        continue
-    
-    flow_idx = matching_flows.index[0]
-    flow_features = X_scaled[flow_idx:flow_idx+1]
-    
-    # Calculate SHAP values for this specific flow
-    shap_values_single = explainer.shap_values(flow_features)[0]
-    
-    # Get top 5 contributing features
-    feature_contributions = pd.DataFrame({
-        'feature': FEATURE_COLUMNS,
-        'shap_value': shap_values_single,
-        'actual_value': X.iloc[flow_idx].values
-    }).sort_values('shap_value', key=abs, ascending=False).head(5)
-    
-    # Build human-readable explanation
-    explanation = {
-        'alert_id': alert['alert_id'],
-        'severity': alert['severity'],
-        'threat_label': alert['threat_label'],
-        'src_ip': src_ip,
-        'dst_ip': dst_ip,
-        'ml_score': alert['final_threat_score'],
-        'top_features': []
-    }
-    
-    for _, row in feature_contributions.iterrows():
-        explanation['top_features'].append({
-            'feature': row['feature'],
-            'shap_contribution': float(row['shap_value']),
-            'actual_value': float(row['actual_value']),
-            'impact': 'increased' if row['shap_value'] > 0 else 'decreased'
-        })
-    
-    alert_explanations.append(explanation)
-
-# Save per-alert explanations
-with open(OUTPUT_DIR / "alert_explanations.json", 'w') as f:
-    json.dump(alert_explanations, f, indent=2)
-
-print(f"[+] Alert explanations saved to {OUTPUT_DIR / 'alert_explanations.json'}")
-print(f"[+] Generated explanations for {len(alert_explanations)} critical alerts")
+def render_global(sample_file=GLOBAL_SAMPLE_FILE):
+    """SHAP on the saved global sample, then feature_importance.csv and the plots (separate command or background worker)"""
+    import shap
+
+    with np.load(sample_file) as data:
+        X_sample = data["X_sample"]
+
+    shap_values = global_importance(shap.TreeExplainer(joblib.load(MODEL_FILE)), X_sample)
+    render_plots(shap_values, pd.DataFrame(X_sample, columns=FEATURE_COLUMNS))
+
+
+def render_plots(shap_values, X_sample):
+    """Render the SHAP summary plots for the global sample"""
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    import shap
+
+    print("\n[+] Generating SHAP visualizations...")
+
+    # Summary plot (beeswarm)
+    plt.figure(figsize=(10, 8))
+    shap.summary_plot(shap_values, X_sample, show=False)
+    plt.tight_layout()
+    plt.savefig(OUTPUT_DIR / "shap_summary_plot.png", dpi=150, bbox_inches='tight')
+    plt.close()
+    print(f"[+] Summary plot saved to {OUTPUT_DIR / 'shap_summary_plot.png'}")
+
+    # Feature importance bar plot
+    plt.figure(figsize=(10, 6))
+    shap.summary_plot(shap_values, X_sample, plot_type="bar", show=False)
+    plt.tight_layout()
+    plt.savefig(OUTPUT_DIR / "shap_bar_plot.png", dpi=150, bbox_inches='tight')
+    plt.close()
+    print(f"[+] Bar plot saved to {OUTPUT_DIR / 'shap_bar_plot.png'}")
+
+
+def start_global_worker():
+    """Run the global step in a background process; the interpreter waits for it on exit"""
+    worker = multiprocessing.Process(target=render_global, name="shap-global")
+    worker.start()
+    return worker
+
 
 # ========================================
-# EXPLANATION SUMMARY
+# MAIN EXECUTION
 # ========================================
-print("\n" + "=" * 60)
-print("  EXPLAINABILITY ANALYSIS COMPLETE")
-print("=" * 60)
-print(f"\nTop 3 Most Important Features:")
-for idx, row in feature_importance.head(3).iterrows():
-    print(f"  {idx+1}. {row['feature']:<25} (importance: {row['importance']:.6f})")
-
-print(f"\nOutputs generated:")
-print(f"  - {OUTPUT_DIR / 'feature_importance.csv'}")
-print(f"  - {OUTPUT_DIR / 'shap_summary_plot.png'}")
-print(f"  - {OUTPUT_DIR / 'shap_bar_plot.png'}")
-print(f"  - {OUTPUT_DIR / 'alert_explanations.json'}")
-
-print("\n[+] Use these visualizations in your capstone presentation!")
-print("[+] SHAP values provide transparent, defensible explanations for SOC analysts")
+def main():
+    OUTPUT_DIR.mkdir(exist_ok=True)
+
+    if "plots" in sys.argv[1:]:
+        render_global()
+        return
+
+    import shap
+
+    started = time.perf_counter()
+    iforest_model, flows_df, X, X_scaled, alerts = load_inputs()
+
+    # Create SHAP explainer for Isolation Forest
+    # Note: For Isolation Forest, we use TreeExplainer
+    explainer = shap.TreeExplainer(iforest_model)
+
+    explain_alerts(explainer, flows_df, X, X_scaled, alerts)
+    save_global_sample(X_scaled)
+    print(f"[+] Explanations ready in {time.perf_counter() - started:.2f}s")
+
+    worker = None
+    if "--no-plots" not in sys.argv:
+        worker = start_global_worker()
+
+    # ========================================
+    # EXPLANATION SUMMARY
+    # ========================================
+    print("\n" + "=" * 60)
+    print("  EXPLAINABILITY ANALYSIS COMPLETE")
+    print("=" * 60)
+    print(f"\nOutputs generated:")
+    print(f"  - {OUTPUT_DIR / 'alert_explanations.json'}")
+    if worker is not None:
+        print(f"  - {OUTPUT_DIR / 'feature_importance.csv'} (computing in background)")
+        print(f"  - {OUTPUT_DIR / 'shap_summary_plot.png'} (rendering in background)")
+        print(f"  - {OUTPUT_DIR / 'shap_bar_plot.png'} (rendering in background)")
+    else:
+        print(f"  - global importance and plots skipped; run later with: python3 -m explainability.explain_ml plots")
+
+    print("\n[+] Use these visualizations in your capstone presentation!")
+    print("[+] SHAP values provide transparent, defensible explanations for SOC analysts")
+
+
+if __name__ == "__main__":
+    main()
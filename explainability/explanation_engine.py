@@ -0,0 +1,358 @@
+"""
+SentinelHunt Explanation Engine - Batched, Parallel, Cached SHAP
+
+Purpose:
+- Explain every HIGH/CRITICAL alert in a run, not a hand-picked sample
+- Compute SHAP values in batches, fanned out across a process pool
+- Cache per-flow SHAP values on disk, keyed by model version, flow_id and
+  a hash of the scaled feature row, so re-running after a restart reuses
+  earlier work
+
+The model version is a hash of the model file, so retraining invalidates the
+cache automatically. The 5-tuple alone is not unique (ports are reused and
+a re-parsed capture can change a flow's features), so the row hash keeps two
+flows with the same flow_id from sharing SHAP values. The cache is bounded;
+least recently used entries are evicted once it grows past max_entries.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from detection_engine import flow_store, metrics
+
+# ========================================
+# CONFIGURATION
+# ========================================
+MODEL_FILE = "ml/models/isolation_forest.pkl"
+SCALER_FILE = "ml/models/scaler.pkl"
+FLOWS_FILE = flow_store.intermediate_path("feature_engineering/outputs/flow_features_enriched.csv")
+ALERTS_FILE = "feature_engineering/outputs/alerts.json"
+OUTPUT_DIR = Path("explainability/outputs")
+CACHE_FILE = OUTPUT_DIR / "shap_cache.db"
+# explain_ml.py owns alert_explanations.json; same structure, every HIGH/CRITICAL alert
+OUTPUT_FILE = OUTPUT_DIR / "shap_explanations.json"
+
+EXPLAIN_SEVERITIES = {"HIGH", "CRITICAL"}
+BATCH_SIZE = 256
+MAX_CACHE_ENTRIES = 1_000_000
+TOP_FEATURES = 5
+
+KEY_COLUMNS = ["src_ip", "src_port", "dst_ip", "dst_port", "protocol", "first_seen"]
+
+FEATURE_COLUMNS = [
+    "packet_count",
+    "duration",
+    "total_bytes",
+    "avg_packet_size",
+    "min_iat",
+    "max_iat",
+    "mean_iat",
+    "std_iat",
+    "bytes_per_second",
+    "packets_per_second",
+    "avg_bytes_per_packet",
+    "dns_query_length",
+    "dns_subdomain_depth",
+    "dns_entropy"
+]
+
+
+# ========================================
+# HELPERS
+# ========================================
+def model_version(model_file):
+    """Content hash of the model file; changes whenever the model is retrained."""
+    digest = hashlib.sha256()
+    with open(model_file, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()[:16]
+
+
+def flow_id(src_ip, src_port, dst_ip, dst_port, protocol):
+    """Flow key in the ground-truth label format: src:port_dst:port_PROTO."""
+    return f"{src_ip}:{int(src_port)}_{dst_ip}:{int(dst_port)}_{protocol}"
+
+
+def flow_ids(flows_df):
+    return [
+        flow_id(*key) for key in zip(
+            flows_df["src_ip"], flows_df["src_port"], flows_df["dst_ip"],
+            flows_df["dst_port"], flows_df["protocol"],
+        )
+    ]
+
+
+def row_keys(ids, X_scaled):
+    """Cache keys: flow ID plus a hash of the model input row."""
+    X_scaled = np.ascontiguousarray(X_scaled, dtype=np.float64)
+    return [f"{fid}#{hashlib.blake2b(row.tobytes(), digest_size=8).hexdigest()}" for fid, row in zip(ids, X_scaled)]
+
+
+def event_key(fid, first_seen):
+    return fid, round(float(first_seen), 6)
+
+
+def top_features(contributions, actual_row, k=TOP_FEATURES):
+    """Top-k features by |contribution| in the structure AlertExplainer consumes."""
+    order = np.argsort(-np.abs(contributions), kind="stable")[:k]
+    return [
+        {
+            "feature": FEATURE_COLUMNS[i],
+            "shap_contribution": float(contributions[i]),
+            "actual_value": float(actual_row[i]),
+            "impact": "increased" if contributions[i] > 0 else "decreased",
+        }
+        for i in order
+    ]
+
+
+def match_alerts(alerts, flows_df, severities=None):
+    """
+    Pair alerts with their flow rows.
+
+    Flows are indexed once by (5-tuple, first_seen), so a reused 5-tuple
+    pairs each alert with its own flow; alerts or flows without first_seen
+    fall back to the first flow with the same 5-tuple. Alerts without a flow
+    are left out rather than paired with another flow between the same hosts.
+    Returns ([(alert, row), ...], flow_ids) for alerts whose severity is in
+    `severities` (all alerts when None).
+    """
+    ids = flow_ids(flows_df)
+    first_seen = flows_df["first_seen"] if "first_seen" in flows_df else [None] * len(ids)
+    by_event, by_flow = {}, {}
+    for row, (fid, seen) in enumerate(zip(ids, first_seen)):
+        by_flow.setdefault(fid, row)
+        if seen is not None:
+            by_event.setdefault(event_key(fid, seen), row)
+
+    matched = []
+    for alert in alerts:
+        if severities is not None and alert.get("severity") not in severities:
+            continue
+        fid = flow_id(alert["src_ip"], alert["src_port"], alert["dst_ip"], alert["dst_port"], alert["protocol"])
+        row = None
+        if by_event and alert.get("first_seen") is not None:
+            row = by_event.get(event_key(fid, alert["first_seen"]))
+        if row is None:
+            row = by_flow.get(fid)
+        if row is not None:
+            matched.append((alert, row))
+    return matched, ids
+
+
+def explanation_record(alert, fid, contributions, actual, **extra):
+    return {
+        "alert_id": alert["alert_id"],
+        "flow_id": fid,
+        "severity": alert["severity"],
+        "threat_label": alert["threat_label"],
+        "src_ip": alert["src_ip"],
+        "dst_ip": alert["dst_ip"],
+        "ml_score": alert["final_threat_score"],
+        **extra,
+        "top_features": top_features(contributions, actual),
+    }
+
+
+# ========================================
+# PROCESS POOL WORKERS
+# ========================================
+_worker_explainer = None
+
+
+def _init_worker(model_file):
+    global _worker_explainer
+    import shap
+    _worker_explainer = shap.TreeExplainer(joblib.load(model_file))
+
+
+def _shap_batch(X):
+    return np.asarray(_worker_explainer.shap_values(X), dtype=np.float32)
+
+
+# ========================================
+# PERSISTENT SHAP CACHE
+# ========================================
+class ShapCache:
+    """SQLite-backed LRU cache of SHAP vectors keyed by (model_version, row_key)."""
+
+    def __init__(self, path=CACHE_FILE, max_entries=MAX_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.conn = sqlite3.connect(str(path))
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS shap_cache ("
+            "model_version TEXT NOT NULL, row_key TEXT NOT NULL, shap BLOB NOT NULL, "
+            "last_access REAL NOT NULL, PRIMARY KEY (model_version, row_key))"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_shap_access ON shap_cache (last_access)")
+        self.conn.commit()
+
+    def get_many(self, version, keys, chunk=500):
+        found = {}
+        unique = list(dict.fromkeys(keys))
+        for start in range(0, len(unique), chunk):
+            part = unique[start:start + chunk]
+            placeholders = ", ".join("?" * len(part))
+            rows = self.conn.execute(
+                f"SELECT row_key, shap FROM shap_cache WHERE model_version = ? AND row_key IN ({placeholders})",
+                [version] + part,
+            ).fetchall()
+            for key, blob in rows:
+                found[key] = np.frombuffer(blob, dtype=np.float32)
+
+        now = time.time()
+        with self.conn:
+            self.conn.executemany(
+                "UPDATE shap_cache SET last_access = ? WHERE model_version = ? AND row_key = ?",
+                [(now, version, key) for key in found],
+            )
+        self.hits += len(found)
+        self.misses += len(unique) - len(found)
+        return found
+
+    def put_many(self, version, items):
+        now = time.time()
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO shap_cache VALUES (?, ?, ?, ?)",
+                [(version, key, np.asarray(values, dtype=np.float32).tobytes(), now) for key, values in items],
+            )
+        self.evict()
+
+    def evict(self):
+        (count,) = self.conn.execute("SELECT COUNT(*) FROM shap_cache").fetchone()
+        excess = count - self.max_entries
+        if excess > 0:
+            with self.conn:
+                self.conn.execute(
+                    "DELETE FROM shap_cache WHERE rowid IN "
+                    "(SELECT rowid FROM shap_cache ORDER BY last_access LIMIT ?)",
+                    (excess,),
+                )
+        return max(excess, 0)
+
+    def close(self):
+        self.conn.close()
+
+
+# ========================================
+# ENGINE
+# ========================================
+class ExplanationEngine:
+    def __init__(self, model_file=MODEL_FILE, scaler_file=SCALER_FILE, cache_file=CACHE_FILE,
+                 workers=None, batch_size=BATCH_SIZE, max_cache_entries=MAX_CACHE_ENTRIES):
+        self.model_file = model_file
+        self.scaler = joblib.load(scaler_file)
+        self.version = model_version(model_file)
+        self.cache = ShapCache(cache_file, max_cache_entries)
+        self.workers = workers if workers is not None else (os.cpu_count() or 1)
+        self.batch_size = batch_size
+        self._local_explainer = None
+
+    def shap_values(self, ids, X_scaled):
+        """SHAP matrix for the given flows, served from cache where possible."""
+        keys = row_keys(ids, X_scaled)
+        cached = self.cache.get_many(self.version, keys)
+
+        missing, seen = [], set()
+        for row, key in enumerate(keys):
+            if key not in cached and key not in seen:
+                missing.append(row)
+                seen.add(key)
+
+        metrics.inc("shap_cache_hits_total", len(ids) - len(missing), stage="explanation")
+        metrics.inc("shap_cache_misses_total", len(missing), stage="explanation")
+        if missing:
+            with metrics.timer("shap_compute_seconds", stage="explanation"):
+                computed = self._compute(X_scaled[missing])
+            fresh = [(keys[row], values) for row, values in zip(missing, computed)]
+            self.cache.put_many(self.version, fresh)
+            cached.update(fresh)
+
+        return np.vstack([cached[key] for key in keys])
+
+    def explain_alerts(self, alerts, flows_df, severities=EXPLAIN_SEVERITIES):
+        """Per-alert explanations for every alert whose severity is in `severities`."""
+        matched, ids = match_alerts(alerts, flows_df, severities)
+        # A run without high-severity alerts (or without matching flows) has nothing to explain
+        if not matched:
+            return []
+
+        rows = [row for _, row in matched]
+        X = flows_df[FEATURE_COLUMNS].to_numpy(dtype=float)[rows]
+        X_scaled = self.scaler.transform(pd.DataFrame(X, columns=FEATURE_COLUMNS))
+        shap_matrix = self.shap_values([ids[row] for row in rows], X_scaled)
+
+        return [
+            explanation_record(alert, ids[row], shap_row, actual, model_version=self.version)
+            for (alert, row), shap_row, actual in zip(matched, shap_matrix, X)
+        ]
+
+    def close(self):
+        self.cache.close()
+
+    def _compute(self, X_scaled):
+        batches = [X_scaled[i:i + self.batch_size] for i in range(0, len(X_scaled), self.batch_size)]
+
+        if self.workers <= 1 or len(batches) <= 1:
+            return np.vstack([self._explain_local(batch) for batch in batches])
+
+        with ProcessPoolExecutor(
+            max_workers=min(self.workers, len(batches)),
+            initializer=_init_worker,
+            initargs=(self.model_file,),
+        ) as pool:
+            return np.vstack(list(pool.map(_shap_batch, batches)))
+
+    def _explain_local(self, X):
+        if self._local_explainer is None:
+            import shap
+            self._local_explainer = shap.TreeExplainer(joblib.load(self.model_file))
+        return np.asarray(self._local_explainer.shap_values(X), dtype=np.float32)
+
+
+# ========================================
+# MAIN EXECUTION
+# ========================================
+def main():
+    OUTPUT_DIR.mkdir(exist_ok=True)
+
+    flows_df = flow_store.read_flows(FLOWS_FILE, columns=KEY_COLUMNS + FEATURE_COLUMNS)
+    with open(ALERTS_FILE, "r") as f:
+        alerts = json.load(f)
+
+    started = time.perf_counter()
+    engine = ExplanationEngine(workers=int(sys.argv[1]) if len(sys.argv) > 1 else None)
+    try:
+        with metrics.stage("explanation"):
+            explanations = engine.explain_alerts(alerts, flows_df)
+    finally:
+        engine.close()
+    metrics.inc("alerts_explained_total", len(explanations), stage="explanation")
+
+    with open(OUTPUT_FILE, "w") as f:
+        json.dump(explanations, f, indent=2)
+
+    elapsed = time.perf_counter() - started
+    print(f"[+] Explained {len(explanations)} HIGH/CRITICAL alerts in {elapsed:.2f}s")
+    print(f"[+] SHAP cache: {engine.cache.hits} hits, {engine.cache.misses} misses "
+          f"(model {engine.version})")
+    print(f"[+] Alert explanations saved to {OUTPUT_FILE}")
+
+
+if __name__ == "__main__":
+    main()
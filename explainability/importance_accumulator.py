@@ -0,0 +1,251 @@
+"""
+Incremental Global Feature Importance
+
+Purpose:
+- Replace explain_ml.py's one-off random sample with running mean |SHAP|
+  (or path attribution) over all explained traffic
+- Keep the sums per time window so drift in what drives detections is
+  visible without re-explaining history
+- Persist the accumulator between runs; each batch is merged once
+
+Per window the accumulator keeps a flow count and per-feature sums of |value|
+and value. Merging a batch is one vectorized add, and importance for any
+window (or all of them) is sum / count.
+
+A batch is identified by the model version, its position and size in the
+flow table, and the flows in it (see batch_key()). The IDs of merged batches
+are persisted with the sums and bounded to the most recent max_batch_ids.
+"""
+
+import hashlib
+import os
+import sys
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from detection_engine import flow_store
+from explainability.explanation_engine import (
+    FEATURE_COLUMNS,
+    FLOWS_FILE,
+    KEY_COLUMNS,
+    MODEL_FILE,
+    OUTPUT_DIR,
+    SCALER_FILE,
+    flow_ids,
+    model_version,
+)
+
+
+# ========================================
+# CONFIGURATION
+# ========================================
+WINDOW_SECONDS = 3600
+BATCH_SIZE = 10_000
+# Merged batch IDs remembered for de-duplication (10k-flow batches: 1e9 flows)
+MAX_BATCH_IDS = 100_000
+
+
+def accumulator_file(method):
+    return OUTPUT_DIR / f"importance_{method}.npz"
+
+
+def batch_key(version, start, batch_size, ids, event_times=None):
+    """ID of one merged batch: model version, chunk alignment and the flows in it."""
+    digest = hashlib.sha1(f"{version}:{start}:{batch_size}".encode())
+    digest.update("\n".join(ids).encode())
+    if event_times is not None:
+        digest.update(np.asarray(event_times, dtype=np.float64).tobytes())
+    return digest.hexdigest()[:16]
+
+
+# ========================================
+# ACCUMULATOR
+# ========================================
+class ImportanceAccumulator:
+    def __init__(self, features=FEATURE_COLUMNS, window_seconds=WINDOW_SECONDS, method="shap",
+                 max_batch_ids=MAX_BATCH_IDS):
+        self.features = list(features)
+        self.window_seconds = window_seconds
+        self.method = method
+        self.max_batch_ids = max_batch_ids
+        self._windows = {}
+        # Insertion-ordered; the oldest IDs are forgotten first
+        self._batches = {}
+
+    def add(self, values, event_times=None, batch_id=None):
+        """
+        Merge a batch of per-flow attributions (n_flows x n_features).
+
+        Flows are assigned to windows by event time; without times the whole
+        batch goes to window 0. A batch_id that was already merged is skipped
+        and False is returned.
+        """
+        if batch_id is not None and batch_id in self._batches:
+            return False
+
+        values = np.asarray(values, dtype=float)
+        if event_times is None:
+            windows = np.zeros(len(values), dtype=np.int64)
+        else:
+            windows = np.floor(np.asarray(event_times, dtype=float) / self.window_seconds).astype(np.int64)
+
+        keys, inverse = np.unique(windows, return_inverse=True)
+        counts = np.bincount(inverse, minlength=len(keys))
+        abs_sums = np.zeros((len(keys), len(self.features)))
+        sums = np.zeros((len(keys), len(self.features)))
+        np.add.at(abs_sums, inverse, np.abs(values))
+        np.add.at(sums, inverse, values)
+
+        for i, key in enumerate(keys.tolist()):
+            entry = self._windows.get(key)
+            if entry is None:
+                entry = self._windows[key] = [0, np.zeros(len(self.features)), np.zeros(len(self.features))]
+            entry[0] += int(counts[i])
+            entry[1] += abs_sums[i]
+            entry[2] += sums[i]
+
+        if batch_id is not None:
+            self._remember(batch_id)
+        return True
+
+    def _remember(self, batch_id):
+        self._batches[batch_id] = None
+        while len(self._batches) > self.max_batch_ids:
+            del self._batches[next(iter(self._batches))]
+
+    def windows(self):
+        return sorted(self._windows)
+
+    def flow_count(self, window=None):
+        if window is not None:
+            return self._windows[window][0] if window in self._windows else 0
+        return sum(entry[0] for entry in self._windows.values())
+
+    def importance(self, window=None):
+        """Mean |value| per feature for one window, or across all windows."""
+        entries = [self._windows[window]] if window is not None else list(self._windows.values())
+        count = sum(entry[0] for entry in entries)
+        if count == 0:
+            return pd.Series(0.0, index=self.features)
+        abs_sum = np.sum([entry[1] for entry in entries], axis=0)
+        return pd.Series(abs_sum / count, index=self.features).sort_values(ascending=False)
+
+    def window_importance(self):
+        """One row per window (start epoch), one column per feature."""
+        rows = {
+            window * self.window_seconds: entry[1] / entry[0]
+            for window, entry in sorted(self._windows.items())
+            if entry[0]
+        }
+        return pd.DataFrame.from_dict(rows, orient="index", columns=self.features)
+
+    def drift(self, window_a, window_b):
+        """Change in mean |value| per feature between two windows."""
+        return (self.importance(window_b) - self.importance(window_a)).sort_values(key=abs, ascending=False)
+
+    # ----------------------------------------
+    # Persistence
+    # ----------------------------------------
+    def save(self, path):
+        keys = self.windows()
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(
+            tmp_path,
+            features=np.array(self.features, dtype=str),
+            window_seconds=self.window_seconds,
+            method=self.method,
+            windows=np.array(keys, dtype=np.int64),
+            counts=np.array([self._windows[k][0] for k in keys], dtype=np.int64),
+            abs_sums=np.array([self._windows[k][1] for k in keys]).reshape(len(keys), len(self.features)),
+            sums=np.array([self._windows[k][2] for k in keys]).reshape(len(keys), len(self.features)),
+            batches=np.array(list(self._batches), dtype=str),
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, max_batch_ids=MAX_BATCH_IDS):
+        with np.load(path) as data:
+            acc = cls(
+                features=[str(f) for f in data["features"]],
+                window_seconds=int(data["window_seconds"]),
+                method=str(data["method"]),
+                max_batch_ids=max_batch_ids,
+            )
+            for key, count, abs_sum, total in zip(data["windows"], data["counts"], data["abs_sums"], data["sums"]):
+                acc._windows[int(key)] = [int(count), abs_sum.copy(), total.copy()]
+            for batch_id in data["batches"]:
+                acc._remember(str(batch_id))
+        return acc
+
+    @classmethod
+    def open(cls, path, **kwargs):
+        """Load the accumulator at `path`, or start an empty one."""
+        if os.path.exists(path):
+            return cls.load(path, max_batch_ids=kwargs.get("max_batch_ids", MAX_BATCH_IDS))
+        return cls(**kwargs)
+
+
+# ========================================
+# MAIN EXECUTION
+# ========================================
+def attribution_batches(flows_df, method):
+    scaler = joblib.load(SCALER_FILE)
+
+    if method == "shap":
+        from explainability.explanation_engine import ExplanationEngine
+        engine = ExplanationEngine()
+        compute = engine.shap_values
+    else:
+        from explainability.path_attribution import PathAttributionExplainer
+        engine = None
+        explainer = PathAttributionExplainer(joblib.load(MODEL_FILE))
+
+        def compute(ids, X_scaled):
+            return explainer.attribute(X_scaled)
+
+    try:
+        for start in range(0, len(flows_df), BATCH_SIZE):
+            batch = flows_df.iloc[start:start + BATCH_SIZE]
+            ids = flow_ids(batch)
+            X_scaled = scaler.transform(batch[FEATURE_COLUMNS])
+            yield start, batch, ids, compute(ids, X_scaled)
+    finally:
+        if engine is not None:
+            engine.close()
+
+
+def main():
+    OUTPUT_DIR.mkdir(exist_ok=True)
+    method = "shap" if "--shap" in sys.argv else "path"
+    path = accumulator_file(method)
+
+    flows_df = flow_store.read_flows(FLOWS_FILE, columns=KEY_COLUMNS + FEATURE_COLUMNS)
+    acc = ImportanceAccumulator.open(path, method=method)
+    version = model_version(MODEL_FILE)
+
+    merged = 0
+    for start, batch, ids, values in attribution_batches(flows_df, method):
+        times = batch["first_seen"].to_numpy() if "first_seen" in batch.columns else None
+        # Re-running the same model on the same capture does not count it twice
+        batch_id = batch_key(version, start, BATCH_SIZE, ids, times)
+        if acc.add(values, times, batch_id=batch_id):
+            merged += len(batch)
+    acc.save(path)
+
+    print(f"[+] Merged {merged} flows ({acc.flow_count()} total, {len(acc.windows())} windows, method={method})")
+    print("\n[+] Global Feature Importance (Mean |attribution|):")
+    print("=" * 60)
+    for feature, value in acc.importance().items():
+        print(f"  {feature:<25} {value:.6f}")
+
+    acc.importance().rename("importance").rename_axis("feature").reset_index().to_csv(
+        OUTPUT_DIR / f"feature_importance_{method}.csv", index=False
+    )
+    acc.window_importance().to_csv(OUTPUT_DIR / f"feature_importance_windows_{method}.csv", index_label="window_start")
+    print(f"\n[+] Accumulator saved to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -19,6 +19,8 @@ import numpy as np
 import math
 import sys
 
+from detection_engine import flow_store, metrics
+
 # -------------------------------
 # Load PCAP
 # -------------------------------
@@ -139,6 +141,10 @@ def extract_flow_features(flow_packets):
     # Return final feature set
     # -------------------------------
     return {
+        # Event time (epoch seconds, carried through every stage)
+        "first_seen": min(times),
+        "last_seen": max(times),
+
         # Basic
         "packet_count": packet_count,
         "duration": round(duration, 6),
@@ -159,39 +165,55 @@ def extract_flow_features(flow_packets):
         # DNS
         "dns_query_length": dns_query_length,
         "dns_subdomain_depth": dns_subdomain_depth,
-        "dns_entropy": round(dns_entropy, 3)
+        "dns_entropy": round(dns_entropy, 3),
+        "dns_query": dns_query
     }
 
 
 # -------------------------------
-# Main pipeline
+# Flow table
 # -------------------------------
-def main(pcap_path):
-    packets = load_pcap(pcap_path)
-    flows = extract_flows(packets)
+def build_flow_frame(packets):
+    """
+    One row of flow features per 5-tuple; the in-memory output of this stage.
+    """
+    with metrics.timer("step_seconds", stage="parse", step="flows"):
+        flows = extract_flows(packets)
+    metrics.inc("packets_processed_total", len(packets), stage="parse")
+    metrics.inc("flows_processed_total", len(flows), stage="parse")
 
     print(f"[+] Total flows extracted: {len(flows)}")
 
     rows = []
 
-    for flow_key, pkts in flows.items():
-        features = extract_flow_features(pkts)
+    with metrics.timer("step_seconds", stage="parse", step="features"):
+        for flow_key, pkts in flows.items():
+            features = extract_flow_features(pkts)
 
-        row = {
-            "src_ip": flow_key[0],
-            "dst_ip": flow_key[1],
-            "src_port": flow_key[2],
-            "dst_port": flow_key[3],
-            "protocol": flow_key[4],
-            **features
-        }
+            row = {
+                "src_ip": flow_key[0],
+                "dst_ip": flow_key[1],
+                "src_port": flow_key[2],
+                "dst_port": flow_key[3],
+                "protocol": flow_key[4],
+                **features
+            }
 
-        rows.append(row)
+            rows.append(row)
 
-    df = pd.DataFrame(rows)
+    return pd.DataFrame(rows)
+
+
+# -------------------------------
+# Main pipeline
+# -------------------------------
+def main(pcap_path):
+    with metrics.timer("step_seconds", stage="parse", step="load"):
+        packets = load_pcap(pcap_path)
+    df = build_flow_frame(packets)
 
-    output_path = "outputs/flow_features.csv"
-    df.to_csv(output_path, index=False)
+    output_path = flow_store.intermediate_path("feature_engineering/outputs/flow_features.csv")
+    flow_store.write_flows(df, output_path)
 
     print(f"[+] Saved flow-level features to {output_path}")
     print("[+] Sample output:")
@@ -203,8 +225,9 @@ def main(pcap_path):
 # -------------------------------
 if __name__ == "__main__":
     if len(sys.argv) != 2:
-        print("Usage: python3 parse_pcap.py <pcap_file>")
+        print("Usage: python3 -m feature_engineering.parse_pcap <pcap_file>")
         sys.exit(1)
 
-    main(sys.argv[1])
+    with metrics.stage("parse"):
+        main(sys.argv[1])
 
@@ -1,7 +1,7 @@
-import pandas as pd
+from detection_engine import flow_store
 
 # Load results
-df = pd.read_csv("models/iforest_results.csv")
+df = flow_store.read_flows(flow_store.intermediate_path("ml/models/iforest_results.csv"))
 
 print("\n[+] Total flows:", len(df))
 
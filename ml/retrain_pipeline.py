@@ -1,15 +1,18 @@
 # Model Retraining Pipeline (Placeholder)
 # Extend this script to automate model retraining with new data.
 
+from detection_engine import flow_store
+
+INPUT_FILE = flow_store.intermediate_path("feature_engineering/outputs/flow_features_enriched.csv")
+
 def retrain_model():
-    import pandas as pd
     import joblib
     from sklearn.preprocessing import StandardScaler
     from sklearn.ensemble import IsolationForest
 
     # Load latest enriched features
     try:
-        df = pd.read_csv("../feature_engineering/outputs/flow_features_enriched.csv")
+        df = flow_store.read_flows(INPUT_FILE)
     except Exception as e:
         print(f"[ERROR] Could not load features: {e}")
         return
@@ -26,8 +29,8 @@ def retrain_model():
     iso_forest = IsolationForest(n_estimators=200, contamination=0.05, random_state=42, n_jobs=-1)
     iso_forest.fit(X_scaled)
 
-    joblib.dump(iso_forest, "../ml/models/isolation_forest.pkl")
-    joblib.dump(scaler, "../ml/models/scaler.pkl")
+    joblib.dump(iso_forest, "ml/models/isolation_forest.pkl")
+    joblib.dump(scaler, "ml/models/scaler.pkl")
     print("[+] Model and scaler retrained and saved.")
 
 if __name__ == "__main__":
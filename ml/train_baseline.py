@@ -1,13 +1,14 @@
-import pandas as pd
 import joblib
 
 from sklearn.preprocessing import StandardScaler
 from sklearn.ensemble import IsolationForest
 
-# -----------------------------
-# Load dataset
-# -----------------------------
-df = pd.read_csv("../feature_engineering/outputs/flow_features_enriched.csv")
+from detection_engine import flow_store, metrics
+
+INPUT_FILE = flow_store.intermediate_path("feature_engineering/outputs/flow_features_enriched.csv")
+RESULTS_FILE = flow_store.intermediate_path("ml/models/iforest_results.csv")
+MODEL_FILE = "ml/models/isolation_forest.pkl"
+SCALER_FILE = "ml/models/scaler.pkl"
 
 FEATURES = [
     "packet_count",
@@ -26,40 +27,87 @@ FEATURES = [
     "dns_entropy"
 ]
 
-X = df[FEATURES]
 
-# -----------------------------
-# Feature Scaling
-# -----------------------------
-scaler = StandardScaler()
-X_scaled = scaler.fit_transform(X)
+def train_and_score(df):
+    """
+    Fit the scaler and Isolation Forest on `df` and score every flow.
+    Returns (a copy of df with iforest_score / iforest_label, model, scaler).
+    """
+    iso_forest, scaler, X_scaled = _fit(df)
+    return _score(df, iso_forest, X_scaled), iso_forest, scaler
+
+
+def fit_model(df):
+    """Fit the scaler and Isolation Forest on `df`; returns (model, scaler)."""
+    iso_forest, scaler, _ = _fit(df)
+    return iso_forest, scaler
+
+
+def apply_model(df, iso_forest, scaler):
+    """A copy of `df` with iforest_score / iforest_label from an already fitted model."""
+    return _score(df, iso_forest, scaler.transform(df[FEATURES]))
+
+
+def _fit(df):
+    X = df[FEATURES]
+
+    # -----------------------------
+    # Feature Scaling
+    # -----------------------------
+    scaler = StandardScaler()
+    X_scaled = scaler.fit_transform(X)
+
+    print("[+] Features scaled successfully")
+
+    # -----------------------------
+    # Train Isolation Forest
+    # -----------------------------
+    iso_forest = IsolationForest(
+        n_estimators=200,
+        contamination=0.05,   # assume 5% anomalies
+        random_state=42,
+        n_jobs=-1
+    )
+
+    with metrics.timer("step_seconds", stage="ml_train_score", step="fit"):
+        iso_forest.fit(X_scaled)
+
+    print("[+] Isolation Forest trained")
+    return iso_forest, scaler, X_scaled
+
+
+def _score(df, iso_forest, X_scaled):
+    # -----------------------------
+    # Generate anomaly scores
+    # -----------------------------
+    with metrics.timer("step_seconds", stage="ml_train_score", step="score"):
+        df = df.assign(
+            iforest_score=iso_forest.decision_function(X_scaled),
+            iforest_label=iso_forest.predict(X_scaled),  # -1 anomaly, 1 normal
+        )
+    metrics.inc("flows_processed_total", len(df), stage="ml_train_score")
+    metrics.inc("anomalies_total", int((df["iforest_label"] == -1).sum()), stage="ml_train_score")
+
+    return df
 
-print("[+] Features scaled successfully")
 
-# -----------------------------
-# Train Isolation Forest
-# -----------------------------
-iso_forest = IsolationForest(
-    n_estimators=200,
-    contamination=0.05,   # assume 5% anomalies
-    random_state=42,
-    n_jobs=-1
-)
+def main():
+    # -----------------------------
+    # Load dataset
+    # -----------------------------
+    df = flow_store.read_flows(INPUT_FILE)
 
-iso_forest.fit(X_scaled)
+    df, iso_forest, scaler = train_and_score(df)
 
-print("[+] Isolation Forest trained")
+    # Save outputs
+    flow_store.write_flows(df, RESULTS_FILE)
 
-# -----------------------------
-# Generate anomaly scores
-# -----------------------------
-df["iforest_score"] = iso_forest.decision_function(X_scaled)
-df["iforest_label"] = iso_forest.predict(X_scaled)  # -1 anomaly, 1 normal
+    joblib.dump(iso_forest, MODEL_FILE)
+    joblib.dump(scaler, SCALER_FILE)
 
-# Save outputs
-df.to_csv("../ml/models/iforest_results.csv", index=False)
+    print("[+] Model, scaler, and results saved")
 
-joblib.dump(iso_forest, "../ml/models/isolation_forest.pkl")
-joblib.dump(scaler, "../ml/models/scaler.pkl")
 
-print("[+] Model, scaler, and results saved")
+if __name__ == "__main__":
+    with metrics.stage("ml_train_score"):
+        main()